@@ -18,309 +18,34 @@ from torchvision.ops import boxes as box_ops
 from torchvision.ops import nms  # BC-compat
 from detectron2.config import get_cfg
 from detectron2.data import DatasetCatalog, MetadataCatalog
-from detectron2.data.datasets import register_coco_instances
+from detectron2.data.datasets import register_rgbt_coco_instances
 from detectron2.structures import Instances, Boxes
 from detectron2.evaluation import FLIREvaluator
+from detectron2.fusion import (
+    FUSION_METHODS,
+    PredictionStore,
+    batched_proben_fusion,
+    evaluate_stream,
+    format_sweep_table,
+    fuse_detections,
+    pad_detections,
+    load_image_sizes,
+    read_prediction_lines,
+    sharded_late_fusion,
+    stream_late_fusion,
+    sweep_late_fusion,
+)
 # For COCO evaluation
 from fvcore.common.file_io import PathManager
 from detectron2.pycocotools.coco import COCO
 from detectron2.pycocotools.cocoeval import COCOeval
 
-def batched_nms(boxes, scores, idxs, iou_threshold):
-    """
-    Same as torchvision.ops.boxes.batched_nms, but safer.
-    """
-    assert boxes.shape[-1] == 4
-    # TODO may need better strategy.
-    # Investigate after having a fully-cuda NMS op.
-    if len(boxes) < 40000:
-        return box_ops.batched_nms(boxes, scores, idxs, iou_threshold)
-
-    result_mask = scores.new_zeros(scores.size(), dtype=torch.bool)
-    for id in torch.unique(idxs).cpu().tolist():
-        mask = (idxs == id).nonzero().view(-1)
-        keep = nms(boxes[mask], scores[mask], iou_threshold)
-        result_mask[mask[keep]] = True
-    keep = result_mask.nonzero().view(-1)
-    keep = keep[scores[keep].argsort(descending=True)]
-    return keep
-
-def avg_bbox_fusion(match_bbox_vec):
-    avg_bboxs = np.sum(match_bbox_vec,axis=0) / len(match_bbox_vec)
-    return avg_bboxs
-
-def bayesian_fusion(match_score_vec):
-    log_positive_scores = np.log(match_score_vec)
-    log_negative_scores = np.log(1 - match_score_vec)
-    fused_positive = np.exp(np.sum(log_positive_scores))
-    fused_negative = np.exp(np.sum(log_negative_scores))
-    fused_positive_normalized = fused_positive / (fused_positive + fused_negative)
-    return fused_positive_normalized
-
-def bayesian_fusion_multiclass(match_score_vec, pred_class):
-    scores = np.zeros((match_score_vec.shape[0], 4))
-    scores[:,:3] = match_score_vec
-    scores[:,-1] = 1 - np.sum(match_score_vec, axis=1)
-    log_scores = np.log(scores)
-    sum_logits = np.sum(log_scores, axis=0)
-    exp_logits = np.exp(sum_logits)
-    out_score = exp_logits[pred_class] / np.sum(exp_logits)
-    return out_score
-
-def bayesian_fusion_multiclass_prior(match_score_vec, pred_class, class_prior):
-    scores = np.zeros((match_score_vec.shape[0], 4))
-    scores[:,:3] = match_score_vec
-    scores[:,-1] = 1 - np.sum(match_score_vec, axis=1)
-    log_scores = np.log(scores)
-    sum_logits = np.sum(log_scores, axis=0) - np.log(class_prior)
-    exp_logits = np.exp(sum_logits)
-    out_score = exp_logits[pred_class] / np.sum(exp_logits)
-    return out_score
-    
-def nms_1(info_1, info_2, info_3=''):
-    # Boxes
-    boxes = info_1['bbox'].copy()
-    boxes.extend(info_2['bbox'])
-    # Scores
-    scores = info_1['score'].copy()
-    scores.extend(info_2['score'])
-    # Classes
-    classes = info_1['class'].copy()
-    classes.extend(info_2['class'])
-    if info_3:
-        boxes.extend(info_3['bbox'])
-        scores.extend(info_3['score'])
-        classes.extend(info_3['class'])
-    
-    classes = torch.Tensor(classes)
-    scores = torch.Tensor(scores)
-    boxes = torch.Tensor(boxes)
-    # Perform nms
-    iou_threshold = 0.5
-    keep_id = batched_nms(boxes, scores, classes, iou_threshold)
-
-    # Add to output
-    out_boxes = boxes[keep_id]
-    out_scores = torch.Tensor(scores[keep_id])
-    out_class = torch.Tensor(classes[keep_id])
-    
-    return out_boxes, out_scores, out_class
-
-def weighted_box_fusion(bbox, score):
-    weight = score / np.sum(score)
-    out_bbox = np.zeros(4)
-    for i in range(len(score)):
-        out_bbox += weight[i] * bbox[i]
-    return out_bbox
-
-def prepare_data(info1, info2, info3=''):
-    bbox1 = np.array(info1['bbox'])
-    bbox2 = np.array(info2['bbox'])
-    score1 = np.array(info1['score'])
-    score2 = np.array(info2['score'])
-    class1 = np.array(info1['class'])
-    class2 = np.array(info2['class'])
-    out_logits = {}
-    out_logits['1'] = np.array(info1['class_logits'])
-    out_logits['2'] = np.array(info2['class_logits'])
-    out_bbox = np.concatenate((bbox1, bbox2), axis=0)
-    out_score = np.concatenate((score1, score2), axis=0)
-    out_class = np.concatenate((class1, class2), axis=0)
-    
-    # If more than two detections are fused
-    if info3:
-        bbox3 = np.array(info3['bbox'])
-        score3 = np.array(info3['score'])
-        class3 = np.array(info3['class'])
-        out_logits['3'] = np.array(info3['class_logits'])
-        out_bbox = np.concatenate((out_bbox, bbox3), axis=0)
-        out_score = np.concatenate((out_score, score3), axis=0)
-        out_class = np.concatenate((out_class, class3), axis=0)
-    
-    if 'prob' in info1.keys():
-        prob1 = np.array(info1['prob'])
-        prob2 = np.array(info2['prob'])  
-        out_prob = np.concatenate((prob1, prob2), axis=0)
-        if info3:
-            prob3 = np.array(info3['prob'])  
-            out_prob = np.concatenate((out_prob, prob3), axis=0)
-        return out_bbox, out_score, out_class, out_logits, out_prob
-    else:    
-        return out_bbox, out_score, out_class, out_logits
-
-def nms_bayesian(dets, scores, classes, probs, thresh, method):
-    x1 = dets[:, 0] + classes * 640
-    y1 = dets[:, 1] + classes * 512
-    x2 = dets[:, 2] + classes * 640
-    y2 = dets[:, 3] + classes * 512
-    
-    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
-    
-    keep = []
-    match_scores = []
-    match_bboxs = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1 + 1)
-        h = np.maximum(0.0, yy2 - yy1 + 1)
-        inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-        
-        inds = np.where(ovr <= thresh)[0]
-        match = np.where(ovr > thresh)[0]
-        match_ind = order[match+1]
-        
-        match_prob = list(probs[match_ind])
-        match_score = list(scores[match_ind])
-        match_bbox = list(dets[match_ind][:,:4])
-        original_prob = probs[i]
-        original_score = scores[i].tolist()
-        original_bbox = dets[i][:4]
-        
-        # If some boxes are matched
-        if len(match_score)>0:
-            match_score += [original_score]
-            match_prob += [original_prob]
-            # Try with different fusion methods
-            if method == 'avg_score':
-                final_score = np.mean(np.asarray(match_score))
-                final_bbox = avg_bbox_fusion(match_bbox)
-            elif method == 'bayesian':
-                final_score = bayesian_fusion_multiclass(np.asarray(match_prob), classes[i])
-                final_bbox = avg_bbox_fusion(match_bbox)
-            elif method == 'baysian_avg_bbox':
-                final_score = bayesian_fusion_multiclass(np.asarray(match_prob), classes[i])                
-                match_bbox += [original_bbox]
-                final_bbox = avg_bbox_fusion(match_bbox)
-            elif method == 'bayesian_wt_score_box':
-                final_score = bayesian_fusion_multiclass(np.asarray(match_prob), classes[i])                
-                match_bbox += [original_bbox]
-                final_bbox = weighted_box_fusion(match_bbox, match_score)            
-            elif method == 'bayesian_prior_wt_score_box':
-                """
-                This method is to set different ratios o priors to test how serious priors affect the overall performance (See supplements.)
-                """
-                p4person = 4
-                class_prior = [p4person,1,1,1]
-                class_prior /= np.sum(class_prior)
-                final_score = bayesian_fusion_multiclass_prior(np.asarray(match_prob), classes[i], class_prior)                
-                match_bbox += [original_bbox]
-                final_bbox = weighted_box_fusion(match_bbox, match_score)
-            
-            match_scores.append(final_score)
-            match_bboxs.append(final_bbox)
-        else:
-            match_scores.append(original_score)
-            match_bboxs.append(original_bbox)
-
-        order = order[inds + 1]
-        
-    assert len(keep)==len(match_scores)
-    assert len(keep)==len(match_bboxs)
-
-    match_bboxs = match_bboxs
-    match_scores = torch.Tensor(match_scores)
-    match_classes = torch.Tensor(classes[keep])
-
-    return keep,match_scores,match_bboxs, match_classes
-
-def handle_logits(logits, classes):
-    logits1 = logits['1']
-    logits2 = logits['2']
-    out_logits = np.concatenate((logits1, logits2), axis=0)
-    if '3' in logits.keys():
-        logits3 = logits['3']
-        out_logits = np.concatenate((out_logits, logits3), axis=0)
-    return out_logits
-
-def nms_logits(dets, scores, classes, logits, thresh, method):
-    x1 = dets[:, 0] + classes * 640
-    y1 = dets[:, 1] + classes * 512
-    x2 = dets[:, 2] + classes * 640
-    y2 = dets[:, 3] + classes * 512
-    
-    out_logits = handle_logits(logits, classes)
-    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    
-    order = scores.argsort()[::-1]
-    keep = []
-    match_scores = []
-    match_bboxs = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1 + 1)
-        h = np.maximum(0.0, yy2 - yy1 + 1)
-        inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-        
-        inds = np.where(ovr <= thresh)[0]
-        match = np.where(ovr > thresh)[0]
-        match_ind = order[match+1]
-
-        match_score = list(out_logits[match_ind])
-        match_bbox = list(dets[match_ind][:,:4])
-        original_score = out_logits[i].tolist()        
-        original_bbox = dets[i][:4]
-        if len(match_score)>0:
-            match_score += [original_score]
-            if method == 'avgLogits_softmax':  
-                final_score = np.mean(np.asarray(match_score), axis=0)
-                final_score = F.softmax(torch.Tensor(final_score), dim=0)[classes[i]].tolist()
-                final_bbox = avg_bbox_fusion(match_bbox)
-            elif method == 'sumLogits_softmax':
-                final_score = np.sum(np.asarray(match_score), axis=0)
-                final_score = F.softmax(torch.Tensor(final_score), dim=0)[classes[i]].tolist()
-                final_bbox = avg_bbox_fusion(match_bbox)
-    
-            match_scores.append(final_score)
-            match_bboxs.append(final_bbox)
-        else:
-            final_score = F.softmax(torch.Tensor(original_score), dim=0)[classes[i]].tolist()
-            match_scores.append(final_score)
-            match_bboxs.append(original_bbox)
-            
-        order = order[inds + 1]
-        
-    assert len(keep)==len(match_scores)
-    assert len(keep)==len(match_bboxs)
-
-    match_bboxs = match_bboxs
-    match_scores = torch.Tensor(match_scores)
-    match_classes = torch.Tensor(classes[keep])
-    return keep,match_scores,match_bboxs, match_classes
-
-def fusion(method, info_1, info_2, info_3=''):
-    if method == 'nms':            
-        out_boxes, out_scores, out_class = nms_1(info_1, info_2, info_3=info_3)
-    elif method == 'pooling':
-        in_boxes, in_scores, in_class, in_logits, in_prob = prepare_data(info_1, info_2, info3=info_3)
-        out_boxes = in_boxes
-        out_scores = torch.Tensor(in_scores)
-        out_class = torch.Tensor(in_class)
-    elif method == 'bayesian' or method == 'baysian_avg_bbox' or method == 'avg_score' or method == 'bayesian_wt_score_box' or method == 'bayesian_prior_wt_score_box':
-        threshold = 0.5
-        in_boxes, in_scores, in_class, in_logits, in_prob = prepare_data(info_1, info_2, info3=info_3)
-        keep, out_scores, out_boxes, out_class = nms_bayesian(in_boxes, in_scores, in_class, in_prob, threshold, method)
-    elif method == 'avgLogits_softmax' or method == 'sumLogits_softmax':
-        threshold = 0.5
-        in_boxes, in_scores, in_class, in_logits, _ = prepare_data(info_1, info_2, info3=info_3)
-        keep, out_scores, out_boxes, out_class = nms_logits(in_boxes, in_scores, in_class, in_logits, threshold, method)
-    return out_boxes, out_scores, out_class
+"""
+This method is to set different ratios o priors to test how serious priors affect the overall performance (See supplements.)
+Used by 'bayesian_prior_wt_score_box'.
+"""
+p4person = 4
+LEGACY_CLASS_PRIOR = np.array([p4person,1,1,1]) / (p4person + 3)
 
 def draw_box(img, bbox, pred_class, color):
     class_name = ['person', 'bike', 'car']
@@ -340,129 +65,99 @@ def draw_box(img, bbox, pred_class, color):
         img = cv2.putText(img, class_name[int(pred_class[i])], (min_x, min_y), font, fontScale, color2, 2, cv2.LINE_AA)
     return img
 
-def apply_late_fusion_and_evaluate(cfg, evaluator, det_1, det_2, method, det_3=''):
-    evaluator.reset()
-    img_folder = '../../../Datasets/FLIR/val/thermal_8_bit/'
-    
-    num_img = len(det_2['image'])
-    count_1=0
-    count_2=0
-    count_fusion=0
-
+def apply_late_fusion_and_evaluate(cfg, evaluator, dets, method, image_sizes, weights=None, num_workers=4):
+    """
+    Fuse the detections of any number of models image by image, and evaluate them.
+    dets is a list with the loaded prediction file of each model. The images are
+    split into shards that are fused in parallel worker processes, and the image
+    sizes are read from the annotation file instead of decoding the images.
+    """
     print('Method: ', method)
 
-    for i in range(num_img):
-        info_1 = {}
-        info_1['img_name'] = det_1['image'][i]
-        info_1['bbox'] = det_1['boxes'][i]
-        info_1['score'] = det_1['scores'][i]
-        info_1['class'] = det_1['classes'][i]
-        info_1['class_logits'] = det_1['class_logits'][i]
-        if 'probs' in det_1.keys():
-            info_1['prob'] = det_1['probs'][i]
+    class_prior = None
+    if method == 'bayesian_prior_wt_score_box':
+        class_prior = LEGACY_CLASS_PRIOR
 
-        info_2 = {}
-        info_2['img_name'] = det_2['image'][i].split('.')[0] + '.jpeg'
-        info_2['bbox'] = det_2['boxes'][i]
-        info_2['score'] = det_2['scores'][i]
-        info_2['class'] = det_2['classes'][i]
-        info_2['class_logits'] = det_2['class_logits'][i]
-        if 'probs' in det_2.keys():
-            info_2['prob'] = det_2['probs'][i]
-        
-        if len(info_1['bbox']) > 0:
-            num_1 = 1
-        else:
-            num_1 = 0
-        if len(info_2['bbox']) > 0:
-            num_2 = 1
-        else:
-            num_2 = 0
-        
-        num_detections = num_1 + num_2
+    return sharded_late_fusion(dets, evaluator, image_sizes, weights=weights, method=method, iou_threshold=0.5, class_prior=class_prior, num_workers=num_workers, evaluate_kwargs={'out_eval_path': 'FLIR_pooling_.out'})
 
-        if det_3:
-            info_3 = {}
-            info_3['img_name'] = det_3['image'][i].split('.')[0] + '.jpeg'
-            info_3['bbox'] = det_3['boxes'][i]
-            info_3['score'] = det_3['scores'][i]
-            info_3['class'] = det_3['classes'][i]
-            info_3['class_logits'] = det_3['class_logits'][i]
-            if 'probs' in det_3.keys():
-                info_3['prob'] = det_3['probs'][i]
-            if len(info_3['bbox']) > 0:
-                num_3 = 1
-            else:
-                num_3 = 0
 
-            num_detections += num_3
-        
-        # No detections
-        if num_detections == 0:
-            continue
-        # Only 1 model detection
-        elif num_detections == 1:            
-            if len(info_1['bbox']) > 0:
-                out_boxes = np.array(info_1['bbox'])
-                out_class = torch.Tensor(info_1['class'])
-                out_scores = torch.Tensor(info_1['score'])
-            elif len(info_2['bbox']) > 0:
-                out_boxes = np.array(info_2['bbox'])
-                out_class = torch.Tensor(info_2['class'])
-                out_scores = torch.Tensor(info_2['score'])
-            else:
-                if det_3:
-                    out_boxes = np.array(info_3['bbox'])
-                    out_class = torch.Tensor(info_3['class'])
-                    out_scores = torch.Tensor(info_3['score'])
-        # Only two models with detections
-        elif num_detections == 2:
-            if not det_3:
-                out_boxes, out_scores, out_class = fusion(method, info_1, info_2)
-            else:    
-                if len(info_1['bbox']) == 0:
-                    out_boxes, out_scores, out_class = fusion(method, info_2, info_3)
-                elif len(info_2['bbox']) == 0:
-                    out_boxes, out_scores, out_class = fusion(method, info_1, info_3)
-                else:
-                    out_boxes, out_scores, out_class = fusion(method, info_1, info_2)
-        # All models detected things
-        else:
-            out_boxes, out_scores, out_class = fusion(method, info_1, info_2, info_3=info_3)
-            
-        file_name = img_folder + info_1['img_name'].split('.')[0] + '.jpeg'
-        img = cv2.imread(file_name)
-        H, W, _ = img.shape
+def apply_batched_late_fusion_and_evaluate(cfg, evaluator, dets, method, image_sizes, image_files, weights=None):
+    """
+    Same as apply_late_fusion_and_evaluate, but fuses the detections of all images
+    in one call of batched_proben_fusion. Only supports the ProbEn methods in FUSION_METHODS.
+    """
+    evaluator.reset()
+    print('Method: ', method)
 
-        # Handle inputs
-        inputs = []
+    detections = []
+    for det in dets:
+        detections.append(pad_detections(det['boxes'], det['scores'], det['classes'], probs=det.get('probs'), logits=det['class_logits']))
+    
+    # Images without any detection are skipped
+    has_detections = sum(d['valid'].any(dim=1) for d in detections) > 0
+    img_ids = has_detections.nonzero()[:, 0].tolist()
+    detections = [{k: v[img_ids] for k, v in d.items()} for d in detections]
+
+    inputs = []
+    for i in img_ids:
+        file_name = image_files[dets[0]['image_id'][i]]
+        H, W = image_sizes[dets[0]['image_id'][i]]
         input_info = {}
         input_info['file_name'] = file_name
         input_info['height'] = H
         input_info['width'] = W
-        input_info['image_id'] = det_2['image_id'][i]
-        input_info['image'] = torch.Tensor(img)
+        input_info['image_id'] = dets[0]['image_id'][i]
         inputs.append(input_info)
-        
-        # Handle outputs
-        outputs = []
-        out_info = {}
-        proposals = Instances([H, W])
-        proposals.pred_boxes = Boxes(out_boxes)
-        proposals.scores = out_scores
-        proposals.pred_classes = out_class
-        out_info['instances'] = proposals
-        outputs.append(out_info)
-        evaluator.process(inputs, outputs)
-                        
+
+    instances = batched_proben_fusion(detections, [(x['height'], x['width']) for x in inputs], weights=weights, method=method, iou_threshold=0.5, class_prior=LEGACY_CLASS_PRIOR)
+    outputs = [{'instances': x} for x in instances]
+    evaluator.process(inputs, outputs)
     results = evaluator.evaluate(out_eval_path='FLIR_pooling_.out')
-    
+
     if results is None:
         results = {}
 
     return results
 
 
+def apply_streaming_late_fusion_and_evaluate(cfg, evaluator, det_files, method, weights=None):
+    """
+    Same as apply_late_fusion_and_evaluate, but reads the line-delimited prediction
+    files (.jsonl) or prediction stores (directories) of the models image by image,
+    so memory does not grow with the split.
+    """
+    print('Method: ', method)
+    streams = [PredictionStore(det_file) if os.path.isdir(det_file) else read_prediction_lines(det_file) for det_file in det_files]
+    stream = stream_late_fusion(streams, weights=weights, method=method, iou_threshold=0.5, class_prior=LEGACY_CLASS_PRIOR)
+    return evaluate_stream(evaluator, stream, evaluate_kwargs={'out_eval_path': 'FLIR_pooling_.out'})
+
+
+def apply_fusion_sweep(cfg, evaluator, dets, image_sizes, image_files, methods, iou_thresholds, class_priors, num_workers=4):
+    """
+    Evaluate every fusion method, IoU threshold and class prior on the loaded prediction
+    files of the models. The detections are clustered once per IoU threshold, and the
+    combinations are fused and evaluated in worker processes.
+    """
+    detections = []
+    for det in dets:
+        detections.append(pad_detections(det['boxes'], det['scores'], det['classes'], probs=det.get('probs'), logits=det['class_logits']))
+
+    # Images without any detection are skipped
+    has_detections = sum(d['valid'].any(dim=1) for d in detections) > 0
+    img_ids = has_detections.nonzero()[:, 0].tolist()
+    detections = [{k: v[img_ids] for k, v in d.items()} for d in detections]
+
+    inputs = []
+    for i in img_ids:
+        file_name = image_files[dets[0]['image_id'][i]]
+        H, W = image_sizes[dets[0]['image_id'][i]]
+        inputs.append({'file_name': file_name, 'height': H, 'width': W, 'image_id': dets[0]['image_id'][i]})
+
+    results = sweep_late_fusion(detections, inputs, evaluator, methods=methods, iou_thresholds=iou_thresholds, class_priors=class_priors, num_workers=num_workers)
+    print(format_sweep_table(results))
+    return results
+
+
 if __name__ == '__main__':
     data_set = 'val'
     data_folder = 'out/box_predictions/'
@@ -505,7 +200,7 @@ if __name__ == '__main__':
 
     # Register dataset
     dataset = 'FLIR_val'
-    register_coco_instances(dataset, {}, val_json_path, val_folder)
+    register_rgbt_coco_instances(dataset, {}, val_json_path, val_folder, pairing='FLIR')
     FLIR_metadata = MetadataCatalog.get(dataset)
     dataset_dicts = DatasetCatalog.get(dataset)
 
@@ -520,10 +215,6 @@ if __name__ == '__main__':
     cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675]
     cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0]
 
-    # Read detection results
-    det_1 = json.load(open(det_file_1, 'r'))
-    det_2 = json.load(open(det_file_2, 'r'))
-    det_3 = json.load(open(det_file_3, 'r'))
     evaluator = FLIREvaluator(dataset, cfg, False, output_dir=out_folder, save_eval=True, out_eval_path='out/mAP/FLIR_Baysian_'+data_set+'_avg_box_all.out')
     """
     
@@ -539,4 +230,27 @@ if __name__ == '__main__':
                   'nms'
     """
     method = 'baysian_avg_bbox'
-    result = apply_late_fusion_and_evaluate(cfg, evaluator, det_1, det_2, method, det_3=det_3)
+    # Set to True to compare all methods, IoU thresholds and person priors in one run
+    sweep = False
+    # Any number of models can be fused, optionally with one weight per model
+    det_files = [det_file_1, det_file_2, det_file_3]
+    weights = None
+    # Image sizes are read from the annotations, instead of decoding the images
+    image_sizes = load_image_sizes(val_json_path)
+    image_files = {d['image_id']: d['thermal_file_name'] for d in dataset_dicts}
+    if sweep:
+        dets = [json.load(open(det_file, 'r')) for det_file in det_files]
+        class_priors = {'person x{}'.format(p): np.array([p,1,1,1]) / (p + 3) for p in [1, 2, 4, 8]}
+        # Every combination is evaluated by its own evaluator, which must not write the eval files
+        sweep_evaluator = FLIREvaluator(dataset, cfg, False)
+        result = apply_fusion_sweep(cfg, sweep_evaluator, dets, image_sizes, image_files, ['nms', 'pooling'] + list(FUSION_METHODS), [0.5, 0.6, 0.7], class_priors)
+    elif all(det_file.endswith('.jsonl') or os.path.isdir(det_file) for det_file in det_files):
+        # Line-delimited predictions and prediction stores are fused and evaluated as a stream
+        result = apply_streaming_late_fusion_and_evaluate(cfg, evaluator, det_files, method, weights=weights)
+    else:
+        # Read detection results
+        dets = [json.load(open(det_file, 'r')) for det_file in det_files]
+        if method in FUSION_METHODS:
+            result = apply_batched_late_fusion_and_evaluate(cfg, evaluator, dets, method, image_sizes, image_files, weights=weights)
+        else:
+            result = apply_late_fusion_and_evaluate(cfg, evaluator, dets, method, image_sizes, weights=weights)
@@ -48,7 +48,7 @@ val_json_path = '../../../Datasets/'+dataset+'/val/thermal_RGBT_pairs_3_class.js
 """
 # Register dataset
 dataset = 'FLIR_train'
-register_coco_instances(dataset, {}, train_json_path, train_folder)
+register_coco_instances(dataset, {}, train_json_path, train_folder, cache=True)
 FLIR_metadata = MetadataCatalog.get(dataset)
 dataset_dicts = DatasetCatalog.get(dataset)
 """
@@ -76,7 +76,7 @@ cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0]
 
 # Test on validation set
 dataset_test = 'FLIR_val'
-register_coco_instances(dataset_test, {}, val_json_path, val_folder)
+register_coco_instances(dataset_test, {}, val_json_path, val_folder, cache=True)
 FLIR_metadata_test = MetadataCatalog.get(dataset_test)
 dataset_dicts_test = DatasetCatalog.get(dataset_test)
 file_name = 'FLIR_thermal_only_3_class.out'
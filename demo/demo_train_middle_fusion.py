@@ -3,7 +3,7 @@ from detectron2.engine import DefaultPredictor, DefaultTrainer
 from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import DatasetCatalog, MetadataCatalog
-from detectron2.data.datasets import register_coco_instances
+from detectron2.data.datasets import register_rgbt_coco_instances
 from detectron2.evaluation import FLIREvaluator, inference_on_dataset
 from detectron2.data import build_detection_test_loader
 from tools.plain_train_net import do_test
@@ -45,13 +45,13 @@ print(train_json_path)
 
 # Register dataset
 dataset_train = 'FLIR_train'
-register_coco_instances(dataset_train, {}, train_json_path, train_folder)
+register_rgbt_coco_instances(dataset_train, {}, train_json_path, train_folder, pairing='FLIR')
 FLIR_metadata_train = MetadataCatalog.get(dataset_train)
 dataset_dicts_train = DatasetCatalog.get(dataset_train)
 
 # Test on validation set
 dataset_test = 'FLIR_val'
-register_coco_instances(dataset_test, {}, val_json_path, val_folder)
+register_rgbt_coco_instances(dataset_test, {}, val_json_path, val_folder, pairing='FLIR')
 FLIR_metadata_test = MetadataCatalog.get(dataset_test)
 dataset_dicts_test = DatasetCatalog.get(dataset_test)
 
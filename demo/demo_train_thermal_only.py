@@ -46,13 +46,13 @@ print(train_json_path)
 
 # Register dataset
 dataset_train = 'FLIR_train'
-register_coco_instances(dataset_train, {}, train_json_path, train_folder)
+register_coco_instances(dataset_train, {}, train_json_path, train_folder, cache=True)
 FLIR_metadata_train = MetadataCatalog.get(dataset_train)
 dataset_dicts_train = DatasetCatalog.get(dataset_train)
 
 # Test on validation set
 dataset_test = 'FLIR_val'
-register_coco_instances(dataset_test, {}, val_json_path, val_folder)
+register_coco_instances(dataset_test, {}, val_json_path, val_folder, cache=True)
 FLIR_metadata_test = MetadataCatalog.get(dataset_test)
 dataset_dicts_test = DatasetCatalog.get(dataset_test)
 
@@ -1,8 +1,15 @@
 # import some common detectron2 utilities
-from detectron2.engine import DefaultPredictor
+from detectron2.engine import BatchPredictor
 from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
-from detectron2.data import MetadataCatalog
+from detectron2.data import MetadataCatalog, add_rgbt_file_names
+from detectron2.data.datasets import load_coco_json
+from detectron2.fusion import (
+    PredictionStoreWriter,
+    multi_predictor_stream,
+    read_image_pair,
+    write_prediction_line,
+)
 from os import listdir
 from os.path import isfile, join
 import numpy as np
@@ -14,13 +21,14 @@ import json
 # get dataset path
 dataset_name = 'FLIR'
 data_set = 'val'
-RGB_path = '../../../Datasets/'+ dataset_name +'/'+data_set+'/RGB/'
-t_path = '../../../Datasets/'+ dataset_name +'/'+data_set+'/thermal_8_bit/'
+data_folder = '../../../Datasets/'+ dataset_name +'/'+data_set+'/'
 
 ###########################################
 """
 
-Choose the model to generate predictions:
+Choose the models to generate predictions. All of them run in a single pass
+over the split: every RGB-thermal pair is decoded once and the input of each
+model is built from the same buffers.
 
 'RGB'
 'thermal_only'
@@ -28,136 +36,107 @@ Choose the model to generate predictions:
 'mid_fusion'
 
 """
-data_gen = 'mid_fusion'
-print('model:', data_gen)
+data_gens = ['RGB', 'thermal_only', 'early_fusion', 'mid_fusion']
+print('models:', data_gens)
+"""
+Output format:
+'json': one JSON file with the predictions of the whole split
+'jsonl': one line per image, written as soon as the image is predicted.
+         Can be fused as a stream by demo_bayesian_fusion.py.
+'store': a directory with the memory-mapped columns of all predictions and a
+         per-image index, see detectron2.fusion.PredictionStore.
+"""
+out_format = 'json'
+# Number of images in one forward of each model
+batch_size = 4
 ###########################################
 
-# Build image id dictionary
+# Dataset dicts with the paired RGB and thermal file names of every image
 val_file_name = 'thermal_RGBT_pairs_3_class.json'
-val_json_path = '../../../Datasets/FLIR/'+data_set+'/' + val_file_name
-data = json.load(open(val_json_path, 'r'))
-name_to_id_dict = {}
-for i in range(len(data['images'])):
-    file_name = data['images'][i]['file_name'].split('/')[1].split('.')[0]
-    name_to_id_dict[file_name] = data['images'][i]['id']
+val_json_path = data_folder + val_file_name
+dataset_dicts = add_rgbt_file_names(load_coco_json(val_json_path, data_folder), dataset_name)
 
-# File names
-files_names = [f for f in listdir(RGB_path) if isfile(join(RGB_path, f))]
 out_folder = 'out/box_predictions/'
 # Make folder if not exists
 if not os.path.exists(out_folder):
     os.mkdir(out_folder)
 
-cfg = get_cfg()
-cfg.merge_from_file("./configs/COCO-Detection/faster_rcnn_R_101_FPN_3x.yaml")
-cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
-cfg.MODEL.ROI_BOX_HEAD.OUTPUT_LOGITS = True
-
-if data_gen == 'RGB':
-    cfg.MODEL.WEIGHTS = "detectron2://COCO-Detection/faster_rcnn_R_101_FPN_3x/137851257/model_final_f6e8b1.pkl"
-    cfg.MODEL.ROI_HEADS.NUM_CLASSES = 80
-elif data_gen == 'thermal_only':
-    cfg.MODEL.WEIGHTS = '../Bayesian_release/good_model/thermal_only/out_model_iter_15000.pth'#out_model_iter_15000.pth'
-    cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
-elif data_gen == 'early_fusion':
-    cfg.MODEL.WEIGHTS = 'good_model/early_fusion/out_model_iter_12000.pth'
-    cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
-    cfg.INPUT.FORMAT = 'BGRT'
-    cfg.INPUT.NUM_IN_CHANNELS = 4
-    cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675, 135.438]
-    cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0, 1.0]
-elif data_gen == 'mid_fusion':
-    cfg.MODEL.WEIGHTS = 'good_model/mid_fusion/out_model_iter_42000.pth'
-    cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
-    cfg.INPUT.FORMAT = 'BGRTTT'
-    cfg.INPUT.NUM_IN_CHANNELS = 6
-    cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675, 135.438, 135.438, 135.438]
-    cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+def get_model_cfg(data_gen):
+    cfg = get_cfg()
+    cfg.merge_from_file("./configs/COCO-Detection/faster_rcnn_R_101_FPN_3x.yaml")
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
+    cfg.MODEL.ROI_BOX_HEAD.OUTPUT_LOGITS = True
 
-# Create predictor
-predictor = DefaultPredictor(cfg)
-
-valid_class = [0, 1, 2]
-out_pred_file = out_folder+data_set+'_'+data_gen+'_predictions_IOU50_with_logits_with_multiclass_prob_score_test_0615.json'
-print('out file:', out_pred_file)
-out_dicts = {}
-image_dict = []
-boxes_dict = []
-scores_dict = []
-classes_dict = []
-class_logits_dict = []
-prob_dict = []
-img_id_dict = []
-    
-for i in range(len(files_names)):
-    # get image
-    RGB_file = RGB_path + files_names[i]
-    thermal_file = t_path + files_names[i].split('.')[0]+'.jpeg'
-    print('id: ', i)
-    input_file = None
     if data_gen == 'RGB':
-        input_file = RGB_file
-        img = cv2.imread(input_file)
+        cfg.MODEL.WEIGHTS = "detectron2://COCO-Detection/faster_rcnn_R_101_FPN_3x/137851257/model_final_f6e8b1.pkl"
+        cfg.MODEL.ROI_HEADS.NUM_CLASSES = 80
     elif data_gen == 'thermal_only':
-        input_file = thermal_file
-        img = cv2.imread(input_file)
+        cfg.MODEL.WEIGHTS = '../Bayesian_release/good_model/thermal_only/out_model_iter_15000.pth'#out_model_iter_15000.pth'
+        cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
     elif data_gen == 'early_fusion':
-        input_file_thermal = thermal_file
-        thermal_img = cv2.imread(input_file_thermal)
-        input_file_RGB = RGB_file
-        rgb_img = cv2.imread(input_file_RGB)
-        rgb_img = cv2.resize(rgb_img, (thermal_img.shape[1],thermal_img.shape[0]), cv2.INTER_CUBIC)
-        img = np.zeros((thermal_img.shape[0], thermal_img.shape[1], 4))
-        img [:,:,0:3] = rgb_img
-        img [:,:,-1] = thermal_img[:,:,0]
+        cfg.MODEL.WEIGHTS = 'good_model/early_fusion/out_model_iter_12000.pth'
+        cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
+        cfg.INPUT.FORMAT = 'BGRT'
+        cfg.INPUT.NUM_IN_CHANNELS = 4
+        cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675, 135.438]
+        cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0, 1.0]
     elif data_gen == 'mid_fusion':
-        input_file_thermal = thermal_file
-        thermal_img = cv2.imread(input_file_thermal)
-        input_file_RGB = RGB_file
-        rgb_img = cv2.imread(input_file_RGB)
-        rgb_img = cv2.resize(rgb_img, (thermal_img.shape[1],thermal_img.shape[0]), cv2.INTER_CUBIC)
-        img = np.zeros((thermal_img.shape[0], thermal_img.shape[1], 6))
-        img [:,:,0:3] = rgb_img
-        img [:,:,3:6] = thermal_img
-    
-    # Make prediction
-    predict = predictor(img)
-    predictions = predict['instances'].to('cpu')
-    boxes = predictions.pred_boxes.tensor.tolist() if predictions.has("pred_boxes") else None
-    scores = predictions.scores.tolist() if predictions.has("scores") else None
-    classes = predictions.pred_classes.tolist() if predictions.has("pred_classes") else None
-    class_logits = predictions.class_logits.tolist() if predictions.has("class_logits") else None
-    probs = predictions.prob_score.tolist() if predictions.has("prob_score") else None
-    out_boxes = []
-    out_scores = []
-    out_classes = []
-    out_logits = []
-    out_probs = []
-    
-    for j in range(len(boxes)):
-        if classes[j] <= 2:
-            out_boxes.append(boxes[j])
-            out_scores.append(scores[j])
-            out_classes.append(classes[j])
-            out_logits.append(class_logits[j])
-            out_probs.append(probs[j])
+        cfg.MODEL.WEIGHTS = 'good_model/mid_fusion/out_model_iter_42000.pth'
+        cfg.MODEL.ROI_HEADS.NUM_CLASSES = 3
+        cfg.INPUT.FORMAT = 'BGRTTT'
+        cfg.INPUT.NUM_IN_CHANNELS = 6
+        cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675, 135.438, 135.438, 135.438]
+        cfg.MODEL.PIXEL_STD = [1.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+    return cfg
+
+def read_frames():
+    # Decode each RGB-thermal pair once, for all models
+    for i, d in enumerate(dataset_dicts):
+        print('id: ', i)
+        frame = read_image_pair(d['rgb_file_name'], d['thermal_file_name'])
+        yield frame, d['image_id'], os.path.basename(d['rgb_file_name'])
+
+# Create predictors. The name of each model is also the input it is run on.
+predictors = {data_gen: (data_gen, BatchPredictor(get_model_cfg(data_gen), batch_size=batch_size)) for data_gen in data_gens}
+
+valid_class = [0, 1, 2]
+out_pred_files = {}
+for data_gen in data_gens:
+    out_pred_file = out_folder+data_set+'_'+data_gen+'_predictions_IOU50_with_logits_with_multiclass_prob_score_test_0615'
+    if out_format != 'store':
+        out_pred_file += '.' + out_format
+    print('out file:', out_pred_file)
+    out_pred_files[data_gen] = out_pred_file
+if out_format == 'jsonl':
+    out_lines = {k: open(v, 'w') for k, v in out_pred_files.items()}
+elif out_format == 'store':
+    store_writers = {k: PredictionStoreWriter(v) for k, v in out_pred_files.items()}
+out_dicts = {data_gen: {k: [] for k in ['image', 'boxes', 'scores', 'classes', 'image_id', 'class_logits', 'probs']} for data_gen in data_gens}
 
-    image_dict.append(files_names[i])
-    boxes_dict.append(out_boxes)
-    scores_dict.append(out_scores)
-    classes_dict.append(out_classes)
-    class_logits_dict.append(out_logits)
-    prob_dict.append(out_probs)    
-    img_id_dict.append(name_to_id_dict[files_names[i].split('.')[0]])
+for records in multi_predictor_stream(predictors, read_frames(), batch_size=batch_size):
+    for data_gen, record in records.items():
+        # Only keep the classes of FLIR
+        keep = [j for j in range(len(record['classes'])) if record['classes'][j] <= 2]
+        for k in ['boxes', 'scores', 'classes', 'class_logits', 'probs']:
+            if k in record:
+                record[k] = [record[k][j] for j in keep]
 
-out_dicts['image'] = image_dict
-out_dicts['boxes'] = boxes_dict
-out_dicts['scores'] = scores_dict
-out_dicts['classes'] = classes_dict
-out_dicts['image_id'] = img_id_dict
-out_dicts['class_logits'] = class_logits_dict
-out_dicts['probs'] = prob_dict
+        if out_format == 'jsonl':
+            write_prediction_line(out_lines[data_gen], record)
+        elif out_format == 'store':
+            store_writers[data_gen].add(record)
+        else:
+            for k, v in out_dicts[data_gen].items():
+                v.append(record.get(k))
 
-with open(out_pred_file, 'w') as outfile:
-    json.dump(out_dicts, outfile, indent=2)
-    print('Finish predictions!')
+for data_gen in data_gens:
+    if out_format == 'jsonl':
+        out_lines[data_gen].close()
+    elif out_format == 'store':
+        store_writers[data_gen].close()
+    else:
+        with open(out_pred_files[data_gen], 'w') as outfile:
+            json.dump(out_dicts[data_gen], outfile, indent=2)
+for _, predictor in predictors.values():
+    predictor.close()
+print('Finish predictions!')
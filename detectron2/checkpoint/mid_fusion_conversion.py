@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import logging
+
+__all__ = ["convert_concat_fusion_weights"]
+
+# The layers that read the fused features, whose input channels are the concatenated
+# RGB and thermal channels in a "ConcatFusion" model
+_FUSED_FEATURE_INPUTS = (
+    "proposal_generator.rpn_head.conv.weight",
+    "roi_heads.box_head.conv1.weight",
+    "roi_heads.box_head.fc1.weight",
+    "roi_heads.mask_head.mask_fcn1.weight",
+    "roi_heads.keypoint_head.conv_fcn1.weight",
+)
+
+_TWO_STREAM_PREFIXES = ("backbone.rgb.", "backbone.thermal.")
+
+_RPN_HEAD = "proposal_generator.rpn_head."
+
+
+def _select_rpn_hidden_channels(weights, model_state_dict):
+    """
+    The hidden layer of :class:`StandardRPNHead` is as wide as its input, so it is
+    narrower in the new model. Keep the hidden channels with the largest weights in
+    the objectness and box delta predictors, consistently in the 3x3 conv and in the
+    predictors.
+
+    Returns:
+        dict[str->Tensor]: the legacy weights, with the reduced RPN head.
+    """
+    conv_key = _RPN_HEAD + "conv.weight"
+    if conv_key not in weights or conv_key not in model_state_dict:
+        return weights
+    num_hidden = model_state_dict[conv_key].shape[0]
+    if weights[conv_key].shape[0] <= num_hidden:
+        return weights
+    predictors = [_RPN_HEAD + k for k in ("objectness_logits", "anchor_deltas")]
+    importance = sum(weights[k + ".weight"].flatten(1).norm(dim=0) for k in predictors)
+    hidden = importance.topk(num_hidden).indices.sort().values
+
+    weights = dict(weights)
+    weights[conv_key] = weights[conv_key][hidden]
+    weights[_RPN_HEAD + "conv.bias"] = weights[_RPN_HEAD + "conv.bias"][hidden]
+    for k in predictors:
+        weights[k + ".weight"] = weights[k + ".weight"][:, hidden]
+    return weights
+
+
+def convert_concat_fusion_weights(weights, model_state_dict):
+    """
+    Convert the weights of a "BGRTTT" model with the shared backbone and the
+    "ConcatFusion" of `MODEL.MID_FUSION.NAME` (the legacy mid-fusion), to initialize
+    a model with another fusion and/or a two-stream backbone.
+
+    * The shared backbone initializes the backbone, or both trunks of a two-stream
+      backbone, since it extracted the features of both modalities. The unused
+      "backbone_2" is dropped.
+    * The first layer that reads the fused features in the RPN head and in every ROI
+      head is folded: the weights of its RGB and thermal input channels are summed.
+      The result is exact for the fusions initialized to the average of the
+      modalities, when the two modalities have the same features.
+    * The hidden layer of the RPN head is as wide as the features. The hidden channels
+      that contribute most to the predictions of the RPN are kept.
+    * The weights whose shape changed otherwise keep their initial value, and must be
+      learned by fine-tuning.
+
+    Args:
+        weights (dict[str->Tensor]): the state dict of the legacy model.
+        model_state_dict (dict[str->Tensor]): the state dict of the new model, with
+            its initial values.
+
+    Returns:
+        dict[str->Tensor]: a state dict for the new model.
+    """
+    logger = logging.getLogger(__name__)
+    weights = _select_rpn_hidden_channels(weights, model_state_dict)
+    ret = {}
+    not_converted = []
+    for key, value in model_state_dict.items():
+        source = key
+        for prefix in _TWO_STREAM_PREFIXES:
+            if key.startswith(prefix):
+                source = "backbone." + key[len(prefix) :]
+        old = weights.get(source, None)
+        if old is not None and old.shape == value.shape:
+            ret[key] = old
+        elif (
+            old is not None
+            and key in _FUSED_FEATURE_INPUTS
+            and old.shape[0] == value.shape[0]
+            and old.shape[1] == 2 * value.shape[1]
+            and old.shape[2:] == value.shape[2:]
+        ):
+            # The input channels (or flattened input features) of the RGB features
+            # come first
+            ret[key] = old.view(old.shape[0], 2, -1).sum(dim=1).view_as(value)
+            logger.info("Folded the RGB and thermal inputs of {}".format(key))
+        else:
+            ret[key] = value
+            not_converted.append(key)
+    if not_converted:
+        logger.warning(
+            "The following weights are not converted and keep their initial value:\n"
+            + "\n".join(not_converted)
+        )
+    return ret
@@ -43,6 +43,10 @@ _C.MODEL.PIXEL_STD = [1.0, 1.0, 1.0]
 
 _C.MODEL.BLUR_RGB = False
 _C.MODEL.MAX_POOL_RGB = False
+# For "BGRTTT" (mid-fusion) inputs, run the shared backbone once on the RGB and
+# thermal images stacked along the batch dimension, instead of once per modality.
+# Backbones with batch statistics (BN, SyncBN) still run once per modality in training.
+_C.MODEL.MID_FUSION_BATCHED_BACKBONE = True
 # -----------------------------------------------------------------------------
 # INPUT
 # -----------------------------------------------------------------------------
@@ -82,6 +86,29 @@ _C.INPUT.FORMAT = "BGR"
 # Mask R-CNN supports either "polygon" or "bitmask" as ground truth.
 _C.INPUT.MASK_FORMAT = "polygon"  # alternative: "bitmask"
 _C.INPUT.NUM_IN_CHANNELS = 3
+# Directory of a cache of the decoded RGB-thermal pairs, built by tools/build_rgbt_cache.py.
+# If set, "BGRT" and "BGRTTT" images in the cache are read from it instead of being decoded.
+_C.INPUT.RGBT_PAIR_CACHE = ""
+# Decode the RGB JPEG of "BGRT" and "BGRTTT" images at a reduced resolution (1/2, 1/4, 1/8)
+# when it is still larger than the thermal image it is resized to.
+_C.INPUT.RGBT_REDUCED_DECODE = False
+
+# Resize, flip and photometric jitter of the training images on the device of the model,
+# applied to whole batches instead of in the data loader workers.
+# See detectron2/data/batch_augmentation.py
+_C.INPUT.BATCH_AUGMENTATION = CN({"ENABLED": False})
+# Maximum relative change of the brightness and of the contrast of an image
+_C.INPUT.BATCH_AUGMENTATION.BRIGHTNESS = 0.0
+_C.INPUT.BATCH_AUGMENTATION.CONTRAST = 0.0
+
+# Photometric jitter of the training images in the data loader, sampled independently
+# for each modality, e.g. the RGB and the thermal channels of "BGRT" and "BGRTTT" images.
+# Maximum relative change of the brightness, contrast and saturation. 0 disables it.
+# INPUT.BATCH_AUGMENTATION has its own jitter, which is also per modality.
+_C.INPUT.MODALITY_JITTER = CN()
+_C.INPUT.MODALITY_JITTER.BRIGHTNESS = 0.0
+_C.INPUT.MODALITY_JITTER.CONTRAST = 0.0
+_C.INPUT.MODALITY_JITTER.SATURATION = 0.0
 # -----------------------------------------------------------------------------
 # Dataset
 # -----------------------------------------------------------------------------
@@ -118,6 +145,11 @@ _C.DATALOADER.REPEAT_THRESHOLD = 0.0
 # if True, the dataloader will filter out images that have no associated
 # annotations at train time.
 _C.DATALOADER.FILTER_EMPTY_ANNOTATIONS = True
+# Directory of the sequential shards of the training set, written by tools/build_rgbt_shards.py.
+# If set, training reads the samples from the shards instead of DATASETS.TRAIN.
+_C.DATALOADER.RGBT_SHARDS = ""
+# Number of samples buffered by each data loader worker to shuffle the samples of the shards
+_C.DATALOADER.SHARD_SHUFFLE_BUFFER = 1000
 
 # ---------------------------------------------------------------------------- #
 # Backbone options
@@ -148,6 +180,40 @@ _C.MODEL.FPN.NORM = ""
 _C.MODEL.FPN.FUSE_TYPE = "sum"
 
 
+# ---------------------------------------------------------------------------- #
+# Mid-fusion options ("BGRTTT" inputs)
+# ---------------------------------------------------------------------------- #
+_C.MODEL.MID_FUSION = CN()
+# Fusion of the RGB and thermal features of every level, in MID_FUSION_REGISTRY.
+# "ConcatFusion" doubles the width of the features seen by the RPN and ROI heads.
+# "SumFusion", "ConvFusion" (1x1 conv), "GatedSumFusion" (learned weight per channel)
+# and "AttentionFusion" (predicted weight per pixel) keep the width of one modality.
+# Use tools/convert_mid_fusion_checkpoint.py to fine-tune a "ConcatFusion" model with them.
+_C.MODEL.MID_FUSION.NAME = "ConcatFusion"
+# Backbone of each trunk of "build_two_stream_backbone"
+_C.MODEL.MID_FUSION.BRANCH_BACKBONE = "build_resnet_fpn_backbone"
+# Run the RGB and thermal trunks of "build_two_stream_backbone" concurrently
+_C.MODEL.MID_FUSION.CONCURRENT = True
+# Skip the RGB branch of the frames that are too dark, e.g. at night. Their RGB
+# features are replaced by learned features, and only the thermal branch runs.
+_C.MODEL.MID_FUSION.ILLUMINATION_GATE = CN({"ENABLED": False})
+# A frame is too dark if the mean luma of its RGB image (in [0, 255]) is below it
+_C.MODEL.MID_FUSION.ILLUMINATION_GATE.THRESHOLD = 40.0
+# Probability to also drop the RGB branch of a bright frame in training, so that the
+# learned features are trained on day frames too
+_C.MODEL.MID_FUSION.ILLUMINATION_GATE.DROP_PROB_TRAIN = 0.0
+
+# ---------------------------------------------------------------------------- #
+# MultiHeadRCNN options
+# ---------------------------------------------------------------------------- #
+_C.MODEL.MULTI_HEAD = CN()
+# Names of the detectors that share the backbone, each with its own RPN and ROI heads
+_C.MODEL.MULTI_HEAD.BRANCHES = ["mid_fusion", "thermal_only"]
+# The features read by each branch: "rgb", "thermal", or the fusion of both by
+# a module of MID_FUSION_REGISTRY, e.g. "ConcatFusion"
+_C.MODEL.MULTI_HEAD.BRANCH_INPUTS = ["ConcatFusion", "thermal"]
+
+
 # ---------------------------------------------------------------------------- #
 # Proposal generator options
 # ---------------------------------------------------------------------------- #
@@ -8,9 +8,13 @@ from .build import (
     load_proposals_into_dataset,
     print_instances_class_histogram,
 )
+from .batch_augmentation import BatchAugmentation, build_batch_augmentation
 from .catalog import DatasetCatalog, MetadataCatalog
 from .common import DatasetFromList, MapDataset
 from .dataset_mapper import DatasetMapper
+from .rgbt_pairing import RGBT_PAIRING_REGISTRY, add_rgbt_file_names
+from .rgbt_cache import RGBTPairCache, build_rgbt_pair_cache
+from .rgbt_shards import RGBTShardDataset, write_rgbt_shards
 
 # ensure the builtin datasets are registered
 from . import datasets, samplers  # isort:skip
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Augmentation of whole training batches on the device of the model.
+
+With it, the data loader workers only decode the images (and crop them if
+INPUT.CROP is enabled). The resize, flip and photometric jitter of
+:func:`detectron2.data.detection_utils.build_transform_gen` are applied to the
+collated batch with tensor ops, with per-sample parameters, for any number of channels.
+"""
+import numpy as np
+import sys
+import torch
+from torch.nn import functional as F
+
+from detectron2.structures import Boxes, ImageList, Instances
+
+from . import detection_utils as utils
+
+__all__ = ["BatchAugmentation", "BatchAugmentedLoader", "build_batch_augmentation"]
+
+
+class BatchAugmentation:
+    """
+    Resize the shortest edge of every image (as :class:`T.ResizeShortestEdge`), flip it
+    horizontally (as :class:`T.RandomFlip`), and jitter the brightness and contrast
+    of each of its modalities (as :class:`T.RandomGroupBrightness` and
+    :class:`T.RandomGroupContrast`).
+
+    The images of a batch are padded into one tensor, and resized and flipped by a single
+    bilinear `grid_sample`, which matches `F.interpolate(mode="bilinear")`. The
+    "gt_boxes" of the instances are transformed to match. Other annotations (masks,
+    keypoints, proposals, semantic segmentation) are not supported.
+    """
+
+    def __init__(
+        self,
+        short_edge_length,
+        max_size=sys.maxsize,
+        sample_style="range",
+        flip_prob=0.5,
+        brightness=0.0,
+        contrast=0.0,
+        channel_groups=None,
+        device="cuda",
+    ):
+        """
+        Args:
+            short_edge_length, max_size, sample_style: see :class:`T.ResizeShortestEdge`.
+            flip_prob (float): probability of a horizontal flip.
+            brightness (float): the brightness of an image is multiplied by a factor
+                sampled uniformly in [1 - brightness, 1 + brightness].
+            contrast (float): an image is blended with its mean intensity, with a weight
+                sampled uniformly in [1 - contrast, 1 + contrast].
+            channel_groups (list[list[int]] or None): the brightness and contrast of each
+                group of channels (modality) are jittered independently, as by
+                :class:`T.RandomGroupBrightness`. None means that all the channels form
+                one group.
+            device (str or torch.device): where the batch is augmented.
+        """
+        assert sample_style in ["range", "choice"], sample_style
+        if isinstance(short_edge_length, int):
+            short_edge_length = (short_edge_length, short_edge_length)
+        self.short_edge_length = short_edge_length
+        self.max_size = max_size
+        self.is_range = sample_style == "range"
+        self.flip_prob = flip_prob
+        self.brightness = brightness
+        self.contrast = contrast
+        self.channel_groups = channel_groups
+        self.device = torch.device(device)
+
+    def _get_output_size(self, h, w):
+        # Same as ResizeShortestEdge.get_transform
+        if self.is_range:
+            size = np.random.randint(self.short_edge_length[0], self.short_edge_length[1] + 1)
+        else:
+            size = np.random.choice(self.short_edge_length)
+        if size == 0:
+            return h, w
+        scale = size * 1.0 / min(h, w)
+        if h < w:
+            newh, neww = size, scale * w
+        else:
+            newh, neww = scale * h, size
+        if max(newh, neww) > self.max_size:
+            scale = self.max_size * 1.0 / max(newh, neww)
+            newh = newh * scale
+            neww = neww * scale
+        return int(newh + 0.5), int(neww + 0.5)
+
+    def _get_grid(self, in_sizes, out_sizes, flips, padded_size):
+        """
+        Returns:
+            Tensor: the sampling grid of `grid_sample` for a padded output of shape
+                (N, max output height, max output width).
+            Tensor: (N, max output height, max output width), whether a pixel of the padded
+                output belongs to its image.
+        """
+        device = self.device
+        in_h, in_w = torch.tensor(in_sizes, dtype=torch.float32, device=device).unbind(1)
+        out_h, out_w = torch.tensor(out_sizes, dtype=torch.float32, device=device).unbind(1)
+        flips = torch.as_tensor(flips, device=device)
+
+        rows = torch.arange(max(s[0] for s in out_sizes), device=device)
+        cols = torch.arange(max(s[1] for s in out_sizes), device=device)
+        # Centers of the output pixels, mirrored for the flipped images
+        ys = rows.float() + 0.5
+        xs = cols.float() + 0.5
+        xs = torch.where(flips[:, None], out_w[:, None] - xs[None], xs[None])
+
+        # Source pixel coordinates as computed by F.interpolate (align_corners=False),
+        # clamped to each image instead of the padded batch
+        src_y = ys[None] * (in_h / out_h)[:, None] - 0.5
+        src_x = xs * (in_w / out_w)[:, None] - 0.5
+        src_y = torch.min(src_y.clamp(min=0), (in_h - 1)[:, None])
+        src_x = torch.min(src_x.clamp(min=0), (in_w - 1)[:, None])
+
+        # Normalized coordinates of the padded input
+        grid_y = (2 * src_y + 1) / padded_size[0] - 1
+        grid_x = (2 * src_x + 1) / padded_size[1] - 1
+        n, out_height, out_width = len(out_sizes), len(rows), len(cols)
+        grid = torch.stack(
+            [
+                grid_x[:, None, :].expand(n, out_height, out_width),
+                grid_y[:, :, None].expand(n, out_height, out_width),
+            ],
+            dim=3,
+        )
+        valid = (rows[None] < out_h[:, None])[:, :, None] & (cols[None] < out_w[:, None])[:, None]
+        return grid, valid
+
+    def _get_group_of_channels(self, num_channels):
+        """
+        Returns:
+            Tensor: the group of every channel. Channels in no group are in an extra
+                last group, which is not jittered.
+            int: the number of groups, including the extra group.
+        """
+        groups = self.channel_groups or [list(range(num_channels))]
+        group_of_channels = torch.full((num_channels,), len(groups), dtype=torch.long)
+        for k, group in enumerate(groups):
+            group_of_channels[group] = k
+        return group_of_channels.to(self.device), len(groups) + 1
+
+    def _sample_weights(self, intensity, num_samples, num_groups, dtype):
+        w = np.random.uniform(1 - intensity, 1 + intensity, size=(num_samples, num_groups))
+        w[:, -1] = 1
+        return torch.as_tensor(w, dtype=dtype, device=self.device)
+
+    def _jitter(self, images, valid):
+        n, c = images.shape[:2]
+        group_of_channels, num_groups = self._get_group_of_channels(c)
+        if self.brightness > 0:
+            w = self._sample_weights(self.brightness, n, num_groups, images.dtype)
+            images = w[:, group_of_channels].view(n, c, 1, 1) * images
+        if self.contrast > 0:
+            w = self._sample_weights(self.contrast, n, num_groups, images.dtype)
+            w = w[:, group_of_channels].view(n, c, 1, 1)
+            # Mean intensity of every group of every image, without the padding
+            valid = valid[:, None].to(images.dtype)
+            num_pixels = valid.sum(dim=(1, 2, 3))
+            sums = (images * valid).sum(dim=(2, 3))
+            group_sums = sums.new_zeros(n, num_groups).index_add_(1, group_of_channels, sums)
+            group_sizes = torch.bincount(group_of_channels, minlength=num_groups).to(sums)
+            means = group_sums / (num_pixels[:, None] * group_sizes.clamp(min=1))
+            images = w * images + (1 - w) * means[:, group_of_channels].view(n, c, 1, 1)
+        return images.clamp(0, 255)
+
+    def _transform_instances(self, instances, in_size, out_size, flip):
+        (h, w), (oh, ow) = in_size, out_size
+        boxes = instances.gt_boxes.tensor
+        boxes = boxes * boxes.new_tensor([ow * 1.0 / w, oh * 1.0 / h, ow * 1.0 / w, oh * 1.0 / h])
+        if flip:
+            boxes = torch.stack([ow - boxes[:, 2], boxes[:, 1], ow - boxes[:, 0], boxes[:, 3]], 1)
+        ret = Instances(out_size, **instances.get_fields())
+        ret.gt_boxes = Boxes(boxes)
+        return utils.filter_empty_instances(ret)
+
+    @torch.no_grad()
+    def __call__(self, batched_inputs):
+        """
+        Args:
+            batched_inputs (list[dict]): a batch produced by
+                :class:`detectron2.data.DatasetMapper`, with "image" in (C, H, W) format.
+
+        Returns:
+            list[dict]: new dicts, whose "image" are float tensors on the device and whose
+            "instances" are resized and flipped as the images.
+        """
+        images = [x["image"].to(self.device, non_blocking=True) for x in batched_inputs]
+        in_sizes = [tuple(image.shape[-2:]) for image in images]
+        out_sizes = [self._get_output_size(h, w) for h, w in in_sizes]
+        flips = (np.random.rand(len(images)) < self.flip_prob).tolist()
+
+        padded = ImageList.from_tensors(images).tensor.float()
+        grid, valid = self._get_grid(in_sizes, out_sizes, flips, padded.shape[-2:])
+        outputs = F.grid_sample(
+            padded, grid, mode="bilinear", padding_mode="border", align_corners=False
+        )
+        if self.brightness > 0 or self.contrast > 0:
+            outputs = self._jitter(outputs, valid)
+
+        ret = []
+        for k, x in enumerate(batched_inputs):
+            (oh, ow) = out_sizes[k]
+            x = dict(x)
+            x["image"] = outputs[k, :, :oh, :ow]
+            if "instances" in x:
+                x["instances"] = self._transform_instances(
+                    x["instances"], in_sizes[k], out_sizes[k], flips[k]
+                )
+            ret.append(x)
+        return ret
+
+
+class BatchAugmentedLoader:
+    """
+    Apply a :class:`BatchAugmentation` to every batch of a data loader.
+    """
+
+    def __init__(self, data_loader, augmentation):
+        """
+        Args:
+            data_loader: an iterable of batches (list[dict]).
+            augmentation (BatchAugmentation):
+        """
+        self.data_loader = data_loader
+        self.augmentation = augmentation
+
+    def __iter__(self):
+        for batch in self.data_loader:
+            yield self.augmentation(batch)
+
+
+def build_batch_augmentation(cfg):
+    """
+    Create the :class:`BatchAugmentation` of the training batches from config,
+    with the resize and flip of :func:`detectron2.data.detection_utils.build_transform_gen`.
+
+    Returns:
+        BatchAugmentation
+    """
+    assert not (
+        cfg.MODEL.MASK_ON or cfg.MODEL.KEYPOINT_ON or cfg.MODEL.LOAD_PROPOSALS
+    ), "INPUT.BATCH_AUGMENTATION only supports box annotations!"
+    if cfg.INPUT.MIN_SIZE_TRAIN_SAMPLING == "range":
+        assert len(cfg.INPUT.MIN_SIZE_TRAIN) == 2, (
+            "more than 2 ({}) min_size(s) are provided for ranges".format(
+                len(cfg.INPUT.MIN_SIZE_TRAIN)
+            )
+        )
+    return BatchAugmentation(
+        cfg.INPUT.MIN_SIZE_TRAIN,
+        cfg.INPUT.MAX_SIZE_TRAIN,
+        cfg.INPUT.MIN_SIZE_TRAIN_SAMPLING,
+        brightness=cfg.INPUT.BATCH_AUGMENTATION.BRIGHTNESS,
+        contrast=cfg.INPUT.BATCH_AUGMENTATION.CONTRAST,
+        channel_groups=utils.get_channel_groups(cfg.INPUT.FORMAT),
+        device=cfg.MODEL.DEVICE,
+    )
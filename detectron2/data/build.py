@@ -17,10 +17,12 @@ from detectron2.utils.env import seed_all_rng
 from detectron2.utils.logger import log_first_n
 
 from . import samplers
+from .batch_augmentation import BatchAugmentedLoader, build_batch_augmentation
 from .catalog import DatasetCatalog, MetadataCatalog
 from .common import AspectRatioGroupedDataset, DatasetFromList, MapDataset
 from .dataset_mapper import DatasetMapper
 from .detection_utils import check_metadata_consistency
+from .rgbt_shards import RGBTShardDataset
 
 """
 This file contains the default logic to build a dataloader for training or testing.
@@ -257,6 +259,7 @@ def build_detection_train_loader(cfg, mapper=None):
     A data loader is created by the following steps:
 
     1. Use the dataset names in config to query :class:`DatasetCatalog`, and obtain a list of dicts.
+       Or, if `DATALOADER.RGBT_SHARDS` is set, stream the dicts from the shards.
     2. Start workers to work on the dicts. Each worker will:
 
        * Map each metadata dict into another format to be consumed by the model.
@@ -287,15 +290,25 @@ def build_detection_train_loader(cfg, mapper=None):
     )
     images_per_worker = images_per_batch // num_workers
 
-    dataset_dicts = get_detection_dataset_dicts(
-        cfg.DATASETS.TRAIN,
-        filter_empty=cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS,
-        min_keypoints=cfg.MODEL.ROI_KEYPOINT_HEAD.MIN_KEYPOINTS_PER_IMAGE
-        if cfg.MODEL.KEYPOINT_ON
-        else 0,
-        proposal_files=cfg.DATASETS.PROPOSAL_FILES_TRAIN if cfg.MODEL.LOAD_PROPOSALS else None,
-    )
-    dataset = DatasetFromList(dataset_dicts, copy=False)
+    if cfg.DATALOADER.RGBT_SHARDS:
+        # An infinite stream, which shuffles and splits the samples among the ranks itself
+        assert (
+            cfg.DATALOADER.SAMPLER_TRAIN == "TrainingSampler"
+        ), "DATALOADER.RGBT_SHARDS only supports the TrainingSampler!"
+        dataset = RGBTShardDataset(
+            cfg.DATALOADER.RGBT_SHARDS, shuffle_buffer=cfg.DATALOADER.SHARD_SHUFFLE_BUFFER
+        )
+        sampler = None
+    else:
+        dataset_dicts = get_detection_dataset_dicts(
+            cfg.DATASETS.TRAIN,
+            filter_empty=cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS,
+            min_keypoints=cfg.MODEL.ROI_KEYPOINT_HEAD.MIN_KEYPOINTS_PER_IMAGE
+            if cfg.MODEL.KEYPOINT_ON
+            else 0,
+            proposal_files=cfg.DATASETS.PROPOSAL_FILES_TRAIN if cfg.MODEL.LOAD_PROPOSALS else None,
+        )
+        dataset = DatasetFromList(dataset_dicts, copy=False)
 
     if mapper is None:
         mapper = DatasetMapper(cfg, True)
@@ -304,7 +317,9 @@ def build_detection_train_loader(cfg, mapper=None):
     sampler_name = cfg.DATALOADER.SAMPLER_TRAIN
     logger = logging.getLogger(__name__)
     logger.info("Using training sampler {}".format(sampler_name))
-    if sampler_name == "TrainingSampler":
+    if cfg.DATALOADER.RGBT_SHARDS:
+        logger.info("Reading the training samples from {}".format(cfg.DATALOADER.RGBT_SHARDS))
+    elif sampler_name == "TrainingSampler":
         sampler = samplers.TrainingSampler(len(dataset))
     elif sampler_name == "RepeatFactorTrainingSampler":
         sampler = samplers.RepeatFactorTrainingSampler(
@@ -323,6 +338,15 @@ def build_detection_train_loader(cfg, mapper=None):
             worker_init_fn=worker_init_reset_seed,
         )  # yield individual mapped dict
         data_loader = AspectRatioGroupedDataset(data_loader, images_per_worker)
+    elif sampler is None:
+        data_loader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=images_per_worker,
+            drop_last=True,
+            num_workers=cfg.DATALOADER.NUM_WORKERS,
+            collate_fn=trivial_batch_collator,
+            worker_init_fn=worker_init_reset_seed,
+        )
     else:
         batch_sampler = torch.utils.data.sampler.BatchSampler(
             sampler, images_per_worker, drop_last=True
@@ -336,6 +360,8 @@ def build_detection_train_loader(cfg, mapper=None):
             worker_init_fn=worker_init_reset_seed,
         )
 
+    if cfg.INPUT.BATCH_AUGMENTATION.ENABLED:
+        data_loader = BatchAugmentedLoader(data_loader, build_batch_augmentation(cfg))
     return data_loader
 
 
@@ -1,6 +1,8 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import copy
 import logging
+import numpy as np
+import pickle
 import random
 import torch.utils.data as data
 
@@ -9,18 +11,42 @@ from detectron2.utils.serialize import PicklableWrapper
 __all__ = ["MapDataset", "DatasetFromList", "AspectRatioGroupedDataset"]
 
 
+class _MapIterableDataset(data.IterableDataset):
+    """
+    Map a function over the elements of an iterable dataset, see :class:`MapDataset`.
+    """
+
+    def __init__(self, dataset, map_func):
+        self._dataset = dataset
+        self._map_func = PicklableWrapper(map_func)  # wrap so that a lambda will work
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __iter__(self):
+        for x in map(self._map_func, self._dataset):
+            if x is not None:
+                yield x
+
+
 class MapDataset(data.Dataset):
     """
     Map a function over the elements in a dataset.
 
     Args:
-        dataset: a dataset where map function is applied.
+        dataset: a dataset where map function is applied. If it is an
+            `IterableDataset`, the elements for which map_func returns None are skipped.
         map_func: a callable which maps the element in dataset. map_func is
             responsible for error handling, when error happens, it needs to
             return None so the MapDataset will randomly use other
             elements from the dataset.
     """
 
+    def __new__(cls, dataset, map_func):
+        if isinstance(dataset, data.IterableDataset):
+            return _MapIterableDataset(dataset, map_func)
+        return super().__new__(cls)
+
     def __init__(self, dataset, map_func):
         self._dataset = dataset
         self._map_func = PicklableWrapper(map_func)  # wrap so that a lambda will work
@@ -60,22 +86,54 @@ class DatasetFromList(data.Dataset):
     Wrap a list to a torch Dataset. It produces elements of the list as data.
     """
 
-    def __init__(self, lst: list, copy: bool = True):
+    def __init__(self, lst: list, copy: bool = True, serialize: bool = True):
         """
         Args:
             lst (list): a list which contains elements to produce.
             copy (bool): whether to deepcopy the element when producing it,
                 so that the result can be modified in place without affecting the
                 source in the list.
+            serialize (bool): whether to hold the elements in one serialized
+                byte array instead of a list of python objects. The array is shared
+                by the forked data loader workers, while reading the objects of a list
+                increases their reference counts and eventually copies the pages of
+                the whole list into every worker. Every element produced is a new
+                object, so `copy` is not needed.
         """
         self._lst = lst
         self._copy = copy
+        self._serialize = serialize
+
+        def _serialize(data):
+            buffer = pickle.dumps(data, protocol=-1)
+            return np.frombuffer(buffer, dtype=np.uint8)
+
+        if self._serialize:
+            logger = logging.getLogger(__name__)
+            logger.info(
+                "Serializing {} elements to byte arrays and concatenating them all ...".format(
+                    len(self._lst)
+                )
+            )
+            self._lst = [_serialize(x) for x in self._lst]
+            self._addr = np.asarray([len(x) for x in self._lst], dtype=np.int64)
+            self._addr = np.cumsum(self._addr)
+            self._lst = np.concatenate(self._lst) if len(self._lst) else np.zeros(0, np.uint8)
+            logger.info("Serialized dataset takes {:.2f} MiB".format(len(self._lst) / 1024 ** 2))
 
     def __len__(self):
-        return len(self._lst)
+        if self._serialize:
+            return len(self._addr)
+        else:
+            return len(self._lst)
 
     def __getitem__(self, idx):
-        if self._copy:
+        if self._serialize:
+            start_addr = 0 if idx == 0 else self._addr[idx - 1].item()
+            end_addr = self._addr[idx].item()
+            bytes = memoryview(self._lst[start_addr:end_addr])
+            return pickle.loads(bytes)
+        elif self._copy:
             return copy.deepcopy(self._lst[idx])
         else:
             return self._lst[idx]
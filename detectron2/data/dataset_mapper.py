@@ -8,6 +8,7 @@ from PIL import Image
 
 from . import detection_utils as utils
 from . import transforms as T
+from .rgbt_cache import RGBTPairCache
 
 """
 This file contains the default mapping that's applied to "dataset dicts".
@@ -38,7 +39,11 @@ class DatasetMapper:
         else:
             self.crop_gen = None
         
-        self.tfm_gens = utils.build_transform_gen(cfg, is_train)
+        if cfg.INPUT.BATCH_AUGMENTATION.ENABLED and is_train:
+            # Resized and flipped by the data loader, see `build_batch_augmentation`
+            self.tfm_gens = []
+        else:
+            self.tfm_gens = utils.build_transform_gen(cfg, is_train)
 
         # fmt: off
         self.img_format     = cfg.INPUT.FORMAT
@@ -46,7 +51,12 @@ class DatasetMapper:
         self.mask_format    = cfg.INPUT.MASK_FORMAT
         self.keypoint_on    = cfg.MODEL.KEYPOINT_ON
         self.load_proposals = cfg.MODEL.LOAD_PROPOSALS
+        self.reduced_decode = cfg.INPUT.RGBT_REDUCED_DECODE
         # fmt: on
+        if cfg.INPUT.RGBT_PAIR_CACHE:
+            self.pair_cache = RGBTPairCache(cfg.INPUT.RGBT_PAIR_CACHE)
+        else:
+            self.pair_cache = None
         if self.keypoint_on and is_train:
             # Flip only makes sense in training
             self.keypoint_hflip_indices = utils.create_keypoint_hflip_indices(cfg.DATASETS.TRAIN)
@@ -72,7 +82,19 @@ class DatasetMapper:
         """
         dataset_dict = copy.deepcopy(dataset_dict)  # it will be modified by code below
         # USER: Write your own image loading if it's not from a file
-        image = utils.read_image(dataset_dict["file_name"], format=self.img_format)
+        image_size = None
+        if "height" in dataset_dict and "width" in dataset_dict:
+            # Saves reading the header of the thermal image for the reduced decode
+            image_size = (dataset_dict["height"], dataset_dict["width"])
+        image = utils.read_image(
+            dataset_dict["file_name"],
+            format=self.img_format,
+            pair_cache=self.pair_cache,
+            rgb_file_name=dataset_dict.get("rgb_file_name"),
+            reduced_decode=self.reduced_decode,
+            pair_bytes=dataset_dict.pop("rgbt_bytes", None),
+            image_size=image_size,
+        )
         utils.check_image_size(dataset_dict, image)
 
         if "annotations" not in dataset_dict:
@@ -98,10 +120,16 @@ class DatasetMapper:
         # Pytorch's dataloader is efficient on torch.Tensor due to shared-memory,
         # but not efficient on large generic data structures due to the use of pickle & mp.Queue.
         # Therefore it's important to use torch.Tensor.
-        dataset_dict["image"] = torch.as_tensor(
-            image.transpose(2, 0, 1).astype("float32")
-        ).contiguous()
-        # Can use uint8 if it turns out to be slow some day
+        if self.img_format in ("BGRT", "BGRTTT"):
+            # Multi-channel images are large, so they are kept as uint8 until they are
+            # on the device of the model, see `GeneralizedRCNN.preprocess_image`.
+            dataset_dict["image"] = torch.as_tensor(
+                np.ascontiguousarray(image.transpose(2, 0, 1))
+            )
+        else:
+            dataset_dict["image"] = torch.as_tensor(
+                image.transpose(2, 0, 1).astype("float32")
+            ).contiguous()
 
         # USER: Remove if you don't use pre-computed proposals.
         if self.load_proposals:
@@ -1,8 +1,12 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 from .cityscapes import load_cityscapes_instances
-from .coco import load_coco_json, load_sem_seg
+from .coco import load_coco_api, load_coco_json, load_sem_seg
 from .lvis import load_lvis_json, register_lvis_instances, get_lvis_instances_meta
-from .register_coco import register_coco_instances, register_coco_panoptic_separated
+from .register_coco import (
+    register_coco_instances,
+    register_coco_panoptic_separated,
+    register_rgbt_coco_instances,
+)
 from . import builtin  # ensure the builtin datasets are registered
 
 
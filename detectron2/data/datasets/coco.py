@@ -2,10 +2,13 @@
 import io
 import logging
 import contextlib
+import functools
+import hashlib
 import os
 import datetime
 import json
 import numpy as np
+import pickle
 
 from PIL import Image
 
@@ -23,10 +26,105 @@ This file contains functions to parse COCO-format annotations into dicts in "Det
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["load_coco_json", "load_sem_seg"]
+__all__ = ["load_coco_json", "load_coco_api", "load_sem_seg"]
 
 
-def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_keys=None):
+# Bump when the content of the cache files changes
+_CACHE_VERSION = 1
+
+
+def _json_fingerprint(json_file, cached=None):
+    """
+    Returns:
+        tuple: (mtime, size, sha1 of the content) of the file. The content is only
+        hashed when the mtime or size differ from the `cached` fingerprint.
+    """
+    stat = os.stat(json_file)
+    if cached is not None and tuple(cached[:2]) == (stat.st_mtime_ns, stat.st_size):
+        return tuple(cached)
+    sha1 = hashlib.sha1()
+    with open(json_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return (stat.st_mtime_ns, stat.st_size, sha1.hexdigest())
+
+
+def _load_with_cache(json_file, key, load):
+    """
+    Returns `load()`, cached in a pickle file next to the local file `json_file`.
+    The cache is rebuilt when the content of `json_file` changes.
+
+    Args:
+        json_file (str):
+        key (tuple): the arguments of `load` besides `json_file`. Every key has
+            its own cache file.
+        load (callable):
+    """
+    key = hashlib.sha1(repr((_CACHE_VERSION,) + tuple(key)).encode()).hexdigest()[:12]
+    cache_file = "{}.{}.pkl".format(json_file, key)
+    hit = False
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                # The fingerprint is pickled first, the data is only read if it matches
+                cached = tuple(pickle.load(f))
+                fingerprint = _json_fingerprint(json_file, cached)
+                if fingerprint[2] == cached[2]:
+                    data = pickle.load(f)
+                    if fingerprint == cached:
+                        return data
+                    # Same content but a new mtime: rewrite the fingerprint
+                    hit = True
+        except Exception:
+            logger.warning("Ignoring the corrupted cache file {}".format(cache_file), exc_info=True)
+    if not hit:
+        fingerprint = _json_fingerprint(json_file)
+        data = load()
+
+    # Write to a temporary file, so that concurrent readers never see a partial file
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(fingerprint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        logger.info("Cached the annotations of {} in {}".format(json_file, cache_file))
+    except OSError as e:
+        logger.warning("Cannot write the cache file {}: {}".format(cache_file, e))
+    return data
+
+
+def load_coco_api(json_file, cache=False, coco_cls=None):
+    """
+    Load a json file with COCO's annotation format into the COCO api, which
+    indexes the annotations.
+
+    Args:
+        json_file (str): full path to the json file in COCO annotation format.
+        cache (bool): whether to cache the COCO api in a file next to `json_file`,
+            see :func:`load_coco_json`.
+        coco_cls (type): the class of the COCO api. Defaults to `pycocotools.coco.COCO`.
+
+    Returns:
+        COCO: an instance of `coco_cls`.
+    """
+    if coco_cls is None:
+        from pycocotools.coco import COCO as coco_cls
+
+    json_file = PathManager.get_local_path(json_file)
+
+    def load():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return coco_cls(json_file)
+
+    if not cache:
+        return load()
+    return _load_with_cache(json_file, ("coco_api", coco_cls.__module__, coco_cls.__name__), load)
+
+
+def load_coco_json(
+    json_file, image_root, dataset_name=None, extra_annotation_keys=None, cache=False
+):
     """
     Load a json file with COCO's instances annotation format.
     Currently supports instance detection, instance segmentation,
@@ -42,6 +140,9 @@ def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_ke
             loaded into the dataset dict (besides "iscrowd", "bbox", "keypoints",
             "category_id", "segmentation"). The values for these keys will be returned as-is.
             For example, the densepose annotations are loaded in this way.
+        cache (bool): whether to cache the dataset dicts in a pickle file next to
+            `json_file`. The cache is used as long as the content of `json_file` is
+            unchanged. If the directory is not writable, nothing is cached.
 
     Returns:
         list[dict]: a list of dicts in Detectron2 standard format. (See
@@ -51,22 +152,22 @@ def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_ke
         1. This function does not read the image files.
            The results do not have the "image" field.
     """
-    from pycocotools.coco import COCO
-
     timer = Timer()
     json_file = PathManager.get_local_path(json_file)
-    with contextlib.redirect_stdout(io.StringIO()):
-        coco_api = COCO(json_file)
+    map_category_ids = dataset_name is not None
+    load = functools.partial(
+        _load_coco_json, json_file, image_root, map_category_ids, extra_annotation_keys
+    )
+    if cache:
+        key = ("dataset_dicts", image_root, map_category_ids, tuple(extra_annotation_keys or ()))
+        dataset_dicts, thing_classes, id_map = _load_with_cache(json_file, key, load)
+    else:
+        dataset_dicts, thing_classes, id_map = load()
     if timer.seconds() > 1:
         logger.info("Loading {} takes {:.2f} seconds.".format(json_file, timer.seconds()))
 
-    id_map = None
     if dataset_name is not None:
         meta = MetadataCatalog.get(dataset_name)
-        cat_ids = sorted(coco_api.getCatIds())
-        cats = coco_api.loadCats(cat_ids)
-        # The categories in a custom json file may not be sorted.
-        thing_classes = [c["name"] for c in sorted(cats, key=lambda x: x["id"])]
         meta.thing_classes = thing_classes
 
         # In COCO, certain category ids are artificially removed,
@@ -77,6 +178,7 @@ def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_ke
         # It works by looking at the "categories" field in the json, therefore
         # if users' own json also have incontiguous ids, we'll
         # apply this mapping as well but print a warning.
+        cat_ids = sorted(id_map)
         if not (min(cat_ids) == 1 and max(cat_ids) == len(cat_ids)):
             if "coco" not in dataset_name:
                 logger.warning(
@@ -84,9 +186,28 @@ def load_coco_json(json_file, image_root, dataset_name=None, extra_annotation_ke
 Category ids in annotations are not in [1, #categories]! We'll apply a mapping for you.
 """
                 )
-        id_map = {v: i for i, v in enumerate(cat_ids)}
         meta.thing_dataset_id_to_contiguous_id = id_map
 
+    logger.info("Loaded {} images in COCO format from {}".format(len(dataset_dicts), json_file))
+    return dataset_dicts
+
+
+def _load_coco_json(json_file, image_root, map_category_ids, extra_annotation_keys):
+    """
+    Returns:
+        list[dict]: the dataset dicts. Their category ids are mapped to contiguous
+            ids if `map_category_ids`.
+        list[str]: the thing classes.
+        dict: maps the category ids of the json file to contiguous ids.
+    """
+    coco_api = load_coco_api(json_file)
+
+    cat_ids = sorted(coco_api.getCatIds())
+    cats = coco_api.loadCats(cat_ids)
+    # The categories in a custom json file may not be sorted.
+    thing_classes = [c["name"] for c in sorted(cats, key=lambda x: x["id"])]
+    id_map = {v: i for i, v in enumerate(cat_ids)}
+
     # sort indices for reproducible results
     img_ids = sorted(coco_api.imgs.keys())
     # imgs is a list of dicts, each looks something like:
@@ -126,8 +247,6 @@ Category ids in annotations are not in [1, #categories]! We'll apply a mapping f
 
     imgs_anns = list(zip(imgs, anns))
 
-    logger.info("Loaded {} images in COCO format from {}".format(len(imgs_anns), json_file))
-
     dataset_dicts = []
 
     ann_keys = ["iscrowd", "bbox", "keypoints", "category_id"] + (extra_annotation_keys or [])
@@ -179,7 +298,7 @@ Category ids in annotations are not in [1, #categories]! We'll apply a mapping f
                 obj["keypoints"] = keypts
 
             obj["bbox_mode"] = BoxMode.XYWH_ABS
-            if id_map:
+            if map_category_ids and id_map:
                 obj["category_id"] = id_map[obj["category_id"]]
             objs.append(obj)
         record["annotations"] = objs
@@ -192,7 +311,7 @@ Category ids in annotations are not in [1, #categories]! We'll apply a mapping f
                 num_instances_without_valid_segmentation
             )
         )
-    return dataset_dicts
+    return dataset_dicts, thing_classes, id_map
 
 
 def load_sem_seg(gt_root, image_root, gt_ext="png", image_ext="jpg"):
@@ -2,16 +2,21 @@
 import copy
 
 from detectron2.data import DatasetCatalog, MetadataCatalog
+from detectron2.data.rgbt_pairing import add_rgbt_file_names
 from .coco import load_coco_json, load_sem_seg
 
 """
 This file contains functions to register a COCO-format dataset to the DatasetCatalog.
 """
 
-__all__ = ["register_coco_instances", "register_coco_panoptic_separated"]
+__all__ = [
+    "register_coco_instances",
+    "register_rgbt_coco_instances",
+    "register_coco_panoptic_separated",
+]
 
 
-def register_coco_instances(name, metadata, json_file, image_root):
+def register_coco_instances(name, metadata, json_file, image_root, cache=False):
     """
     Register a dataset in COCO's json annotation format for
     instance detection, instance segmentation and keypoint detection.
@@ -27,14 +32,54 @@ def register_coco_instances(name, metadata, json_file, image_root):
             leave it as an empty dict.
         json_file (str): path to the json instance annotation file.
         image_root (str): directory which contains all the images.
+        cache (bool): whether to cache the dataset dicts and the COCO api of the
+            evaluators in files next to `json_file`. See :func:`load_coco_json`.
     """
     # 1. register a function which returns dicts
-    DatasetCatalog.register(name, lambda: load_coco_json(json_file, image_root, name))
+    DatasetCatalog.register(
+        name, lambda: load_coco_json(json_file, image_root, name, cache=cache)
+    )
 
     # 2. Optionally, add metadata about this dataset,
     # since they might be useful in evaluation, visualization or logging
     MetadataCatalog.get(name).set(
-        json_file=json_file, image_root=image_root, evaluator_type="coco", **metadata
+        json_file=json_file,
+        image_root=image_root,
+        evaluator_type="coco",
+        annotation_cache=cache,
+        **metadata
+    )
+
+
+def register_rgbt_coco_instances(
+    name, metadata, json_file, image_root, pairing="FLIR", cache=True
+):
+    """
+    Register a multi-modal dataset in COCO's json annotation format, whose
+    "file_name" are the thermal images.
+
+    The RGB image of every thermal image is found once when the dataset is loaded, and
+    stored in the fields "thermal_file_name" and "rgb_file_name" of the dataset dicts.
+
+    Args:
+        name, metadata, json_file, image_root: see :func:`register_coco_instances`.
+        pairing (str): the name of a resolver in
+            :data:`detectron2.data.rgbt_pairing.RGBT_PAIRING_REGISTRY`, e.g. "FLIR" or "KAIST".
+        cache (bool): see :func:`register_coco_instances`.
+    """
+    DatasetCatalog.register(
+        name,
+        lambda: add_rgbt_file_names(
+            load_coco_json(json_file, image_root, name, cache=cache), pairing
+        ),
+    )
+    MetadataCatalog.get(name).set(
+        json_file=json_file,
+        image_root=image_root,
+        evaluator_type="coco",
+        annotation_cache=cache,
+        rgbt_pairing=pairing,
+        **metadata
     )
 
 
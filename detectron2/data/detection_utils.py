@@ -5,6 +5,7 @@
 Common data processing utilities that are used in a
 typical object detection data pipeline.
 """
+import io
 import logging
 import numpy as np
 import pycocotools.mask as mask_util
@@ -24,7 +25,9 @@ from detectron2.structures import (
     RotatedBoxes,
     polygons_to_bitmask,
 )
+from detectron2.utils.executor import get_process_executor
 
+from . import rgbt_pairing
 from . import transforms as T
 from .catalog import MetadataCatalog
 
@@ -35,41 +38,144 @@ class SizeMismatchError(ValueError):
     """
 
 
-def read_image(file_name, format=None):
+# Reduced JPEG decode of the RGB image, by decreasing reduction factor
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _rgb_decode_flag(rgb_file, thermal_size):
+    """
+    The cv2 decode flag of the RGB image: the largest JPEG reduction that keeps it
+    at least as large as the thermal image it is resized to, of size
+    `thermal_size` (height, width). Only the header of the RGB image (file name or
+    file object) is read.
+    """
+    with Image.open(rgb_file) as rgb:
+        rgb_w, rgb_h = rgb.size
+    thermal_h, thermal_w = thermal_size
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if rgb_w // factor >= thermal_w and rgb_h // factor >= thermal_h:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def _imdecode(buffer, flag=cv2.IMREAD_COLOR):
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flag)
+
+
+def read_rgbt_pair(
+    file_name, rgb_file_name=None, reduced_decode=False, pair_bytes=None, image_size=None
+):
+    """
+    Read a thermal image and the RGB image paired with it, aligned to it.
+    The two images are decoded concurrently.
+
+    Args:
+        file_name (str): path of the thermal image.
+        rgb_file_name (str or None): path of the RGB image, e.g. the "rgb_file_name"
+            of a dataset dict. Defaults to the FLIR pairing of the thermal image, see
+            :mod:`detectron2.data.rgbt_pairing`.
+        reduced_decode (bool): decode the RGB JPEG at a reduced resolution (1/2, 1/4
+            or 1/8) when it is still larger than the thermal image. Faster, but not
+            bit-identical to resizing the full resolution image.
+        pair_bytes (tuple[bytes] or None): the encoded thermal and RGB images, e.g.
+            from :class:`detectron2.data.RGBTShardDataset`. If given, they are decoded
+            instead of the files.
+        image_size (tuple or None): the (height, width) of the thermal image, e.g. from
+            the "height" and "width" of a dataset dict. If given, the RGB image is
+            resized while the thermal image is decoded. If None, it is read from the
+            header of the thermal image for `reduced_decode`.
+
+    Returns:
+        rgb_img, thermal_img (np.ndarray): HxWx3 uint8 BGR images, where the RGB
+        image is resized to the size of the thermal image.
+    """
+    if pair_bytes is not None:
+        thermal, rgb = pair_bytes
+        decode = _imdecode
+        thermal_header, rgb_header = io.BytesIO(thermal), io.BytesIO(rgb)
+    else:
+        if rgb_file_name is None:
+            rgb_file_name = rgbt_pairing.FLIR(file_name)
+        thermal, rgb = file_name, rgb_file_name
+        decode = cv2.imread
+        thermal_header, rgb_header = file_name, rgb_file_name
+    # The thermal image is decoded by a thread of the process, e.g. of the data loader
+    # worker, while the RGB image is decoded. cv2 releases the GIL while decoding.
+    thermal_future = get_process_executor("rgbt_decode").submit(decode, thermal)
+    flag = cv2.IMREAD_COLOR
+    if reduced_decode:
+        if image_size is None:
+            with Image.open(thermal_header) as f:
+                image_size = f.size[::-1]
+        flag = _rgb_decode_flag(rgb_header, image_size)
+    rgb_img = decode(rgb, flag)
+    if image_size is not None:
+        # The RGB image is resized while the thermal image is decoded
+        rgb_img = cv2.resize(rgb_img, (image_size[1], image_size[0]))
+    thermal_img = thermal_future.result()
+    if image_size is None:
+        rgb_img = cv2.resize(rgb_img, (thermal_img.shape[1], thermal_img.shape[0]))
+    elif tuple(thermal_img.shape[:2]) != tuple(image_size):
+        raise SizeMismatchError(
+            "Mismatched (H,W) for image {}, got {}, expect {}".format(
+                file_name, thermal_img.shape[:2], tuple(image_size)
+            )
+        )
+    return rgb_img, thermal_img
+
+
+def read_image(
+    file_name,
+    format=None,
+    pair_cache=None,
+    rgb_file_name=None,
+    reduced_decode=False,
+    pair_bytes=None,
+    image_size=None,
+):
     """
     Read an image into the given format.
     Will apply rotation and flipping if the image has such exif information.
 
     Args:
-        file_name (str): image file path
-        format (str): one of the supported image modes in PIL, or "BGR"
+        file_name (str): image file path. The thermal image for "BGRT" and "BGRTTT".
+        format (str): one of the supported image modes in PIL, or "BGR", "BGRT", "BGRTTT"
+        pair_cache (RGBTPairCache or None): if given, "BGRT" and "BGRTTT" images that
+            are in the cache are read from it instead of being decoded.
+        rgb_file_name (str or None): the RGB image paired with `file_name`, for
+            "BGRT" and "BGRTTT". See :func:`read_rgbt_pair`.
+        reduced_decode (bool): see :func:`read_rgbt_pair`.
+        pair_bytes (tuple[bytes] or None): the encoded thermal and RGB images, which
+            are decoded instead of the files. See :func:`read_rgbt_pair`.
+        image_size (tuple or None): the (height, width) of the thermal image.
+            See :func:`read_rgbt_pair`.
 
     Returns:
         image (np.ndarray): an HWC image
     """
-    with PathManager.open(file_name, "rb") as f:
+    if pair_cache is not None and format in ("BGRT", "BGRTTT") and file_name in pair_cache:
+        return pair_cache.read(file_name, format)
+
+    if pair_bytes is not None:
+        f = io.BytesIO(pair_bytes[0])
+    else:
+        f = PathManager.open(file_name, "rb")
+    with f:
+        # Multi-channel images stay uint8, they are converted to float on the device
         if format == "BGRT":
-            folder = file_name.split('thermal_8_bit/')[0]
-            img_name = file_name.split('thermal_8_bit/')[1]
-            img_name = img_name.split('.')[0] + '.jpg'
-            rgb_path = folder + 'RGB/' + img_name
-            rgb_img = cv2.imread(rgb_path)
-            thermal_img = cv2.imread(file_name)
-            rgb_img = cv2.resize(rgb_img,(thermal_img.shape[1], thermal_img.shape[0]))
-            image = np.zeros((thermal_img.shape[0], thermal_img.shape[1], 4))
-            image [:,:,0:3] = rgb_img
-            image [:,:,3] = thermal_img[:,:,0]
+            rgb_img, thermal_img = read_rgbt_pair(
+                file_name, rgb_file_name, reduced_decode, pair_bytes, image_size
+            )
+            image = np.concatenate((rgb_img, thermal_img[:,:,0:1]), axis=2)
         elif format == 'BGRTTT':
-            folder = file_name.split('thermal_8_bit/')[0]
-            img_name = file_name.split('thermal_8_bit/')[1]
-            img_name = img_name.split('.')[0] + '.jpg'
-            rgb_path = folder + 'RGB/' + img_name
-            rgb_img = cv2.imread(rgb_path)
-            thermal_img = cv2.imread(file_name)
-            rgb_img = cv2.resize(rgb_img,(thermal_img.shape[1], thermal_img.shape[0]))
-            image = np.zeros((thermal_img.shape[0], thermal_img.shape[1], 6))
-            image [:,:,0:3] = rgb_img
-            image [:,:,3:6] = thermal_img
+            rgb_img, thermal_img = read_rgbt_pair(
+                file_name, rgb_file_name, reduced_decode, pair_bytes, image_size
+            )
+            image = np.concatenate((rgb_img, thermal_img), axis=2)
         else:
             image = Image.open(f)
 
@@ -95,6 +201,23 @@ def read_image(file_name, format=None):
         return image
 
 
+def get_channel_groups(format):
+    """
+    Args:
+        format (str): an image format of :func:`read_image`.
+
+    Returns:
+        list[list[int]] or None: the channels of each modality of an image in this
+        format, i.e. the RGB and the thermal channels for "BGRT" and "BGRTTT".
+        None for single-modality formats.
+    """
+    if format == "BGRT":
+        return [[0, 1, 2], [3]]
+    if format == "BGRTTT":
+        return [[0, 1, 2], [3, 4, 5]]
+    return None
+
+
 def check_image_size(dataset_dict, image):
     """
     Raise an error if the image does not match the size specified in the dict.
@@ -482,5 +605,15 @@ def build_transform_gen(cfg, is_train):
     tfm_gens.append(T.ResizeShortestEdge(min_size, max_size, sample_style))
     if is_train:
         tfm_gens.append(T.RandomFlip())
+        # Photometric jitter, independent for each modality
+        jitter = cfg.INPUT.MODALITY_JITTER
+        channel_groups = get_channel_groups(cfg.INPUT.FORMAT)
+        for intensity, gen in [
+            (jitter.BRIGHTNESS, T.RandomGroupBrightness),
+            (jitter.CONTRAST, T.RandomGroupContrast),
+            (jitter.SATURATION, T.RandomGroupSaturation),
+        ]:
+            if intensity > 0:
+                tfm_gens.append(gen(1 - intensity, 1 + intensity, channel_groups))
         logger.info("TransformGens used in training: " + str(tfm_gens))
     return tfm_gens
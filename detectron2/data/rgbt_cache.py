@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+A cache of the decoded and aligned RGB-thermal pairs of a dataset.
+
+Reading a "BGRT" or "BGRTTT" image decodes the full resolution RGB JPEG, resizes
+it to the thermal resolution and decodes the thermal JPEG, for every sample of
+every epoch. The cache does it once: the aligned pairs are stored as uint8
+BGRTTT arrays, back to back in one raw file that is memory-mapped by the readers.
+"""
+import json
+import logging
+import multiprocessing as mp
+import numpy as np
+import os
+from fvcore.common.file_io import PathManager
+
+from .detection_utils import read_rgbt_pair
+
+__all__ = ["RGBTPairCache", "build_rgbt_pair_cache"]
+
+_DATA_FILE = "pairs.bin"
+_INDEX_FILE = "index.json"
+_NUM_CHANNELS = 6
+
+
+def _decode_pair(file_names):
+    rgb_img, thermal_img = read_rgbt_pair(*file_names)
+    return np.concatenate([rgb_img, thermal_img], axis=2)
+
+
+def build_rgbt_pair_cache(file_names, cache_dir, num_workers=4, rgb_file_names=None):
+    """
+    Decode the RGB-thermal pair of every image and write them into a cache.
+
+    Args:
+        file_names (list[str]): paths of the thermal images, as the "file_name"
+            of the dataset dicts.
+        cache_dir (str): directory of the cache. Created if it does not exist.
+        num_workers (int): number of processes that decode the pairs.
+        rgb_file_names (list[str] or None): paths of the paired RGB images, as the
+            "rgb_file_name" of the dataset dicts. See
+            :func:`detectron2.data.detection_utils.read_rgbt_pair`.
+    """
+    logger = logging.getLogger(__name__)
+    PathManager.mkdirs(cache_dir)
+    if rgb_file_names is None:
+        rgb_file_names = [None] * len(file_names)
+    pair_names = list(zip(file_names, rgb_file_names))
+    index = {}
+    offset = 0
+    with open(os.path.join(cache_dir, _DATA_FILE), "wb") as f:
+        if num_workers > 0:
+            pool = mp.Pool(num_workers)
+            pairs = pool.imap(_decode_pair, pair_names, chunksize=8)
+        else:
+            pool = None
+            pairs = map(_decode_pair, pair_names)
+        for k, (file_name, pair) in enumerate(zip(file_names, pairs)):
+            pair = np.ascontiguousarray(pair, dtype=np.uint8)
+            pair.tofile(f)
+            index[file_name] = [offset, pair.shape[0], pair.shape[1]]
+            offset += pair.size
+            if (k + 1) % 500 == 0:
+                logger.info("Cached {}/{} RGB-thermal pairs".format(k + 1, len(file_names)))
+        if pool is not None:
+            pool.close()
+            pool.join()
+    with open(os.path.join(cache_dir, _INDEX_FILE), "w") as f:
+        json.dump({"num_channels": _NUM_CHANNELS, "images": index}, f)
+    logger.info("Cached {} RGB-thermal pairs in {}".format(len(index), cache_dir))
+
+
+class RGBTPairCache:
+    """
+    Read-only access to a cache written by :func:`build_rgbt_pair_cache`.
+
+    The data file is memory-mapped lazily, so that each data loader worker maps it
+    in its own process, and the pages are shared by the OS page cache.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): directory of the cache.
+        """
+        cache_dir = PathManager.get_local_path(cache_dir)
+        with open(os.path.join(cache_dir, _INDEX_FILE), "r") as f:
+            meta = json.load(f)
+        assert meta["num_channels"] == _NUM_CHANNELS, meta["num_channels"]
+        self._index = meta["images"]
+        self._data_file = os.path.join(cache_dir, _DATA_FILE)
+        self._data = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, file_name):
+        return file_name in self._index
+
+    def __getstate__(self):
+        # Do not pickle the memory map into the data loader workers
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def read(self, file_name, format="BGRTTT"):
+        """
+        Args:
+            file_name (str): path of the thermal image.
+            format (str): "BGRT" or "BGRTTT".
+
+        Returns:
+            np.ndarray: the uint8 image, as returned by
+            :func:`detectron2.data.detection_utils.read_image`. It is a read-only view
+            of the cache, transforms must not modify it in place.
+        """
+        if self._data is None:
+            self._data = np.memmap(self._data_file, dtype=np.uint8, mode="r")
+        offset, height, width = self._index[file_name]
+        pair = self._data[offset : offset + height * width * _NUM_CHANNELS]
+        pair = pair.reshape(height, width, _NUM_CHANNELS)
+        if format == "BGRT":
+            return pair[:, :, :4]
+        assert format == "BGRTTT", format
+        return pair
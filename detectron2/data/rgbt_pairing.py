@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Pairing of the thermal and RGB images of a multi-modal dataset.
+
+A pairing resolver maps the path of a thermal image to the path of the RGB image
+of the same frame. It is applied once to every dataset dict when the dataset is
+loaded, see :func:`detectron2.data.datasets.register_rgbt_coco_instances`, which
+adds the explicit fields "thermal_file_name" and "rgb_file_name".
+"""
+import os
+
+from detectron2.utils.registry import Registry
+
+__all__ = ["RGBT_PAIRING_REGISTRY", "FLIR", "KAIST", "add_rgbt_file_names"]
+
+RGBT_PAIRING_REGISTRY = Registry("RGBT_PAIRING")
+RGBT_PAIRING_REGISTRY.__doc__ = """
+Registry for RGB-thermal pairing resolvers.
+
+The registered object will be called with `obj(thermal_file_name)`
+and expected to return the file name of the paired RGB image.
+"""
+
+
+@RGBT_PAIRING_REGISTRY.register()
+def FLIR(thermal_file_name):
+    """
+    FLIR ADAS layout: "<split>/thermal_8_bit/<name>.jpeg" is paired with
+    "<split>/RGB/<name>.jpg".
+    """
+    folder, img_name = thermal_file_name.split("thermal_8_bit/")
+    return folder + "RGB/" + img_name.split(".")[0] + ".jpg"
+
+
+@RGBT_PAIRING_REGISTRY.register()
+def KAIST(thermal_file_name):
+    """
+    KAIST multispectral layout: "<set>/<video>/lwir/<name>" is paired with
+    "<set>/<video>/visible/<name>".
+    """
+    folder, img_name = os.path.split(thermal_file_name)
+    root, modality = os.path.split(folder)
+    assert modality == "lwir", "Not a KAIST thermal image: {}".format(thermal_file_name)
+    return os.path.join(root, "visible", img_name)
+
+
+def add_rgbt_file_names(dataset_dicts, pairing):
+    """
+    Add the "thermal_file_name" and "rgb_file_name" of every dataset dict.
+
+    Args:
+        dataset_dicts (list[dict]): dataset dicts whose "file_name" is the thermal image.
+        pairing (str): the name of a resolver in :data:`RGBT_PAIRING_REGISTRY`.
+
+    Returns:
+        list[dict]: the same dataset dicts.
+    """
+    resolve = RGBT_PAIRING_REGISTRY.get(pairing)
+    for d in dataset_dicts:
+        d["thermal_file_name"] = d["file_name"]
+        d["rgb_file_name"] = resolve(d["file_name"])
+    return dataset_dicts
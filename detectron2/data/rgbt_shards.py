@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Sequential shards of a multi-modal training set.
+
+Reading the thermal and RGB JPEGs of every sample with random access is slow on
+network filesystems and spinning disks. The shards pack the encoded images and the
+annotations of the samples into large tar files, in the layout of WebDataset: the
+files of a sample are consecutive and share the same key, e.g. "000000042.json",
+"000000042.thermal.jpeg" and "000000042.rgb.jpg". Training reads the shards
+sequentially, and shuffles the samples with a buffer.
+"""
+import io
+import itertools
+import json
+import logging
+import numpy as np
+import os
+import random
+import tarfile
+import torch.utils.data as data
+from fvcore.common.file_io import PathManager
+
+from detectron2.structures import BoxMode
+from detectron2.utils import comm
+
+__all__ = ["write_rgbt_shards", "RGBTShardDataset"]
+
+_INDEX_FILE = "shards.json"
+
+
+def _add_file(tar, name, content):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+def write_rgbt_shards(dataset_dicts, output_dir, samples_per_shard=256, seed=0):
+    """
+    Write the samples of a dataset into shards.
+
+    Args:
+        dataset_dicts (list[dict]): dataset dicts with "thermal_file_name" and
+            "rgb_file_name", see :func:`detectron2.data.add_rgbt_file_names`.
+        output_dir (str): directory of the shards. Created if it does not exist.
+        samples_per_shard (int): number of samples in a shard. Every data loader worker
+            of every rank reads different shards, so there should be more shards
+            than data loader workers in total.
+        seed (int): the samples are shuffled before they are split into shards, so
+            that every shard has samples from the whole dataset.
+    """
+    logger = logging.getLogger(__name__)
+    PathManager.mkdirs(output_dir)
+    order = np.random.RandomState(seed).permutation(len(dataset_dicts))
+    shards = []
+    for start in range(0, len(order), samples_per_shard):
+        shard_name = "shard-{:05d}.tar".format(len(shards))
+        indices = order[start : start + samples_per_shard]
+        with PathManager.open(os.path.join(output_dir, shard_name), "wb") as f:
+            with tarfile.open(fileobj=f, mode="w") as tar:
+                for idx in indices:
+                    d = dataset_dicts[idx]
+                    key = "{:09d}".format(idx)
+                    _add_file(tar, key + ".json", json.dumps(d).encode("utf-8"))
+                    for modality in ("thermal", "rgb"):
+                        file_name = d[modality + "_file_name"]
+                        with PathManager.open(file_name, "rb") as image_file:
+                            content = image_file.read()
+                        ext = os.path.splitext(file_name)[1]
+                        _add_file(tar, "{}.{}{}".format(key, modality, ext), content)
+        shards.append({"file_name": shard_name, "num_samples": len(indices)})
+        logger.info(
+            "Wrote {} ({}/{} samples)".format(shard_name, start + len(indices), len(order))
+        )
+
+    with PathManager.open(os.path.join(output_dir, _INDEX_FILE), "w") as f:
+        json.dump({"num_samples": len(order), "shards": shards}, f)
+
+
+def _read_shard(file_name):
+    """
+    Yield the samples of a shard, in order.
+    """
+    with PathManager.open(file_name, "rb") as f:
+        # Stream mode: the shard is read sequentially
+        with tarfile.open(fileobj=f, mode="r|") as tar:
+            sample, sample_key = {}, None
+            for member in tar:
+                key, field = member.name.split(".", 1)
+                if key != sample_key:
+                    if sample:
+                        yield sample
+                    sample, sample_key = {}, key
+                sample[field.split(".")[0]] = tar.extractfile(member).read()
+            if sample:
+                yield sample
+
+
+def _decode_sample(sample):
+    dataset_dict = json.loads(sample["json"].decode("utf-8"))
+    for anno in dataset_dict.get("annotations", []):
+        anno["bbox_mode"] = BoxMode(anno["bbox_mode"])
+    dataset_dict["rgbt_bytes"] = (sample["thermal"], sample["rgb"])
+    return dataset_dict
+
+
+class RGBTShardDataset(data.IterableDataset):
+    """
+    An infinite stream of the dataset dicts of shards written by :func:`write_rgbt_shards`.
+
+    As with :class:`detectron2.data.samplers.TrainingSampler`, the stream is a sequence
+    of shuffled epochs, and every rank produces different samples. Every epoch, the order
+    of the shards is shuffled with a seed shared by all ranks, and the shards are split
+    among the data loader workers of all ranks. Each worker reads its shards sequentially
+    and shuffles their samples with a buffer.
+
+    The dataset dicts have the encoded images in "rgbt_bytes", which
+    :class:`detectron2.data.DatasetMapper` decodes instead of reading the files.
+    """
+
+    def __init__(self, shard_dir, shuffle=True, shuffle_buffer=1000, seed=None):
+        """
+        Args:
+            shard_dir (str): directory of the shards.
+            shuffle (bool): whether to shuffle the shards and the samples.
+            shuffle_buffer (int): number of samples buffered by each worker to shuffle them.
+            seed (int): the initial seed of the shuffle. Must be the same across all
+                ranks. If None, will use a random seed shared among ranks.
+        """
+        with PathManager.open(os.path.join(shard_dir, _INDEX_FILE), "r") as f:
+            index = json.load(f)
+        self._shards = [os.path.join(shard_dir, s["file_name"]) for s in index["shards"]]
+        self._num_samples = index["num_samples"]
+        assert len(self._shards) > 0, "No shards in {}!".format(shard_dir)
+        self._shuffle = shuffle
+        self._shuffle_buffer = shuffle_buffer
+        if seed is None:
+            seed = comm.shared_random_seed()
+        self._seed = int(seed)
+        self._rank = comm.get_rank()
+        self._world_size = comm.get_world_size()
+
+    def __len__(self):
+        # The number of samples in an epoch, over all ranks
+        return self._num_samples
+
+    def _consumer(self):
+        """
+        Returns:
+            int, int: the index of this data loader worker among the workers of all
+            ranks, and the number of workers of all ranks.
+        """
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            num_workers, worker_id = 1, 0
+        else:
+            num_workers, worker_id = worker_info.num_workers, worker_info.id
+        return self._rank * num_workers + worker_id, self._world_size * num_workers
+
+    def _epoch_samples(self, epoch, consumer, num_consumers):
+        num_shards = len(self._shards)
+        if self._shuffle:
+            order = np.random.RandomState(self._seed + epoch).permutation(num_shards)
+        else:
+            order = np.arange(num_shards)
+        if num_shards >= num_consumers:
+            for pos in range(consumer, num_shards, num_consumers):
+                yield from _read_shard(self._shards[order[pos]])
+        else:
+            # Fewer shards than consumers: the consumers that share a shard take
+            # every k-th of its samples
+            pos = consumer % num_shards
+            readers = len(range(pos, num_consumers, num_shards))
+            shard = _read_shard(self._shards[order[pos]])
+            yield from itertools.islice(shard, consumer // num_shards, None, readers)
+
+    def __iter__(self):
+        consumer, num_consumers = self._consumer()
+        if len(self._shards) < num_consumers and consumer == 0:
+            logging.getLogger(__name__).warning(
+                "{} shards are shared by {} data loader workers, "
+                "write smaller shards to read them sequentially.".format(
+                    len(self._shards), num_consumers
+                )
+            )
+        rng = random.Random(self._seed * 1000003 + consumer)
+        buffer = []
+        for epoch in itertools.count():
+            for sample in self._epoch_samples(epoch, consumer, num_consumers):
+                if not self._shuffle:
+                    yield _decode_sample(sample)
+                    continue
+                if len(buffer) < self._shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                idx = rng.randrange(len(buffer))
+                buffer[idx], sample = sample, buffer[idx]
+                yield _decode_sample(sample)
@@ -8,7 +8,7 @@ from PIL import Image
 import cv2
 import pdb
 
-__all__ = ["ExtentTransform", "ResizeTransform"]
+__all__ = ["ChannelBlendTransform", "ExtentTransform", "ResizeTransform"]
 
 
 class ExtentTransform(Transform):
@@ -83,7 +83,7 @@ class ResizeTransform(Transform):
             ret = cv2.resize(img, (self.new_w, self.new_h))
         elif img.shape[-1] == 6:
             import numpy as np
-            ret = np.zeros((self.new_h, self.new_w, 6))
+            ret = np.empty((self.new_h, self.new_w, 6), dtype=img.dtype)
             ret[:,:,0:3] = cv2.resize(img[:,:,0:3], (self.new_w, self.new_h))
             ret[:,:,3:6] = cv2.resize(img[:,:,3:6], (self.new_w, self.new_h))
         elif img.shape[-1] == 2:
@@ -115,6 +115,39 @@ class ResizeTransform(Transform):
         return segmentation
 
 
+class ChannelBlendTransform(Transform):
+    """
+    Blend every channel of an image with a source image, with per-channel weights:
+    ``src_weight[c] * src_image[..., c] + dst_weight[c] * img[..., c]``.
+
+    It generalizes :class:`BlendTransform` to images with any number of channels,
+    e.g. to change the RGB and the thermal channels of a multi-modal image differently.
+    """
+
+    def __init__(self, src_image, src_weight, dst_weight):
+        """
+        Args:
+            src_image (ndarray): an array broadcastable to the (H, W, C) image.
+            src_weight (ndarray): the weights of `src_image`, of shape (C,).
+            dst_weight (ndarray): the weights of the image, of shape (C,).
+        """
+        super().__init__()
+        self._set_attributes(locals())
+
+    def apply_image(self, img, interp=None):
+        if img.dtype == np.uint8:
+            img = img.astype(np.float32)
+            img = self.src_weight * self.src_image + self.dst_weight * img
+            return np.clip(img, 0, 255).astype(np.uint8)
+        return self.src_weight * self.src_image + self.dst_weight * img
+
+    def apply_coords(self, coords):
+        return coords
+
+    def apply_segmentation(self, segmentation):
+        return segmentation
+
+
 def HFlip_rotated_box(transform, rotated_boxes):
     """
     Apply the horizontal flip transform on rotated boxes.
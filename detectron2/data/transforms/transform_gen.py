@@ -18,7 +18,7 @@ from fvcore.transforms.transform import (
 )
 from PIL import Image
 
-from .transform import ExtentTransform, ResizeTransform
+from .transform import ChannelBlendTransform, ExtentTransform, ResizeTransform
 
 __all__ = [
     "RandomBrightness",
@@ -26,6 +26,9 @@ __all__ = [
     "RandomCrop",
     "RandomExtent",
     "RandomFlip",
+    "RandomGroupBrightness",
+    "RandomGroupContrast",
+    "RandomGroupSaturation",
     "RandomSaturation",
     "RandomLighting",
     "Resize",
@@ -414,6 +417,93 @@ class RandomLighting(TransformGen):
         )
 
 
+class _ChannelGroupTransformGen(TransformGen):
+    """
+    Base class of the transform gens that change the channel groups of an image,
+    e.g. the RGB and the thermal channels of a "BGRT" or "BGRTTT" image, independently.
+    Each gen returns a single :class:`ChannelBlendTransform`, applied to all the
+    channels at once.
+    """
+
+    def __init__(self, intensity_min, intensity_max, channel_groups=None):
+        """
+        Args:
+            intensity_min (float or list[float]): Minimum augmentation, or one per group.
+            intensity_max (float or list[float]): Maximum augmentation, or one per group.
+            channel_groups (list[list[int]] or None): the channels of each group. Channels
+                in no group are not changed. None means that all the channels form one group.
+                See :func:`detectron2.data.detection_utils.get_channel_groups`.
+        """
+        super().__init__()
+        self._init(locals())
+
+    def _get_groups(self, img):
+        if self.channel_groups is None:
+            return [list(range(img.shape[-1] if img.ndim == 3 else 1))]
+        return self.channel_groups
+
+    def _sample(self, groups):
+        low = np.broadcast_to(self.intensity_min, (len(groups),))
+        high = np.broadcast_to(self.intensity_max, (len(groups),))
+        return np.random.uniform(low, high)
+
+    @staticmethod
+    def _per_channel(img, groups, values, default=1.0):
+        ret = np.full(img.shape[-1] if img.ndim == 3 else 1, default, dtype=np.float32)
+        for group, value in zip(groups, values):
+            ret[group] = value
+        return ret
+
+
+class RandomGroupBrightness(_ChannelGroupTransformGen):
+    """
+    Randomly transforms the brightness of each channel group, as :class:`RandomBrightness`.
+    """
+
+    def get_transform(self, img):
+        groups = self._get_groups(img)
+        w = self._per_channel(img, groups, self._sample(groups))
+        return ChannelBlendTransform(src_image=0, src_weight=1 - w, dst_weight=w)
+
+
+class RandomGroupContrast(_ChannelGroupTransformGen):
+    """
+    Randomly transforms the contrast of each channel group, as :class:`RandomContrast`.
+    Each group is blended with its own mean intensity.
+    """
+
+    def get_transform(self, img):
+        groups = self._get_groups(img)
+        w = self._per_channel(img, groups, self._sample(groups))
+        if img.ndim == 2:
+            means = [img.mean()]
+        else:
+            means = [img[:, :, group].mean() for group in groups]
+        mean = self._per_channel(img, groups, means, default=0.0)
+        return ChannelBlendTransform(src_image=mean, src_weight=1 - w, dst_weight=w)
+
+
+class RandomGroupSaturation(_ChannelGroupTransformGen):
+    """
+    Randomly transforms the saturation of the first channel group, as
+    :class:`RandomSaturation`. The first group is the color group, in BGR order, as
+    the RGB channels of the "BGRT" and "BGRTTT" formats. Other groups, e.g. the
+    thermal channels, are not changed.
+    """
+
+    def get_transform(self, img):
+        assert img.ndim == 3, "Saturation only works on color images"
+        groups = self._get_groups(img)
+        color_group = groups[0]
+        assert len(color_group) == 3, "Saturation only works on BGR channels"
+        # The intensities can be given per group, the first one is of the color group
+        w = self._per_channel(img, [color_group], self._sample(groups)[:1])
+        grayscale = img.astype(np.float32)
+        luma = img[:, :, color_group].dot([0.114, 0.587, 0.299])
+        grayscale[:, :, color_group] = luma[:, :, np.newaxis]
+        return ChannelBlendTransform(src_image=grayscale, src_weight=1 - w, dst_weight=w)
+
+
 def apply_transform_gens(transform_gens, img):
     """
     Apply a list of :class:`TransformGen` on the input image, and
@@ -13,7 +13,8 @@ import argparse
 import logging
 import os
 import sys
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from fvcore.common.file_io import PathManager
 from fvcore.nn.precise_bn import get_bn_modules
@@ -43,7 +44,13 @@ from detectron2.utils.logger import setup_logger
 from . import hooks
 from .train_loop import SimpleTrainer
 
-__all__ = ["default_argument_parser", "default_setup", "DefaultPredictor", "DefaultTrainer"]
+__all__ = [
+    "default_argument_parser",
+    "default_setup",
+    "DefaultPredictor",
+    "BatchPredictor",
+    "DefaultTrainer",
+]
 
 
 def default_argument_parser():
@@ -185,18 +192,99 @@ class DefaultPredictor:
                 See :doc:`/tutorials/models` for details about the format.
         """
         with torch.no_grad():  # https://github.com/sphinx-doc/sphinx/issues/4258
-            # Apply pre-processing to image.
-            if self.input_format == "RGB":
-                # whether the model expects BGR inputs or RGB
-                original_image = original_image[:, :, ::-1]
-            height, width = original_image.shape[:2]
-            image = self.transform_gen.get_transform(original_image).apply_image(original_image)
-            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
-
-            inputs = {"image": image, "height": height, "width": width}
+            inputs = self._preprocess(original_image)
             predictions = self.model([inputs])[0]
             return predictions
 
+    def _preprocess(self, original_image):
+        """
+        Convert one image into the input format of the model.
+        """
+        # Apply pre-processing to image.
+        if self.input_format == "RGB":
+            # whether the model expects BGR inputs or RGB
+            original_image = original_image[:, :, ::-1]
+        height, width = original_image.shape[:2]
+        image = self.transform_gen.get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+        return {"image": image, "height": height, "width": width}
+
+
+class BatchPredictor(DefaultPredictor):
+    """
+    Like :class:`DefaultPredictor`, but takes a list of images and runs the model
+    on batches of them.
+
+    Images are resized in a pool of threads, so the pre-processing of the next
+    batches overlaps with the forward of the current one. The pool stays at most two
+    batches ahead of the model. The outputs are returned as produced by the model, on
+    the model's device, and are not converted further.
+
+    Examples:
+
+    .. code-block:: python
+
+        with BatchPredictor(cfg, batch_size=8) as pred:
+            outputs = pred([cv2.imread(f) for f in files])
+    """
+
+    def __init__(self, cfg, batch_size=8, num_workers=4):
+        """
+        Args:
+            cfg (CfgNode):
+            batch_size (int): the number of images in one forward of the model.
+            num_workers (int): the number of threads that pre-process the images.
+        """
+        super().__init__(cfg)
+        assert batch_size > 0, batch_size
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max(num_workers, 1))
+
+    def __call__(self, original_images):
+        """
+        Args:
+            original_images (list[np.ndarray]): images of shape (H, W, C) (in BGR order).
+                They can have different sizes and any number of channels supported
+                by `cfg.INPUT.FORMAT`.
+
+        Returns:
+            list[dict]: the output of the model for each image, in the same order.
+        """
+        # The pool works ahead of the model, in the order of the images, with at most
+        # two batches of pre-processed images waiting
+        images = iter(original_images)
+        pending = deque()
+
+        def submit():
+            while len(pending) < 2 * self.batch_size:
+                try:
+                    image = next(images)
+                except StopIteration:
+                    return
+                pending.append(self._executor.submit(self._preprocess, image))
+
+        predictions = []
+        with torch.no_grad():
+            submit()
+            while pending:
+                num_images = min(self.batch_size, len(pending))
+                batch = [pending.popleft().result() for _ in range(num_images)]
+                submit()
+                predictions.extend(self.model(batch))
+        return predictions
+
+    def close(self):
+        """
+        Shut down the pre-processing threads.
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class DefaultTrainer(SimpleTrainer):
     """
@@ -1,7 +1,5 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
-import contextlib
 import copy
-import io
 import itertools
 import json
 import logging
@@ -18,7 +16,7 @@ from tabulate import tabulate
 
 import detectron2.utils.comm as comm
 from detectron2.data import MetadataCatalog
-from detectron2.data.datasets.coco import convert_to_coco_json
+from detectron2.data.datasets.coco import convert_to_coco_json, load_coco_api
 from detectron2.structures import Boxes, BoxMode, pairwise_iou
 from detectron2.utils.logger import create_small_table
 
@@ -67,9 +65,11 @@ class COCOEvaluator(DatasetEvaluator):
             self._metadata.json_file = cache_path
             convert_to_coco_json(dataset_name, cache_path)
 
-        json_file = PathManager.get_local_path(self._metadata.json_file)
-        with contextlib.redirect_stdout(io.StringIO()):
-            self._coco_api = COCO(json_file)
+        self._coco_api = load_coco_api(
+            self._metadata.json_file,
+            cache=self._metadata.get("annotation_cache", False),
+            coco_cls=COCO,
+        )
 
         self._kpt_oks_sigmas = cfg.TEST.KEYPOINT_OKS_SIGMAS
         # Test set json files do not contain annotations (evaluation must be
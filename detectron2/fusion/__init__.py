@@ -0,0 +1,26 @@
+from .proben import (
+    BAYESIAN_METHODS,
+    FUSION_METHODS,
+    LOGITS_METHODS,
+    batched_proben_fusion,
+    cluster_detections,
+    fuse_clusters,
+    pad_detections,
+    proben_fusion,
+)
+from .late_fusion import LATE_FUSION_METHODS, fuse_detections
+from .paired_inputs import INPUT_VIEWS, PairedFrame, multi_predictor_stream, read_image_pair
+from .prediction_store import PredictionStore, PredictionStoreWriter
+from .sharded import load_image_sizes, sharded_late_fusion
+from .streaming import (
+    evaluate_stream,
+    instances_to_record,
+    multi_head_predictor_streams,
+    predictor_stream,
+    read_prediction_lines,
+    stream_late_fusion,
+    write_prediction_line,
+)
+from .sweep import FusionClusterCache, format_sweep_table, sweep_late_fusion
+
+__all__ = [k for k in globals().keys() if not k.startswith("_")]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Late fusion of the detections of an arbitrary number of detectors on one image.
+"""
+import torch
+
+from detectron2.layers import batched_nms
+
+from .proben import FUSION_METHODS, proben_fusion
+
+__all__ = ["LATE_FUSION_METHODS", "fuse_detections"]
+
+# "nms" keeps the highest scoring detection of every cluster,
+# "pooling" keeps all detections.
+LATE_FUSION_METHODS = ("nms", "pooling") + FUSION_METHODS
+
+
+def _cat(detections, name, dtype):
+    """
+    Concatenate one field of all detections into a (R, D) tensor.
+    Returns None if a detector does not provide the field.
+    """
+    if any(d.get(name) is None for d in detections):
+        return None
+    return torch.cat(
+        [torch.as_tensor(d[name], dtype=dtype).reshape(len(d["scores"]), -1) for d in detections]
+    )
+
+
+def fuse_detections(
+    detections, weights=None, method="bayesian", iou_threshold=0.5, class_prior=None
+):
+    """
+    Fuse the detections of several detectors on one image.
+
+    Detectors that did not fire, or did not run, on the image are marginalized out:
+    under the conditional independence assumption of ProbEn, a missing detector
+    multiplies the posterior of every class by the same factor, so every cluster
+    is fused from the detectors that actually fired on it. Therefore the cost only
+    grows with the total number of detections, and there is no special case for
+    each subset of detectors. As in the original ProbEn evaluation, detections
+    are returned unchanged when at most one detector fired on the image.
+
+    Args:
+        detections (list[dict or None]): the detections of each detector, as a dict with
+            keys "boxes" (Rx4), "scores" (R), "classes" (R) and optionally "probs" (RxK),
+            "logits" (Rx(K+1)). Values can be lists, arrays or tensors.
+            None for a detector that did not run on the image.
+        weights (list[float] or None): one weight per detector, see
+            :func:`detectron2.fusion.fuse_clusters`. Defaults to 1 for every detector.
+        method (str): one of :data:`LATE_FUSION_METHODS`.
+        iou_threshold (float): IoU threshold used to match the detections.
+        class_prior: see :func:`detectron2.fusion.fuse_clusters`.
+
+    Returns:
+        boxes (Tensor): Mx4 fused boxes.
+        scores (Tensor): M fused scores.
+        classes (Tensor): M classes.
+    """
+    assert method in LATE_FUSION_METHODS, "Unknown fusion method {}!".format(method)
+    if weights is None:
+        weights = [1.0] * len(detections)
+    assert len(weights) == len(detections)
+
+    fired = [
+        (d, w) for d, w in zip(detections, weights) if d is not None and len(d["scores"]) > 0
+    ]
+    if len(fired) == 0:
+        return (
+            torch.zeros(0, 4, dtype=torch.float64),
+            torch.zeros(0, dtype=torch.float64),
+            torch.zeros(0, dtype=torch.int64),
+        )
+    detections = [d for d, _ in fired]
+    boxes = _cat(detections, "boxes", torch.float64)
+    scores = _cat(detections, "scores", torch.float64)[:, 0]
+    classes = _cat(detections, "classes", torch.int64)[:, 0]
+    if len(fired) == 1 or method == "pooling":
+        return boxes, scores, classes
+
+    if method == "nms":
+        keep = batched_nms(boxes.float(), scores.float(), classes, iou_threshold)
+        return boxes[keep], scores[keep], classes[keep]
+
+    weights = torch.cat(
+        [torch.full((len(d["scores"]),), w, dtype=torch.float64) for d, w in fired]
+    )
+    boxes, scores, classes, _ = proben_fusion(
+        boxes,
+        scores,
+        classes,
+        probs=_cat(detections, "probs", torch.float64),
+        logits=_cat(detections, "logits", torch.float64),
+        weights=weights,
+        method=method,
+        iou_threshold=iou_threshold,
+        class_prior=class_prior,
+    )
+    return boxes, scores, classes
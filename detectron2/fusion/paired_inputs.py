@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Run several detectors on the same RGB-thermal frames in a single pass.
+
+Each frame is decoded once, and the inputs of all the detectors are built from
+the decoded pair: the 4 (BGRT) and 6 (BGRTTT) channel inputs are views into one
+shared buffer, instead of being rebuilt from the JPEG files by every model.
+"""
+import cv2
+import itertools
+import numpy as np
+
+from .streaming import instances_to_record
+
+__all__ = ["INPUT_VIEWS", "PairedFrame", "read_image_pair", "multi_predictor_stream"]
+
+# The inputs of the detectors used for late fusion, by the name of the model
+# in `demo/save_predictions.py`, and the number of channels of each.
+INPUT_VIEWS = {"RGB": 3, "thermal_only": 3, "early_fusion": 4, "mid_fusion": 6}
+
+
+def read_image_pair(rgb_file, thermal_file):
+    """
+    Decode the RGB and thermal images of a frame.
+
+    Args:
+        rgb_file (str):
+        thermal_file (str):
+
+    Returns:
+        PairedFrame
+    """
+    rgb = cv2.imread(rgb_file)
+    thermal = cv2.imread(thermal_file)
+    assert rgb is not None, "Cannot read {}!".format(rgb_file)
+    assert thermal is not None, "Cannot read {}!".format(thermal_file)
+    return PairedFrame(rgb, thermal)
+
+
+class PairedFrame:
+    """
+    The decoded RGB and thermal images of one frame, and the inputs of the
+    detectors built from them.
+
+    The RGB image is resized to the thermal resolution and packed with the thermal
+    image into one HxWx6 BGRTTT buffer the first time a fused input is needed.
+    The BGRT input is the first 4 channels of that buffer, so no other copy is made.
+    """
+
+    def __init__(self, rgb, thermal):
+        """
+        Args:
+            rgb (ndarray): HxWx3 BGR image, at its own resolution.
+            thermal (ndarray): HxWx3 thermal image, as decoded by `cv2.imread`.
+        """
+        self.rgb = rgb
+        self.thermal = thermal
+        self._buffer = None
+
+    def _fused_buffer(self):
+        if self._buffer is None:
+            height, width = self.thermal.shape[:2]
+            # Default (bilinear) interpolation, as in `detection_utils.read_image`
+            rgb = cv2.resize(self.rgb, (width, height))
+            # uint8, as the inputs that the fusion models are trained with
+            self._buffer = np.empty((height, width, 6), dtype=np.uint8)
+            self._buffer[:, :, 0:3] = rgb
+            self._buffer[:, :, 3:6] = self.thermal
+        return self._buffer
+
+    def view(self, name):
+        """
+        Args:
+            name (str): one of :data:`INPUT_VIEWS`.
+
+        Returns:
+            ndarray: the input of the detector, without copying the frame.
+        """
+        assert name in INPUT_VIEWS, "Unknown input {}!".format(name)
+        if name == "RGB":
+            return self.rgb
+        if name == "thermal_only":
+            return self.thermal
+        return self._fused_buffer()[:, :, : INPUT_VIEWS[name]]
+
+
+def multi_predictor_stream(predictors, frames, batch_size=None):
+    """
+    Run all detectors on every frame and yield their records together.
+
+    Args:
+        predictors (dict[str, tuple(str, callable)]): maps the name of each detector
+            to its input (one of :data:`INPUT_VIEWS`) and its predictor, e.g. a
+            :class:`detectron2.engine.DefaultPredictor`.
+        frames (iterable[tuple]): (frame, image_id, file_name) triplets, where frame
+            is a :class:`PairedFrame`. Frames are decoded lazily if this is a generator.
+        batch_size (int or None): if given, the predictors take a list of images and
+            return a list of outputs, e.g. :class:`detectron2.engine.BatchPredictor`,
+            and are called on this many frames at a time.
+
+    Yields:
+        dict[str, dict]: the record of each detector on one frame, see
+        :mod:`detectron2.fusion.streaming`.
+    """
+    if batch_size is None:
+        for frame, image_id, file_name in frames:
+            records = {}
+            for name, (view, predictor) in predictors.items():
+                instances = predictor(frame.view(view))["instances"]
+                records[name] = instances_to_record(instances, image_id, file_name)
+            yield records
+        return
+
+    frames = iter(frames)
+    while True:
+        batch = list(itertools.islice(frames, batch_size))
+        if not batch:
+            return
+        outputs = {
+            name: predictor([frame.view(view) for frame, _, _ in batch])
+            for name, (view, predictor) in predictors.items()
+        }
+        for k, (_, image_id, file_name) in enumerate(batch):
+            yield {
+                name: instances_to_record(outputs[name][k]["instances"], image_id, file_name)
+                for name in predictors
+            }
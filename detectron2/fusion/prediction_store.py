@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+A compact, columnar on-disk format for the predictions of a detector on a split.
+
+A store is a directory with one raw binary file per column ("boxes", "scores",
+"classes" and optionally "class_logits", "probs") holding the detections of all
+images back to back, an "index.npz" with the offsets of every image in the
+columns, and a "meta.json" with the dtypes of the columns and the file names.
+Columns are memory-mapped, so any image can be read without parsing the whole split.
+"""
+import json
+import numpy as np
+import os
+import torch
+from fvcore.common.file_io import PathManager
+
+__all__ = ["PredictionStore", "PredictionStoreWriter"]
+
+# name -> dtype on disk. The first three columns are required.
+_COLUMNS = {
+    "boxes": np.float32,
+    "scores": np.float32,
+    "classes": np.int32,
+    "class_logits": np.float32,
+    "probs": np.float32,
+}
+_ONE_DIM_COLUMNS = ("scores", "classes")
+
+
+class PredictionStoreWriter:
+    """
+    Write per-image prediction records (see :mod:`detectron2.fusion.streaming`)
+    into a store. Detections are appended to the column files as they are added,
+    so memory does not grow with the number of images.
+
+    Examples:
+
+    .. code-block:: python
+
+        with PredictionStoreWriter("out/val_mid_fusion") as writer:
+            for record in records:
+                writer.add(record)
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): the directory of the store. Created if it does not exist.
+        """
+        PathManager.mkdirs(store_dir)
+        self._store_dir = store_dir
+        self._files = None
+        self._widths = {}
+        self._offsets = [0]
+        self._image_ids = []
+        self._image_sizes = []
+        self._file_names = []
+
+    def add(self, record):
+        """
+        Args:
+            record (dict): the predictions on one image, with keys "image_id", "height",
+                "width", "boxes", "scores", "classes" and optionally "image",
+                "class_logits", "probs". Values can be lists, arrays or tensors.
+                All records must have the same optional columns.
+        """
+        if self._files is None:
+            names = [n for n in _COLUMNS if record.get(n) is not None]
+            self._files = {
+                n: open(os.path.join(self._store_dir, n + ".bin"), "wb") for n in names
+            }
+        num_dets = len(record["scores"])
+        for name, f in self._files.items():
+            assert record.get(name) is not None, "Record {} has no {}!".format(
+                record["image_id"], name
+            )
+            value = record[name]
+            if isinstance(value, torch.Tensor):
+                value = value.cpu().numpy()
+            value = np.ascontiguousarray(value, dtype=_COLUMNS[name])
+            if num_dets == 0:
+                continue
+            if name not in _ONE_DIM_COLUMNS:
+                value = value.reshape(num_dets, -1)
+                width = self._widths.setdefault(name, value.shape[1])
+                assert value.shape[1] == width, "Inconsistent width of {}!".format(name)
+            value.tofile(f)
+
+        self._offsets.append(self._offsets[-1] + num_dets)
+        self._image_ids.append(record["image_id"])
+        self._image_sizes.append((record["height"], record["width"]))
+        self._file_names.append(record.get("image"))
+
+    def close(self):
+        """
+        Write the index of the store. Must be called after the last record is added.
+        """
+        for f in (self._files or {}).values():
+            f.close()
+        columns = {}
+        for name in self._files or {}:
+            width = None if name in _ONE_DIM_COLUMNS else self._widths.get(name, 0)
+            columns[name] = [np.dtype(_COLUMNS[name]).str, width]
+        with open(os.path.join(self._store_dir, "meta.json"), "w") as f:
+            json.dump({"columns": columns, "file_names": self._file_names}, f)
+        np.savez(
+            os.path.join(self._store_dir, "index.npz"),
+            offsets=np.asarray(self._offsets, dtype=np.int64),
+            image_ids=np.asarray(self._image_ids, dtype=np.int64),
+            image_sizes=np.asarray(self._image_sizes, dtype=np.int64).reshape(-1, 2),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PredictionStore:
+    """
+    Read-only, random access to a store written by :class:`PredictionStoreWriter`.
+
+    Indexing returns a record whose detections are zero-copy views of the
+    memory-mapped columns. Iterating over the store yields the records in the
+    order they were written, so a store can be used as a stream of
+    :func:`detectron2.fusion.stream_late_fusion`.
+
+    Attributes:
+        offsets (ndarray): N+1 offsets of the detections of every image in the columns.
+        image_ids (ndarray): N image ids.
+        image_sizes (ndarray): Nx2 (height, width) of every image.
+        file_names (list[str]): N file names.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): the directory of a store.
+        """
+        store_dir = PathManager.get_local_path(store_dir)
+        with open(os.path.join(store_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        index = np.load(os.path.join(store_dir, "index.npz"))
+        self.offsets = index["offsets"]
+        self.image_ids = index["image_ids"]
+        self.image_sizes = index["image_sizes"]
+        self.file_names = meta["file_names"]
+        self._id_to_index = {image_id: i for i, image_id in enumerate(self.image_ids.tolist())}
+
+        num_dets = int(self.offsets[-1])
+        self._columns = {}
+        for name, (dtype, width) in meta["columns"].items():
+            shape = (num_dets,) if width is None else (num_dets, width)
+            if num_dets == 0:
+                # np.memmap does not support empty files
+                self._columns[name] = np.zeros(shape, dtype=dtype)
+            else:
+                # Copy-on-write, so that the views can be wrapped in tensors. The file
+                # is never modified.
+                path = os.path.join(store_dir, name + ".bin")
+                self._columns[name] = np.memmap(path, dtype=dtype, mode="c", shape=shape)
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    def __getitem__(self, idx):
+        """
+        Args:
+            idx (int): the index of an image in the store.
+
+        Returns:
+            dict: the record of the image.
+        """
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        record = {
+            "image": self.file_names[idx],
+            "image_id": int(self.image_ids[idx]),
+            "height": int(self.image_sizes[idx, 0]),
+            "width": int(self.image_sizes[idx, 1]),
+        }
+        for name, column in self._columns.items():
+            record[name] = column[start:end]
+        return record
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get(self, image_id):
+        """
+        Returns:
+            dict: the record of the image with the given id.
+        """
+        return self[self._id_to_index[image_id]]
+
+    def pad(self, indices=None):
+        """
+        Gather the detections of several images into padded tensors, without going
+        through per-image records.
+
+        Args:
+            indices (list[int] or None): the indices of the images. Defaults to all images.
+
+        Returns:
+            dict: in the format of :func:`detectron2.fusion.pad_detections`.
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        max_dets = int(lengths.max()) if len(indices) > 0 else 0
+        valid = np.arange(max_dets)[None, :] < lengths[:, None]
+        rows = (starts[:, None] + np.arange(max_dets)[None, :])[valid]
+
+        padded = {"valid": torch.from_numpy(valid)}
+        for name, column in self._columns.items():
+            dtype = np.int64 if name == "classes" else np.float64
+            out = np.zeros(valid.shape + column.shape[1:], dtype=dtype)
+            out[valid] = column[rows]
+            padded["logits" if name == "class_logits" else name] = torch.from_numpy(out)
+        return padded
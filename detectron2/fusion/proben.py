@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized implementation of ProbEn late fusion.
+
+Detections of several detectors are first grouped into clusters with a greedy,
+score-ordered, per-class NMS. Every cluster is then fused into one detection.
+The detections of each image and class are clustered together, and all clusters
+are fused at once with tensor ops, instead of looping over the kept boxes in Python.
+"""
+import torch
+from torch.nn import functional as F
+
+from detectron2.structures import Boxes, Instances
+
+__all__ = [
+    "FUSION_METHODS",
+    "BAYESIAN_METHODS",
+    "LOGITS_METHODS",
+    "cluster_detections",
+    "fuse_clusters",
+    "proben_fusion",
+    "pad_detections",
+    "batched_proben_fusion",
+]
+
+# Fusion methods that combine the per-class probabilities of a cluster
+BAYESIAN_METHODS = (
+    "avg_score",
+    "bayesian",
+    "baysian_avg_bbox",
+    "bayesian_wt_score_box",
+    "bayesian_prior_wt_score_box",
+)
+# Fusion methods that combine the raw class logits of a cluster
+LOGITS_METHODS = ("avgLogits_softmax", "sumLogits_softmax")
+FUSION_METHODS = BAYESIAN_METHODS + LOGITS_METHODS
+
+
+def _pairwise_iou_inclusive(boxes):
+    """
+    IoU between all pairs of boxes, using the "+1" pixel-inclusive convention of the
+    original ProbEn implementation to compute widths and heights.
+
+    Args:
+        boxes (Tensor): (..., M, 4) boxes in (x1, y1, x2, y2) format.
+
+    Returns:
+        Tensor: (..., M, M) IoU matrices.
+    """
+    area = (boxes[..., 2] - boxes[..., 0] + 1) * (boxes[..., 3] - boxes[..., 1] + 1)
+    lt = torch.max(boxes[..., :, None, :2], boxes[..., None, :, :2])
+    rb = torch.min(boxes[..., :, None, 2:], boxes[..., None, :, 2:])
+    wh = (rb - lt + 1).clamp(min=0)
+    inter = wh[..., 0] * wh[..., 1]
+    return inter / (area[..., :, None] + area[..., None, :] - inter)
+
+
+def _cluster_sorted(boxes, valid, iou_threshold):
+    """
+    Greedy clustering of groups of detections of the same image and class.
+
+    Args:
+        boxes (Tensor): (G, M) groups of padded boxes. The detections of each group
+            are sorted by decreasing score.
+        valid (Tensor): (G, M) bool, False for padding.
+        iou_threshold (float):
+
+    Returns:
+        Tensor: (G, M) position of the leader of the cluster of each detection in its
+        group. M for padding.
+    """
+    num_dets = valid.shape[1]
+    # overlap[g, i, j]: detection i (higher score) would absorb detection j
+    overlap = _pairwise_iou_inclusive(boxes) > iou_threshold
+    overlap &= valid[:, :, None] & valid[:, None, :]
+    overlap = overlap.triu(diagonal=1)
+
+    # A detection leads a cluster iff no earlier leader overlaps it. The recurrence
+    # only depends on earlier detections, so the fixed point is reached after at
+    # most M iterations; in practice after as many as the longest suppression chain.
+    is_leader = valid
+    while True:
+        new_is_leader = valid & ~(overlap & is_leader[:, :, None]).any(dim=1)
+        if torch.equal(new_is_leader, is_leader):
+            break
+        is_leader = new_is_leader
+
+    # Each detection joins the first (highest scoring) leader that overlaps it.
+    # Leaders join their own cluster.
+    arange = torch.arange(num_dets, device=boxes.device)
+    member_of = overlap & is_leader[:, :, None]
+    member_of[:, arange, arange] = is_leader
+    leader_pos = arange[:, None].expand_as(member_of).masked_fill(~member_of, num_dets)
+    return leader_pos.min(dim=1)[0]
+
+
+def _rank_descending(scores):
+    order = torch.sort(scores, descending=True)[1]
+    rank = torch.empty_like(order)
+    rank[order] = torch.arange(len(order), device=scores.device)
+    return rank
+
+
+def _find_leaders(boxes, scores, classes, image_ids, iou_threshold):
+    """
+    Greedy per-class clustering of the detections of several images.
+
+    The detections are partitioned by (image, class) and every partition is clustered
+    independently, so that IoU is never computed between detections of different
+    images or classes.
+
+    Args:
+        boxes (Tensor): Rx4 boxes.
+        scores, classes (Tensor): R scores and class indices.
+        image_ids (Tensor): R indices of the image of each detection.
+        iou_threshold (float):
+
+    Returns:
+        Tensor: R indices of the detection that leads the cluster of each detection.
+    """
+    num_dets = len(scores)
+    if num_dets == 0:
+        return torch.zeros(0, dtype=torch.int64, device=scores.device)
+
+    # Sort detections by group, then by decreasing score
+    group = image_ids * (int(classes.max()) + 1) + classes
+    _, group_ids, group_sizes = torch.unique(group, return_inverse=True, return_counts=True)
+    order = torch.sort(group_ids * num_dets + _rank_descending(scores))[1]
+
+    # Pad groups into (G, M) tensors
+    sorted_group_ids = group_ids[order]
+    group_starts = group_sizes.cumsum(dim=0) - group_sizes
+    positions = torch.arange(num_dets, device=scores.device) - group_starts[sorted_group_ids]
+    padded_shape = (len(group_sizes), int(group_sizes.max()))
+    padded_idx = order.new_zeros(padded_shape)
+    padded_idx[sorted_group_ids, positions] = order
+    valid = torch.zeros(padded_shape, dtype=torch.bool, device=scores.device)
+    valid[sorted_group_ids, positions] = True
+
+    first_leader = _cluster_sorted(boxes[padded_idx], valid, iou_threshold)
+    leaders = torch.empty_like(order)
+    leaders[order] = padded_idx[sorted_group_ids, first_leader[sorted_group_ids, positions]]
+    return leaders
+
+
+def _number_clusters(leaders, scores, image_ids):
+    """
+    Number the clusters by image, then by decreasing score of their leaders.
+
+    Returns:
+        keep, cluster_ids: see :func:`cluster_detections`.
+    """
+    num_dets = len(scores)
+    arange = torch.arange(num_dets, device=scores.device)
+    keep = arange[leaders == arange]
+    keep_rank = image_ids[keep] * num_dets + _rank_descending(scores)[keep]
+    keep = keep[torch.sort(keep_rank)[1]]
+    cluster_rank = torch.empty_like(arange)
+    cluster_rank[keep] = torch.arange(len(keep), device=scores.device)
+    return keep, cluster_rank[leaders]
+
+
+def cluster_detections(boxes, scores, classes, iou_threshold):
+    """
+    Group detections into clusters using greedy, per-class NMS.
+
+    Detections are visited in decreasing score order. A detection that is not
+    yet assigned becomes the leader of a new cluster, and every unassigned detection
+    of the same class whose IoU with the leader is larger than `iou_threshold`
+    joins that cluster. This is the clustering used by the original ProbEn loop,
+    computed from one pairwise IoU matrix per class.
+
+    Args:
+        boxes (Tensor): Nx4 boxes in (x1, y1, x2, y2) format.
+        scores (Tensor): N scores.
+        classes (Tensor): N class indices.
+        iou_threshold (float): detections with IoU > iou_threshold are matched.
+
+    Returns:
+        keep (Tensor): indices of the K cluster leaders, sorted by decreasing score.
+        cluster_ids (Tensor): N values in [0, K). The cluster each detection belongs to,
+            i.e. detection i belongs to the cluster led by `keep[cluster_ids[i]]`.
+    """
+    image_ids = torch.zeros_like(classes)
+    leaders = _find_leaders(boxes, scores, classes, image_ids, iou_threshold)
+    return _number_clusters(leaders, scores, image_ids)
+
+
+def _cluster_sum(values, cluster_ids, num_clusters):
+    out = values.new_zeros((num_clusters,) + values.shape[1:])
+    return out.index_add_(0, cluster_ids, values)
+
+
+def fuse_clusters(
+    keep,
+    cluster_ids,
+    boxes,
+    scores,
+    classes,
+    probs=None,
+    logits=None,
+    weights=None,
+    method="bayesian",
+    class_prior=None,
+):
+    """
+    Fuse every cluster produced by :func:`cluster_detections` into one detection.
+
+    The supported methods are the ones of the original ProbEn implementation:
+
+    * "avg_score": average score, box averaged over the non-leader members.
+    * "bayesian": Bayesian fusion of the class probabilities,
+      box averaged over the non-leader members.
+    * "baysian_avg_bbox": Bayesian fusion, box averaged over all members.
+    * "bayesian_wt_score_box": Bayesian fusion, score-weighted average box.
+    * "bayesian_prior_wt_score_box": Bayesian fusion with `class_prior`,
+      score-weighted average box.
+    * "avgLogits_softmax", "sumLogits_softmax": softmax of the averaged (summed) class
+      logits, box averaged over the non-leader members.
+
+    For the probability-based methods, a cluster with a single detection keeps the
+    score and box of that detection.
+
+    Detections can be given a weight, e.g. to trust one detector more than another.
+    A weight multiplies the log-probabilities (logits) of a detection, and its
+    contribution to the averaged scores and boxes. With unit weights, this is the
+    original fusion.
+
+    Args:
+        keep, cluster_ids (Tensor): outputs of :func:`cluster_detections`.
+        boxes (Tensor): Nx4 boxes.
+        scores (Tensor): N scores.
+        classes (Tensor): N class indices.
+        probs (Tensor or None): NxK foreground class probabilities. The background
+            probability is taken as 1 - sum of the foreground ones.
+            Required by the probability-based methods.
+        logits (Tensor or None): Nx(K+1) class logits. Required by the logits methods.
+        weights (Tensor or None): N non-negative weights. Defaults to 1 for all detections.
+        method (str): one of :data:`FUSION_METHODS`.
+        class_prior (Tensor or None): (K+1) class prior, required by
+            "bayesian_prior_wt_score_box".
+
+    Returns:
+        boxes (Tensor): Mx4 fused boxes, one per cluster, in the order of `keep`.
+        scores (Tensor): M fused scores.
+        classes (Tensor): M classes, the class of each cluster leader.
+    """
+    assert method in FUSION_METHODS, "Unknown fusion method {}!".format(method)
+    num_clusters = len(keep)
+    out_classes = classes[keep]
+    if num_clusters == 0:
+        return boxes[keep], scores[keep], out_classes
+
+    if weights is None:
+        weights = torch.ones_like(scores)
+    is_leader = torch.zeros_like(scores, dtype=torch.bool)
+    is_leader[keep] = True
+    singleton = _cluster_sum(torch.ones_like(scores), cluster_ids, num_clusters) == 1
+    weight_sums = _cluster_sum(weights, cluster_ids, num_clusters)
+
+    # Box fusion
+    if method in ("baysian_avg_bbox",):
+        box_weights = weights / weight_sums[cluster_ids]
+    elif method in ("bayesian_wt_score_box", "bayesian_prior_wt_score_box"):
+        box_weights = weights * scores
+        box_weight_sums = _cluster_sum(box_weights, cluster_ids, num_clusters)
+        box_weights = box_weights / box_weight_sums[cluster_ids]
+    else:
+        # Average over the matched detections only, without the cluster leader
+        box_weights = weights * (~is_leader).to(weights.dtype)
+        member_sums = _cluster_sum(box_weights, cluster_ids, num_clusters)
+        box_weights = box_weights / member_sums.clamp(min=1e-12)[cluster_ids]
+    out_boxes = _cluster_sum(box_weights[:, None] * boxes, cluster_ids, num_clusters)
+    out_boxes = torch.where(singleton[:, None], boxes[keep], out_boxes)
+
+    # Score fusion
+    if method in LOGITS_METHODS:
+        assert logits is not None, "Method {} requires class logits!".format(method)
+        fused_logits = _cluster_sum(weights[:, None] * logits, cluster_ids, num_clusters)
+        if method == "avgLogits_softmax":
+            fused_logits = fused_logits / weight_sums[:, None]
+        fused_probs = F.softmax(fused_logits, dim=1)
+        out_scores = fused_probs.gather(1, out_classes[:, None].long())[:, 0]
+        return out_boxes, out_scores, out_classes
+
+    if method == "avg_score":
+        out_scores = _cluster_sum(weights * scores, cluster_ids, num_clusters) / weight_sums
+    else:
+        assert probs is not None, "Method {} requires class probabilities!".format(method)
+        full_probs = torch.cat([probs, 1 - probs.sum(dim=1, keepdim=True)], dim=1)
+        log_probs = weights[:, None] * torch.log(full_probs)
+        fused_log_probs = _cluster_sum(log_probs, cluster_ids, num_clusters)
+        if method == "bayesian_prior_wt_score_box":
+            assert class_prior is not None, "Method {} requires a class prior!".format(method)
+            class_prior = torch.as_tensor(class_prior, dtype=fused_log_probs.dtype)
+            fused_log_probs = fused_log_probs - torch.log(class_prior.to(fused_log_probs.device))
+        fused_probs = F.softmax(fused_log_probs, dim=1)
+        out_scores = fused_probs.gather(1, out_classes[:, None].long())[:, 0]
+    out_scores = torch.where(singleton, scores[keep], out_scores)
+    return out_boxes, out_scores, out_classes
+
+
+def proben_fusion(
+    boxes,
+    scores,
+    classes,
+    probs=None,
+    logits=None,
+    weights=None,
+    method="bayesian",
+    iou_threshold=0.5,
+    class_prior=None,
+):
+    """
+    Fuse the detections of several detectors on one image.
+    The detections of all detectors are concatenated along the first dimension.
+
+    Args:
+        boxes, scores, classes, probs, logits, weights (Tensor or ndarray):
+            see :func:`fuse_clusters`.
+        method (str): one of :data:`FUSION_METHODS`.
+        iou_threshold (float): IoU threshold used to cluster the detections.
+        class_prior: see :func:`fuse_clusters`.
+
+    Returns:
+        boxes (Tensor): Mx4 fused boxes, sorted by decreasing score of the cluster leaders.
+        scores (Tensor): M fused scores.
+        classes (Tensor): M classes.
+        keep (Tensor): M indices of the detections that lead each cluster.
+    """
+    boxes = torch.as_tensor(boxes).reshape(-1, 4)
+    scores = torch.as_tensor(scores, device=boxes.device)
+    classes = torch.as_tensor(classes, device=boxes.device).long()
+    if probs is not None:
+        probs = torch.as_tensor(probs, device=boxes.device).reshape(len(scores), -1)
+    if logits is not None:
+        logits = torch.as_tensor(logits, device=boxes.device).reshape(len(scores), -1)
+    if weights is not None:
+        weights = torch.as_tensor(weights, dtype=scores.dtype, device=boxes.device)
+
+    keep, cluster_ids = cluster_detections(boxes, scores, classes, iou_threshold)
+    out_boxes, out_scores, out_classes = fuse_clusters(
+        keep,
+        cluster_ids,
+        boxes,
+        scores,
+        classes,
+        probs=probs,
+        logits=logits,
+        weights=weights,
+        method=method,
+        class_prior=class_prior,
+    )
+    return out_boxes, out_scores, out_classes, keep
+
+
+def pad_detections(boxes, scores, classes, probs=None, logits=None):
+    """
+    Pad the per-image detections of one detector into (N, M, ...) tensors,
+    where M is the largest number of detections on an image.
+
+    Args:
+        boxes (list): N lists (or arrays) of Rx4 boxes, one per image.
+        scores, classes (list): N lists of R scores and class indices.
+        probs, logits (list or None): N lists of RxK class probabilities
+            and Rx(K+1) class logits.
+
+    Returns:
+        dict: with keys "boxes" (N, M, 4), "scores" (N, M), "classes" (N, M) and
+        "valid" (N, M), a bool mask that is False for padding; and "probs" (N, M, K),
+        "logits" (N, M, K+1) if they are given.
+    """
+    num_images = len(boxes)
+    lengths = torch.as_tensor([len(x) for x in scores], dtype=torch.int64)
+    max_dets = int(lengths.max()) if num_images > 0 else 0
+    valid = torch.arange(max_dets)[None, :] < lengths[:, None]
+
+    def _pad(values, dim, dtype):
+        out = torch.zeros((num_images, max_dets) + dim, dtype=dtype)
+        flat = [torch.as_tensor(x, dtype=dtype).reshape((-1,) + dim) for x in values]
+        if len(flat) > 0:
+            out[valid] = torch.cat(flat)
+        return out
+
+    padded = {
+        "boxes": _pad(boxes, (4,), torch.float64),
+        "scores": _pad(scores, (), torch.float64),
+        "classes": _pad(classes, (), torch.int64),
+        "valid": valid,
+    }
+    for name, values in [("probs", probs), ("logits", logits)]:
+        if values is not None:
+            width = max((len(x[0]) for x in values if len(x) > 0), default=0)
+            padded[name] = _pad(values, (width,), torch.float64)
+    return padded
+
+
+def batched_proben_fusion(
+    detections,
+    image_sizes,
+    weights=None,
+    method="bayesian",
+    iou_threshold=0.5,
+    class_prior=None,
+    chunk_size=128,
+):
+    """
+    Fuse the detections of several detectors on a batch of images.
+
+    All images are clustered and fused with batched tensor ops. Images are
+    processed `chunk_size` at a time to bound the memory of the pairwise IoU matrices.
+    As in the original ProbEn evaluation, images on which at most one detector
+    fired are passed through unchanged.
+
+    Args:
+        detections (list[dict]): one dict per detector, in the format returned
+            by :func:`pad_detections`. All detectors must cover the same N images.
+        image_sizes (list[tuple]): N (height, width) tuples.
+        weights (list[float] or None): one weight per detector, see :func:`fuse_clusters`.
+        method, iou_threshold, class_prior: see :func:`proben_fusion`.
+        chunk_size (int): number of images clustered at once.
+
+    Returns:
+        list[Instances]: N instances with fields "pred_boxes", "scores" and
+        "pred_classes", one per image.
+    """
+    num_images = len(image_sizes)
+    merged, num_sources = _merge_detectors(detections)
+    if weights is not None:
+        assert len(weights) == len(detections)
+        weights = torch.as_tensor(weights, dtype=merged["scores"].dtype)
+        merged["weights"] = weights[merged["sources"]]
+
+    results = []
+    for start in range(0, num_images, chunk_size):
+        chunk = {k: v[start : start + chunk_size] for k, v in merged.items()}
+        fuse = num_sources[start : start + chunk_size] > 1
+        results.extend(_fuse_padded_chunk(chunk, fuse, method, iou_threshold, class_prior))
+
+    instances = []
+    for (boxes, scores, classes), image_size in zip(results, image_sizes):
+        result = Instances(image_size)
+        result.pred_boxes = Boxes(boxes)
+        result.scores = scores
+        result.pred_classes = classes
+        instances.append(result)
+    return instances
+
+
+def _merge_detectors(detections):
+    """
+    Concatenate the padded detections of several detectors on the same images.
+
+    Returns:
+        merged (dict): the padded fields of all detectors, concatenated along the
+            detection dimension, and "sources" (N, M): the index of the detector
+            of every detection.
+        num_sources (Tensor): N, the number of detectors that fired on each image.
+    """
+    assert len(detections) > 0
+    fields = ["boxes", "scores", "classes", "valid"] + [
+        k for k in ("probs", "logits") if all(k in d for d in detections)
+    ]
+    merged = {k: torch.cat([d[k] for d in detections], dim=1) for k in fields}
+    merged["sources"] = torch.cat(
+        [torch.full_like(d["classes"], k) for k, d in enumerate(detections)], dim=1
+    )
+    num_sources = sum(d["valid"].any(dim=1).long() for d in detections)
+    return merged, num_sources
+
+
+def _fuse_padded_chunk(dets, fuse, method, iou_threshold, class_prior):
+    """
+    Cluster and fuse the padded detections of a chunk of images.
+    Detections of images where `fuse` is False are returned unchanged.
+
+    Returns:
+        list[tuple]: (boxes, scores, classes) for every image of the chunk.
+    """
+    clusters = _cluster_padded_chunk(dets, fuse, iou_threshold)
+    return _fuse_clustered_chunk(clusters, method, class_prior)
+
+
+def _cluster_padded_chunk(dets, fuse, iou_threshold):
+    """
+    Cluster the padded detections of a chunk of images.
+
+    Returns:
+        dict: the flattened detections of the chunk with the "image_ids",
+        "passthrough", "keep" and "cluster_ids" of every detection, the input of
+        :func:`_fuse_clustered_chunk`.
+    """
+    valid = dets["valid"]
+    num_images, num_dets = valid.shape
+    image_ids = torch.arange(num_images)[:, None].expand(num_images, num_dets)[valid]
+    flat = {k: v[valid] for k, v in dets.items() if k != "valid"}
+
+    leaders = _find_leaders(
+        flat["boxes"], flat["scores"], flat["classes"], image_ids, iou_threshold
+    )
+    passthrough = ~fuse[image_ids]
+    leaders = torch.where(passthrough, torch.arange(len(leaders)), leaders)
+    flat["keep"], flat["cluster_ids"] = _number_clusters(leaders, flat["scores"], image_ids)
+    flat["image_ids"] = image_ids
+    flat["passthrough"] = passthrough
+    flat["num_images"] = num_images
+    return flat
+
+
+def _fuse_clustered_chunk(clusters, method, class_prior, weights=None):
+    """
+    Fuse the clusters of a chunk of images computed by :func:`_cluster_padded_chunk`.
+
+    Args:
+        weights (Tensor or None): one weight per detection. Defaults to the "weights"
+            of the clustered detections, if any.
+
+    Returns:
+        list[tuple]: (boxes, scores, classes) for every image of the chunk.
+    """
+    keep = clusters["keep"]
+    boxes, scores, classes = fuse_clusters(
+        keep,
+        clusters["cluster_ids"],
+        clusters["boxes"],
+        clusters["scores"],
+        clusters["classes"],
+        probs=clusters.get("probs"),
+        logits=clusters.get("logits"),
+        weights=weights if weights is not None else clusters.get("weights"),
+        method=method,
+        class_prior=class_prior,
+    )
+    passthrough = clusters["passthrough"][keep]
+    scores = torch.where(passthrough, clusters["scores"][keep].to(scores.dtype), scores)
+
+    image_ids = clusters["image_ids"][keep]
+    num_clusters = torch.bincount(image_ids, minlength=clusters["num_images"]).tolist()
+    return list(
+        zip(boxes.split(num_clusters), scores.split(num_clusters), classes.split(num_clusters))
+    )
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Late fusion and evaluation of a split, sharded over worker processes.
+
+Every worker fuses the images of its shard and returns the fused images. They are
+fed to the evaluator and evaluated once at the end, in the main process.
+"""
+import json
+import multiprocessing as mp
+from fvcore.common.file_io import PathManager
+
+from detectron2.structures import Boxes, Instances
+
+from .late_fusion import fuse_detections
+
+__all__ = ["load_image_sizes", "sharded_late_fusion"]
+
+
+def load_image_sizes(json_file):
+    """
+    Read the size of every image from the "images" table of a COCO annotation file,
+    instead of decoding the images.
+
+    Args:
+        json_file (str):
+
+    Returns:
+        dict: maps an image id to its (height, width).
+    """
+    with PathManager.open(json_file, "r") as f:
+        images = json.load(f)["images"]
+    return {x["id"]: (x["height"], x["width"]) for x in images}
+
+
+def _get_detections(predictions, idx):
+    """
+    Detections of one image from a prediction file of `demo/save_predictions.py`,
+    in the format of :func:`fuse_detections`.
+    """
+    detections = {k: predictions[k][idx] for k in ("boxes", "scores", "classes")}
+    if "class_logits" in predictions:
+        detections["logits"] = predictions["class_logits"][idx]
+    if "probs" in predictions:
+        detections["probs"] = predictions["probs"][idx]
+    return detections
+
+
+# Shared with the worker processes, which are forked after it is set
+_SHARD_STATE = {}
+
+
+def _process_shard(indices):
+    state = _SHARD_STATE
+    predictions = state["predictions"]
+    ret = []
+    for idx in indices:
+        detections = [_get_detections(p, idx) for p in predictions]
+        if sum(len(d["scores"]) for d in detections) == 0:
+            continue
+        boxes, scores, classes = fuse_detections(detections, **state["fusion_args"])
+        image_id = predictions[0]["image_id"][idx]
+        height, width = state["image_sizes"][image_id]
+        instances = Instances((height, width))
+        instances.pred_boxes = Boxes(boxes)
+        instances.scores = scores
+        instances.pred_classes = classes
+        inputs = {"image_id": image_id, "height": height, "width": width}
+        if "image" in predictions[0]:
+            inputs["file_name"] = predictions[0]["image"][idx]
+        ret.append((inputs, {"instances": instances}))
+    return ret
+
+
+def sharded_late_fusion(
+    predictions,
+    evaluator,
+    image_sizes,
+    weights=None,
+    method="bayesian",
+    iou_threshold=0.5,
+    class_prior=None,
+    num_workers=4,
+    num_shards=None,
+    evaluate_kwargs=None,
+):
+    """
+    Fuse the predictions of several detectors on a split and evaluate them, with the
+    images split into shards that are processed in parallel. As in the original
+    evaluation loop, images on which no detector fired are skipped.
+
+    Args:
+        predictions (list[dict]): the loaded prediction file of each detector, in the
+            format of `demo/save_predictions.py`: a dict of lists with one element
+            per image, with keys "image_id", "boxes", "scores", "classes" and optionally
+            "image", "class_logits", "probs". All files list the images in the same order.
+        evaluator (DatasetEvaluator):
+        image_sizes (dict): maps an image id to its (height, width),
+            e.g. from :func:`load_image_sizes`.
+        weights, method, iou_threshold, class_prior: see :func:`fuse_detections`.
+        num_workers (int): number of worker processes. 0 processes the shards in
+            this process.
+        num_shards (int or None): number of shards. Defaults to 4 per worker, so that
+            the shards are balanced.
+        evaluate_kwargs (dict or None): keyword arguments of `evaluator.evaluate()`,
+            e.g. the "out_eval_path" of :class:`FLIREvaluator`.
+
+    Returns:
+        The return value of `evaluator.evaluate()`
+    """
+    num_images = len(predictions[0]["image_id"])
+    assert all(len(p["image_id"]) == num_images for p in predictions)
+    if num_shards is None:
+        num_shards = 4 * max(num_workers, 1)
+    shard_size = max((num_images + num_shards - 1) // num_shards, 1)
+    shards = [range(s, min(s + shard_size, num_images)) for s in range(0, num_images, shard_size)]
+
+    _SHARD_STATE.update(
+        predictions=predictions,
+        image_sizes=image_sizes,
+        fusion_args=dict(
+            weights=weights, method=method, iou_threshold=iou_threshold, class_prior=class_prior
+        ),
+    )
+    try:
+        if num_workers > 0:
+            with mp.get_context("fork").Pool(num_workers) as pool:
+                partial_results = pool.map(_process_shard, shards, chunksize=1)
+        else:
+            partial_results = [_process_shard(shard) for shard in shards]
+    finally:
+        _SHARD_STATE.clear()
+
+    evaluator.reset()
+    for fused in partial_results:
+        for inputs, outputs in fused:
+            evaluator.process([inputs], [outputs])
+    results = evaluator.evaluate(**(evaluate_kwargs or {}))
+    # An evaluator could return None when not in main process.
+    # Replace it by an empty dict instead to make it easier for downstream code to handle
+    if results is None:
+        results = {}
+    return results
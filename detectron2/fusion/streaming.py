@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming late fusion.
+
+Instead of loading the predictions of every detector on the whole split, the
+predictions of each detector are consumed as a stream of per-image records, and
+every image is fused and evaluated as soon as all detectors produced it.
+A record is a dict with the keys of the prediction files of `demo/save_predictions.py`,
+for a single image: "image" (file name), "image_id", "height", "width", "boxes",
+"scores", "classes" and optionally "class_logits" and "probs".
+"""
+import itertools
+import json
+from fvcore.common.file_io import PathManager
+
+from detectron2.structures import Boxes, Instances
+
+from .late_fusion import fuse_detections
+
+__all__ = [
+    "instances_to_record",
+    "read_prediction_lines",
+    "write_prediction_line",
+    "predictor_stream",
+    "multi_head_predictor_streams",
+    "stream_late_fusion",
+    "evaluate_stream",
+]
+
+
+def instances_to_record(instances, image_id, file_name=None):
+    """
+    Convert the predictions of a model on one image to a record.
+
+    Args:
+        instances (Instances): the "instances" predicted by a model.
+        image_id (int):
+        file_name (str or None):
+
+    Returns:
+        dict: a record with lists as values.
+    """
+    instances = instances.to("cpu")
+    height, width = instances.image_size
+    record = {"image": file_name, "image_id": image_id, "height": height, "width": width}
+    record["boxes"] = instances.pred_boxes.tensor.tolist()
+    record["scores"] = instances.scores.tolist()
+    record["classes"] = instances.pred_classes.tolist()
+    if instances.has("class_logits"):
+        record["class_logits"] = instances.class_logits.tolist()
+    if instances.has("prob_score"):
+        record["probs"] = instances.prob_score.tolist()
+    return record
+
+
+def write_prediction_line(f, record):
+    """
+    Append a record to a line-delimited JSON prediction file.
+
+    Args:
+        f (file): a file opened in text mode.
+        record (dict):
+    """
+    f.write(json.dumps(record))
+    f.write("\n")
+
+
+def read_prediction_lines(file_path):
+    """
+    Iterate over the records of a line-delimited JSON prediction file.
+    Only one line is held in memory at a time.
+
+    Args:
+        file_path (str):
+
+    Yields:
+        dict: one record per image.
+    """
+    with PathManager.open(file_path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def predictor_stream(predictor, images):
+    """
+    Run a predictor over images and yield its records as they are produced.
+
+    Args:
+        predictor (callable): e.g. a :class:`detectron2.engine.DefaultPredictor`.
+            Called with one image and returns a dict with key "instances".
+        images (iterable[tuple]): (image, image_id, file_name) triplets, where image
+            is the input of the predictor.
+
+    Yields:
+        dict: one record per image.
+    """
+    for image, image_id, file_name in images:
+        instances = predictor(image)["instances"]
+        yield instances_to_record(instances, image_id, file_name)
+
+
+def multi_head_predictor_streams(predictor, images, branch_names):
+    """
+    Run a predictor of a :class:`detectron2.modeling.MultiHeadRCNN` over images, and
+    split its records into one stream per branch, for :func:`stream_late_fusion`.
+    The model runs once per image for all the branches.
+
+    Args:
+        predictor (callable): called with one image and returns a dict with key
+            "branch_instances".
+        images (iterable[tuple]): see :func:`predictor_stream`.
+        branch_names (list[str]): the branches to fuse.
+
+    Returns:
+        list[iterable[dict]]: the records of each branch. They must be consumed in
+        lockstep, as done by :func:`stream_late_fusion`.
+    """
+
+    def branch_records():
+        for image, image_id, file_name in images:
+            outputs = predictor(image)["branch_instances"]
+            yield [instances_to_record(outputs[n], image_id, file_name) for n in branch_names]
+
+    streams = itertools.tee(branch_records(), len(branch_names))
+    return [(records[k] for records in stream) for k, stream in enumerate(streams)]
+
+
+def _record_to_detections(record):
+    detections = {k: record[k] for k in ("boxes", "scores", "classes")}
+    detections["logits"] = record.get("class_logits")
+    detections["probs"] = record.get("probs")
+    return detections
+
+
+def stream_late_fusion(
+    streams,
+    weights=None,
+    method="bayesian",
+    iou_threshold=0.5,
+    class_prior=None,
+    image_sizes=None,
+):
+    """
+    Fuse the records of several detectors image by image.
+
+    The streams are consumed in lockstep, so they must produce the images in the
+    same order, and the same number of images. Memory usage does not depend on the
+    number of images, and the first fused images are available before the streams
+    are exhausted.
+
+    Args:
+        streams (list[iterable[dict]]): the records of each detector, e.g. from
+            :func:`read_prediction_lines` or :func:`predictor_stream`.
+        weights, method, iou_threshold, class_prior: see :func:`fuse_detections`.
+        image_sizes (dict or None): maps an image id to its (height, width). Used for
+            the records that do not have "height" and "width".
+
+    Yields:
+        tuple(dict, dict): the input and output of one image, in the format of
+        :meth:`DatasetEvaluator.process`.
+    """
+    for records in itertools.zip_longest(*streams, fillvalue=None):
+        if any(r is None for r in records):
+            raise ValueError(
+                "Streams have different lengths: streams {} ended before image {}!".format(
+                    [k for k, r in enumerate(records) if r is None],
+                    next(r["image_id"] for r in records if r is not None),
+                )
+            )
+        image_id = records[0]["image_id"]
+        assert all(r["image_id"] == image_id for r in records), (
+            "Streams are not aligned: got image ids {}!".format([r["image_id"] for r in records])
+        )
+        if "height" in records[0]:
+            image_size = (records[0]["height"], records[0]["width"])
+        else:
+            image_size = tuple(image_sizes[image_id])
+
+        boxes, scores, classes = fuse_detections(
+            [_record_to_detections(r) for r in records],
+            weights=weights,
+            method=method,
+            iou_threshold=iou_threshold,
+            class_prior=class_prior,
+        )
+        instances = Instances(image_size)
+        instances.pred_boxes = Boxes(boxes)
+        instances.scores = scores
+        instances.pred_classes = classes
+
+        inputs = {"image_id": image_id, "height": image_size[0], "width": image_size[1]}
+        if records[0].get("image") is not None:
+            inputs["file_name"] = records[0]["image"]
+        yield inputs, {"instances": instances}
+
+
+def evaluate_stream(evaluator, stream, evaluate_kwargs=None):
+    """
+    Feed the fused images of a stream to an evaluator as they are produced.
+
+    Args:
+        evaluator (DatasetEvaluator):
+        stream (iterable[tuple]): e.g. from :func:`stream_late_fusion`.
+        evaluate_kwargs (dict or None): keyword arguments of `evaluator.evaluate()`,
+            e.g. the "out_eval_path" of :class:`FLIREvaluator`.
+
+    Returns:
+        The return value of `evaluator.evaluate()`
+    """
+    evaluator.reset()
+    for inputs, outputs in stream:
+        evaluator.process([inputs], [outputs])
+    results = evaluator.evaluate(**(evaluate_kwargs or {}))
+    # An evaluator could return None when not in main process.
+    # Replace it by an empty dict instead to make it easier for downstream code to handle
+    if results is None:
+        results = {}
+    return results
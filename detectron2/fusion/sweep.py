@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Compare late fusion methods and hyperparameters on a split.
+
+The clusters of the detections only depend on the IoU threshold, so they are
+computed once per threshold and shared by every fusion method, detector weights
+and class prior evaluated with that threshold.
+"""
+import itertools
+import logging
+import multiprocessing as mp
+from collections import OrderedDict
+import torch
+from tabulate import tabulate
+
+from detectron2.layers import batched_nms
+from detectron2.structures import Boxes, Instances
+
+from .late_fusion import LATE_FUSION_METHODS
+from .proben import _cluster_padded_chunk, _fuse_clustered_chunk, _merge_detectors
+
+__all__ = ["FusionClusterCache", "sweep_late_fusion", "format_sweep_table"]
+
+logger = logging.getLogger(__name__)
+
+
+class FusionClusterCache:
+    """
+    The clusters of the detections of several detectors on a batch of images,
+    for one IoU threshold. Any fusion method of :data:`LATE_FUSION_METHODS`
+    can then be applied without clustering the detections again.
+
+    As in :func:`detectron2.fusion.batched_proben_fusion`, images on which at most
+    one detector fired are passed through unchanged. "nms" and "pooling" do not use the
+    clusters, and are the same as in :func:`detectron2.fusion.fuse_detections`.
+    """
+
+    def __init__(self, detections, iou_threshold=0.5, chunk_size=128):
+        """
+        Args:
+            detections (list[dict]): one dict per detector, in the format returned
+                by :func:`detectron2.fusion.pad_detections`.
+            iou_threshold (float): IoU threshold used to cluster the detections.
+            chunk_size (int): number of images clustered at once.
+        """
+        self.iou_threshold = iou_threshold
+        self.num_detectors = len(detections)
+        merged, num_sources = _merge_detectors(detections)
+        self._chunks = []
+        for start in range(0, len(num_sources), chunk_size):
+            chunk = {k: v[start : start + chunk_size] for k, v in merged.items()}
+            fuse = num_sources[start : start + chunk_size] > 1
+            self._chunks.append(_cluster_padded_chunk(chunk, fuse, iou_threshold))
+
+    def fuse(self, method="bayesian", weights=None, class_prior=None):
+        """
+        Args:
+            method (str): one of :data:`LATE_FUSION_METHODS`.
+            weights (list[float] or None): one weight per detector, see
+                :func:`detectron2.fusion.fuse_clusters`.
+            class_prior: see :func:`detectron2.fusion.fuse_clusters`.
+
+        Returns:
+            list[tuple]: (boxes, scores, classes) for every image.
+        """
+        assert method in LATE_FUSION_METHODS, "Unknown fusion method {}!".format(method)
+        if weights is not None:
+            assert len(weights) == self.num_detectors
+            weights = torch.as_tensor(weights, dtype=torch.float64)
+
+        results = []
+        for clusters in self._chunks:
+            if method in ("nms", "pooling"):
+                results.extend(self._select(clusters, method, self.iou_threshold))
+                continue
+            det_weights = None if weights is None else weights[clusters["sources"]]
+            results.extend(_fuse_clustered_chunk(clusters, method, class_prior, det_weights))
+        return results
+
+    @staticmethod
+    def _select(clusters, method, iou_threshold):
+        idx = torch.arange(len(clusters["scores"]))
+        image_ids = clusters["image_ids"]
+        if method == "nms":
+            # Same NMS as fuse_detections, per image and class, on the images that
+            # are not passed through
+            boxes, scores, classes = clusters["boxes"], clusters["scores"], clusters["classes"]
+            fused = (~clusters["passthrough"]).nonzero()[:, 0]
+            if len(fused) > 0:
+                groups = image_ids[fused] * (int(classes.max()) + 1) + classes[fused]
+                keep = batched_nms(
+                    boxes[fused].float(), scores[fused].float(), groups, iou_threshold
+                )
+                fused = fused[keep]
+            idx = torch.cat([fused, clusters["passthrough"].nonzero()[:, 0]])
+            # Group by image, keeping the order of the detections of an image
+            idx = idx[torch.argsort(image_ids[idx] * len(idx) + torch.arange(len(idx)))]
+        image_ids = image_ids[idx]
+        counts = torch.bincount(image_ids, minlength=clusters["num_images"]).tolist()
+        return list(
+            zip(
+                clusters["boxes"][idx].split(counts),
+                clusters["scores"][idx].split(counts),
+                clusters["classes"][idx].split(counts),
+            )
+        )
+
+
+# Shared with the worker processes, which are forked after it is set
+_SWEEP_STATE = {}
+
+
+def _evaluate_config(config):
+    method, iou_threshold, prior_name, weights_name = config
+    state = _SWEEP_STATE
+    fused = state["caches"][iou_threshold].fuse(
+        method,
+        weights=state["weights"][weights_name],
+        class_prior=state["class_priors"][prior_name],
+    )
+    evaluator = state["evaluator"]
+    evaluator.reset()
+    outputs = []
+    for inputs, (boxes, scores, classes) in zip(state["inputs"], fused):
+        instances = Instances((inputs["height"], inputs["width"]))
+        instances.pred_boxes = Boxes(boxes)
+        instances.scores = scores
+        instances.pred_classes = classes
+        outputs.append({"instances": instances})
+    evaluator.process(state["inputs"], outputs)
+    results = evaluator.evaluate()
+    # An evaluator could return None when not in main process.
+    return config, results if results is not None else {}
+
+
+def sweep_late_fusion(
+    detections,
+    inputs,
+    evaluator,
+    methods=LATE_FUSION_METHODS,
+    iou_thresholds=(0.5,),
+    class_priors=None,
+    weights=None,
+    num_workers=0,
+    chunk_size=128,
+):
+    """
+    Evaluate every combination of fusion method, IoU threshold, class prior and
+    detector weights.
+
+    The detections are clustered once per IoU threshold. Class priors only
+    apply to "bayesian_prior_wt_score_box", so the other methods are evaluated
+    once per threshold and weights.
+
+    Args:
+        detections (list[dict]): one dict per detector, in the format returned
+            by :func:`detectron2.fusion.pad_detections`, on N images.
+        inputs (list[dict]): the N inputs given to the evaluator, with "image_id",
+            "height" and "width".
+        evaluator (DatasetEvaluator): reset before every combination. Each worker
+            process uses its own copy. It should not write its results to files, since
+            all the combinations would write to the same paths.
+        methods (list[str]): fusion methods in :data:`LATE_FUSION_METHODS`.
+        iou_thresholds (list[float]):
+        class_priors (dict[str, array] or None): named class priors.
+        weights (dict[str, list[float]] or None): named detector weights. Defaults
+            to unit weights.
+        num_workers (int): number of worker processes that fuse and evaluate the
+            combinations. 0 evaluates them in this process.
+        chunk_size (int): see :class:`FusionClusterCache`.
+
+    Returns:
+        OrderedDict: maps (method, iou_threshold, prior name, weights name) to the
+        return value of `evaluator.evaluate()`. Names are None when not applicable.
+    """
+    assert len(inputs) == len(detections[0]["valid"])
+    class_priors = dict(class_priors or {})
+    weights = dict(weights or {None: None})
+    caches = {}
+    for iou_threshold in iou_thresholds:
+        logger.info("Clustering detections with IoU threshold {} ...".format(iou_threshold))
+        caches[iou_threshold] = FusionClusterCache(detections, iou_threshold, chunk_size)
+
+    configs = []
+    for method, iou_threshold, weights_name in itertools.product(
+        methods, iou_thresholds, weights
+    ):
+        if method == "bayesian_prior_wt_score_box":
+            assert len(class_priors) > 0, "Method {} requires a class prior!".format(method)
+            prior_names = list(class_priors)
+        else:
+            prior_names = [None]
+        configs.extend((method, iou_threshold, p, weights_name) for p in prior_names)
+
+    class_priors[None] = None
+    _SWEEP_STATE.update(
+        caches=caches,
+        inputs=inputs,
+        evaluator=evaluator,
+        class_priors=class_priors,
+        weights=weights,
+    )
+    try:
+        if num_workers > 0:
+            with mp.get_context("fork").Pool(num_workers) as pool:
+                results = pool.map(_evaluate_config, configs, chunksize=1)
+        else:
+            results = [_evaluate_config(c) for c in configs]
+    finally:
+        _SWEEP_STATE.clear()
+    return OrderedDict(results)
+
+
+def format_sweep_table(results):
+    """
+    Args:
+        results (OrderedDict): returned by :func:`sweep_late_fusion`.
+
+    Returns:
+        str: one row per combination, and one column per metric.
+    """
+    rows, metrics = [], []
+    for config, result in results.items():
+        flat = OrderedDict()
+        for task, res in result.items():
+            if isinstance(res, dict):
+                flat.update(res)
+            else:
+                flat[task] = res
+        for metric in flat:
+            if metric not in metrics:
+                metrics.append(metric)
+        rows.append((config, flat))
+
+    table = [
+        [
+            method,
+            iou_threshold,
+            prior_name if prior_name is not None else "-",
+            weights_name if weights_name is not None else "-",
+        ]
+        + [flat.get(m, float("nan")) for m in metrics]
+        for (method, iou_threshold, prior_name, weights_name), flat in rows
+    ]
+    return tabulate(
+        table,
+        tablefmt="pipe",
+        floatfmt=".3f",
+        headers=["method", "IoU", "prior", "weights"] + metrics,
+        numalign="left",
+    )
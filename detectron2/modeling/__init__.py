@@ -7,10 +7,13 @@ from .anchor_generator import build_anchor_generator, ANCHOR_GENERATOR_REGISTRY
 from .backbone import (
     BACKBONE_REGISTRY,
     FPN,
+    MID_FUSION_REGISTRY,
     Backbone,
     ResNet,
     ResNetBlockBase,
+    TwoStreamBackbone,
     build_backbone,
+    build_mid_fusion,
     build_resnet_backbone,
     make_stage,
 )
@@ -18,6 +21,7 @@ from .meta_arch import (
     META_ARCH_REGISTRY,
     SEM_SEG_HEADS_REGISTRY,
     GeneralizedRCNN,
+    MultiHeadRCNN,
     PanopticFPN,
     ProposalNetwork,
     RetinaNet,
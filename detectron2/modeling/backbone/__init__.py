@@ -3,6 +3,13 @@ from .build import build_backbone, BACKBONE_REGISTRY  # noqa F401 isort:skip
 
 from .backbone import Backbone
 from .fpn import FPN
+from .mid_fusion import (
+    MID_FUSION_REGISTRY,
+    ModalityFallback,
+    TwoStreamBackbone,
+    build_mid_fusion,
+    build_two_stream_backbone,
+)
 from .resnet import ResNet, ResNetBlockBase, build_resnet_backbone, make_stage
 
 # TODO can expose more resnet blocks after careful consideration
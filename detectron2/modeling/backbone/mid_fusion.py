@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Mid-fusion of the RGB and thermal features of a "BGRTTT" input.
+
+The features of the two modalities are fused at every output level by a module of
+:data:`MID_FUSION_REGISTRY`, either after the shared backbone of
+:class:`detectron2.modeling.GeneralizedRCNN` or in a :class:`TwoStreamBackbone`.
+The fusions other than :class:`ConcatFusion` keep the width of one modality, so that
+the RPN and ROI heads are not twice as wide.
+
+:class:`TwoStreamBackbone` extracts the features of each modality with its own trunk.
+The two trunks run concurrently: the RGB trunk in a helper thread (on its own CUDA
+stream), the thermal trunk in the calling thread.
+"""
+import torch
+from torch import nn
+
+from detectron2.layers import ShapeSpec
+from detectron2.utils.executor import get_process_executor
+from detectron2.utils.registry import Registry
+
+from .backbone import Backbone
+from .build import BACKBONE_REGISTRY
+
+__all__ = [
+    "MID_FUSION_REGISTRY",
+    "build_mid_fusion",
+    "ConcatFusion",
+    "SumFusion",
+    "ConvFusion",
+    "GatedSumFusion",
+    "AttentionFusion",
+    "ModalityFallback",
+    "TwoStreamBackbone",
+    "build_two_stream_backbone",
+]
+
+MID_FUSION_REGISTRY = Registry("MID_FUSION")
+MID_FUSION_REGISTRY.__doc__ = """
+Registry for the fusions of the RGB and thermal features of every level.
+
+The registered object will be called with `obj(cfg, input_shape)`, where `input_shape`
+is the dict[str->ShapeSpec] of the features of one modality. The object is expected to
+be an nn.Module that is called with the features of the two modalities,
+`obj(features_rgb, features_thermal)`, and returns the fused features. It must
+implement `output_shape()`.
+"""
+
+
+def build_mid_fusion(cfg, input_shape):
+    """
+    Build the fusion `cfg.MODEL.MID_FUSION.NAME`.
+    """
+    name = cfg.MODEL.MID_FUSION.NAME
+    return MID_FUSION_REGISTRY.get(name)(cfg, input_shape)
+
+
+@MID_FUSION_REGISTRY.register()
+class ConcatFusion(nn.Module):
+    """
+    Concatenate the RGB and thermal features along channels.
+    The fused features are twice as wide as the features of a modality.
+    """
+
+    def __init__(self, cfg, input_shape):
+        super().__init__()
+        self._input_shape = input_shape
+
+    def forward(self, features_rgb, features_thermal):
+        return {k: torch.cat((features_rgb[k], features_thermal[k]), 1) for k in features_rgb}
+
+    def output_shape(self):
+        return {
+            k: ShapeSpec(channels=s.channels * 2, stride=s.stride)
+            for k, s in self._input_shape.items()
+        }
+
+
+@MID_FUSION_REGISTRY.register()
+class SumFusion(nn.Module):
+    """
+    Sum the RGB and thermal features.
+    """
+
+    def __init__(self, cfg, input_shape):
+        super().__init__()
+        self._input_shape = input_shape
+
+    def forward(self, features_rgb, features_thermal):
+        return {k: features_rgb[k] + features_thermal[k] for k in features_rgb}
+
+    def output_shape(self):
+        return dict(self._input_shape)
+
+
+@MID_FUSION_REGISTRY.register()
+class ConvFusion(nn.Module):
+    """
+    Reduce the concatenated RGB and thermal features of every level back to the
+    width of one modality, with a 1x1 conv per level. The convs are initialized to
+    the average of the two modalities.
+    """
+
+    def __init__(self, cfg, input_shape):
+        super().__init__()
+        self._input_shape = input_shape
+        for k, s in input_shape.items():
+            conv = nn.Conv2d(s.channels * 2, s.channels, kernel_size=1)
+            eye = torch.eye(s.channels).view(s.channels, s.channels, 1, 1)
+            with torch.no_grad():
+                conv.weight.copy_(torch.cat((eye, eye), 1) * 0.5)
+                conv.bias.zero_()
+            self.add_module("fuse_{}".format(k), conv)
+
+    def forward(self, features_rgb, features_thermal):
+        return {
+            k: getattr(self, "fuse_{}".format(k))(
+                torch.cat((features_rgb[k], features_thermal[k]), 1)
+            )
+            for k in features_rgb
+        }
+
+    def output_shape(self):
+        return dict(self._input_shape)
+
+
+@MID_FUSION_REGISTRY.register()
+class GatedSumFusion(nn.Module):
+    """
+    A weighted sum of the RGB and thermal features, with a learned weight per level
+    and channel: `g * rgb + (1 - g) * thermal`, where `g` is a sigmoid gate
+    initialized to 0.5.
+    """
+
+    def __init__(self, cfg, input_shape):
+        super().__init__()
+        self._input_shape = input_shape
+        for k, s in input_shape.items():
+            self.register_parameter("gate_{}".format(k), nn.Parameter(torch.zeros(s.channels)))
+
+    def forward(self, features_rgb, features_thermal):
+        ret = {}
+        for k in features_rgb:
+            gate = torch.sigmoid(getattr(self, "gate_{}".format(k))).view(1, -1, 1, 1)
+            ret[k] = gate * features_rgb[k] + (1 - gate) * features_thermal[k]
+        return ret
+
+    def output_shape(self):
+        return dict(self._input_shape)
+
+
+@MID_FUSION_REGISTRY.register()
+class AttentionFusion(nn.Module):
+    """
+    A weighted sum of the RGB and thermal features, with per-pixel weights predicted
+    by a 1x1 conv of the concatenated features of each level, normalized by a
+    softmax over the two modalities. The weights are initialized to 0.5.
+    """
+
+    def __init__(self, cfg, input_shape):
+        super().__init__()
+        self._input_shape = input_shape
+        for k, s in input_shape.items():
+            conv = nn.Conv2d(s.channels * 2, 2, kernel_size=1)
+            nn.init.normal_(conv.weight, std=0.001)
+            nn.init.constant_(conv.bias, 0)
+            self.add_module("attention_{}".format(k), conv)
+
+    def forward(self, features_rgb, features_thermal):
+        ret = {}
+        for k in features_rgb:
+            rgb, thermal = features_rgb[k], features_thermal[k]
+            logits = getattr(self, "attention_{}".format(k))(torch.cat((rgb, thermal), 1))
+            weights = torch.softmax(logits, dim=1)
+            ret[k] = weights[:, :1] * rgb + weights[:, 1:] * thermal
+        return ret
+
+    def output_shape(self):
+        return dict(self._input_shape)
+
+
+class ModalityFallback(nn.Module):
+    """
+    Learned features that replace the features of a modality that is not extracted,
+    e.g. the RGB features of a night frame: one learned vector per level, repeated
+    at every position.
+    """
+
+    def __init__(self, input_shape):
+        """
+        Args:
+            input_shape (dict[str->ShapeSpec]): the shape of the features of the modality.
+        """
+        super().__init__()
+        for k, s in input_shape.items():
+            self.register_parameter("fallback_{}".format(k), nn.Parameter(torch.zeros(s.channels)))
+
+    def forward(self, features, other_features, mask):
+        """
+        Args:
+            features (dict[str->Tensor] or None): the features of the modality, of the
+                images of `mask` only. None if `mask` has no image.
+            other_features (dict[str->Tensor]): the features of the other modality, of
+                all the images.
+            mask (Tensor): (N,) bool, the images whose features are extracted.
+
+        Returns:
+            dict[str->Tensor]: the features of the modality of all the images, with the
+            fallback for the images not in `mask`.
+        """
+        ret = {}
+        for k, other in other_features.items():
+            fallback = getattr(self, "fallback_{}".format(k)).to(dtype=other.dtype)
+            ret[k] = fallback.view(1, -1, 1, 1).expand_as(other).clone()
+            if features is not None:
+                ret[k][mask] = features[k]
+        return ret
+
+
+class TwoStreamBackbone(Backbone):
+    """
+    A backbone with separate RGB and thermal trunks, whose features are fused at
+    every output level.
+    """
+
+    def __init__(self, rgb, thermal, fusion, concurrent=True):
+        """
+        Args:
+            rgb (Backbone): the trunk of the 3 RGB channels.
+            thermal (Backbone): the trunk of the 3 thermal channels. Must have the same
+                output shape as `rgb`.
+            fusion (nn.Module): a fusion of :data:`MID_FUSION_REGISTRY`.
+            concurrent (bool): whether to run the two trunks concurrently.
+        """
+        super().__init__()
+        assert rgb.output_shape() == thermal.output_shape()
+        self.rgb = rgb
+        self.thermal = thermal
+        self.fusion = fusion
+        self.concurrent = concurrent
+
+    @property
+    def size_divisibility(self):
+        return max(self.rgb.size_divisibility, self.thermal.size_divisibility)
+
+    def output_shape(self):
+        return self.fusion.output_shape()
+
+    @staticmethod
+    def _run_branch(branch, x, grad_enabled, stream):
+        # Grad mode and the current CUDA stream are thread-local
+        with torch.set_grad_enabled(grad_enabled):
+            if stream is None:
+                return branch(x)
+            with torch.cuda.device(x.device), torch.cuda.stream(stream):
+                return branch(x)
+
+    def extract_features(self, x, rgb_mask=None):
+        """
+        Args:
+            x (Tensor): (N, 6, H, W) normalized RGB and thermal images.
+            rgb_mask (Tensor or None): (N,) bool, the images whose RGB features are
+                extracted. None means all the images.
+
+        Returns:
+            dict[str->Tensor] or None: the features of the RGB images of `rgb_mask`,
+                before fusion. None if `rgb_mask` has no image.
+            dict[str->Tensor]: the features of the thermal images, before fusion.
+        """
+        rgb, thermal = x[:, :3], x[:, 3:]
+        if rgb_mask is not None:
+            if not rgb_mask.any():
+                return None, self.thermal(thermal)
+            rgb = rgb[rgb_mask]
+        if not self.concurrent:
+            return self.rgb(rgb), self.thermal(thermal)
+
+        stream = None
+        if x.is_cuda:
+            stream = torch.cuda.Stream(device=x.device)
+            # The RGB trunk must wait for the normalization of its input
+            stream.wait_stream(torch.cuda.current_stream(x.device))
+        future = get_process_executor("two_stream_backbone").submit(
+            self._run_branch, self.rgb, rgb, torch.is_grad_enabled(), stream
+        )
+        features_thermal = self.thermal(thermal)
+        features_rgb = future.result()
+        if stream is not None:
+            current = torch.cuda.current_stream(x.device)
+            current.wait_stream(stream)
+            for v in features_rgb.values():
+                v.record_stream(current)
+        return features_rgb, features_thermal
+
+    def forward(self, x):
+        features_rgb, features_thermal = self.extract_features(x)
+        return self.fusion(features_rgb, features_thermal)
+
+
+@BACKBONE_REGISTRY.register()
+def build_two_stream_backbone(cfg, input_shape):
+    """
+    Create a :class:`TwoStreamBackbone` for "BGRTTT" inputs. Both trunks are
+    `cfg.MODEL.MID_FUSION.BRANCH_BACKBONE`.
+
+    Returns:
+        backbone (Backbone): backbone module, must be a subclass of :class:`Backbone`.
+    """
+    assert input_shape.channels == 6, "A two-stream backbone takes BGRTTT inputs!"
+    branch_shape = ShapeSpec(channels=3, height=input_shape.height, width=input_shape.width)
+    build_branch = BACKBONE_REGISTRY.get(cfg.MODEL.MID_FUSION.BRANCH_BACKBONE)
+    rgb = build_branch(cfg, branch_shape)
+    thermal = build_branch(cfg, branch_shape)
+    fusion = build_mid_fusion(cfg, rgb.output_shape())
+    return TwoStreamBackbone(rgb, thermal, fusion, concurrent=cfg.MODEL.MID_FUSION.CONCURRENT)
@@ -7,5 +7,6 @@ from .panoptic_fpn import PanopticFPN
 
 # import all the meta_arch, so they will be registered
 from .rcnn import GeneralizedRCNN, ProposalNetwork
+from .multi_head_rcnn import MultiHeadRCNN
 from .retinanet import RetinaNet
 from .semantic_seg import SEM_SEG_HEADS_REGISTRY, SemanticSegmentor, build_sem_seg_head
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from detectron2.utils.logger import log_first_n
+
+from ..backbone import MID_FUSION_REGISTRY
+from ..proposal_generator import build_proposal_generator
+from ..roi_heads import build_roi_heads
+from .build import META_ARCH_REGISTRY
+from .rcnn import GeneralizedRCNN
+
+__all__ = ["MultiHeadRCNN"]
+
+
+@META_ARCH_REGISTRY.register()
+class MultiHeadRCNN(GeneralizedRCNN):
+    """
+    Several R-CNN detectors that share the RGB and thermal features of a "BGRTTT"
+    input, to produce the detections fused by ProbEn with a single backbone pass.
+
+    Every branch of `cfg.MODEL.MULTI_HEAD.BRANCHES` has its own RPN and ROI heads, which
+    read either the features of one modality ("rgb" or "thermal"), or the fusion of
+    both by a module of :data:`MID_FUSION_REGISTRY` (e.g. "ConcatFusion" for the
+    mid-fusion detector).
+
+    The backbone is the shared backbone of :class:`GeneralizedRCNN`, or a two-stream
+    backbone. Its own fusion (`cfg.MODEL.MID_FUSION.NAME`) is not used, so it must be
+    "ConcatFusion", which has no parameters: the parameters of another fusion would
+    never be trained.
+    """
+
+    def __init__(self, cfg):
+        assert cfg.INPUT.FORMAT == "BGRTTT", "MultiHeadRCNN takes BGRTTT inputs!"
+        assert cfg.MODEL.MID_FUSION.NAME == "ConcatFusion", (
+            "The fusion of each branch of MultiHeadRCNN is in MODEL.MULTI_HEAD.BRANCH_INPUTS, "
+            "MODEL.MID_FUSION.NAME must be ConcatFusion!"
+        )
+        super().__init__(cfg)
+        # The heads of GeneralizedRCNN are replaced by the heads of the branches
+        del self.proposal_generator
+        del self.roi_heads
+
+        if self.backbone_2 is None:
+            branch_shape = self.backbone.rgb.output_shape()
+        else:
+            branch_shape = self.backbone.output_shape()
+        self.branch_names = cfg.MODEL.MULTI_HEAD.BRANCHES
+        self.branch_inputs = cfg.MODEL.MULTI_HEAD.BRANCH_INPUTS
+        assert len(self.branch_names) == len(self.branch_inputs)
+        assert len(set(self.branch_names)) == len(self.branch_names), self.branch_names
+        for name, branch_input in zip(self.branch_names, self.branch_inputs):
+            if branch_input in ["rgb", "thermal"]:
+                input_shape = branch_shape
+            else:
+                fusion = MID_FUSION_REGISTRY.get(branch_input)(cfg, branch_shape)
+                self.add_module("{}_fusion".format(name), fusion)
+                input_shape = fusion.output_shape()
+            proposal_generator = build_proposal_generator(cfg, input_shape)
+            assert proposal_generator is not None, "MultiHeadRCNN requires a proposal generator!"
+            self.add_module("{}_proposal_generator".format(name), proposal_generator)
+            self.add_module("{}_roi_heads".format(name), build_roi_heads(cfg, input_shape))
+        self.to(self.device)
+
+    def _branch_features(self, name, branch_input, features_RGB, features_thermal):
+        if branch_input == "rgb":
+            return features_RGB
+        if branch_input == "thermal":
+            return features_thermal
+        return getattr(self, "{}_fusion".format(name))(features_RGB, features_thermal)
+
+    def _extract_features(self, batched_inputs):
+        images, rgb_mask = self.preprocess_image(batched_inputs, return_rgb_mask=True)
+        features_RGB, features_thermal = self.extract_mid_fusion_features(images.tensor, rgb_mask)
+        return images, features_RGB, features_thermal
+
+    def forward(self, batched_inputs):
+        """
+        Args:
+            Same as in :class:`GeneralizedRCNN.forward`
+
+        Returns:
+            In training, the losses of all the branches, prefixed by the branch name.
+            In inference, see :meth:`inference`.
+        """
+        if not self.training:
+            return self.inference(batched_inputs)
+
+        images, features_RGB, features_thermal = self._extract_features(batched_inputs)
+        if "instances" in batched_inputs[0]:
+            gt_instances = [x["instances"].to(self.device) for x in batched_inputs]
+        elif "targets" in batched_inputs[0]:
+            log_first_n(
+                logging.WARN, "'targets' in the model inputs is now renamed to 'instances'!", n=10
+            )
+            gt_instances = [x["targets"].to(self.device) for x in batched_inputs]
+        else:
+            gt_instances = None
+
+        losses = {}
+        for name, branch_input in zip(self.branch_names, self.branch_inputs):
+            features = self._branch_features(name, branch_input, features_RGB, features_thermal)
+            proposal_generator = getattr(self, "{}_proposal_generator".format(name))
+            roi_heads = getattr(self, "{}_roi_heads".format(name))
+            proposals, proposal_losses = proposal_generator(images, features, gt_instances)
+            _, detector_losses = roi_heads(images, features, proposals, gt_instances)
+            for k, v in detector_losses.items():
+                losses["{}/{}".format(name, k)] = v
+            for k, v in proposal_losses.items():
+                losses["{}/{}".format(name, k)] = v
+        return losses
+
+    def inference(self, batched_inputs, detected_instances=None, do_postprocess=True):
+        """
+        Run inference on the given inputs.
+
+        Args:
+            batched_inputs (list[dict]): same as in :meth:`forward`
+            detected_instances: not supported, must be None.
+            do_postprocess (bool): whether to apply post-processing on the outputs.
+
+        Returns:
+            list[dict]: one dict per image, with key "branch_instances": a dict that maps
+            the name of each branch to its :class:`Instances`, which have the
+            "prob_score" used by ProbEn. The key "instances" has the :class:`Instances`
+            of the first branch, for the evaluators.
+            If not `do_postprocess`, returns a dict that maps the name of each branch to
+            its list[Instances].
+        """
+        assert not self.training
+        assert detected_instances is None, "MultiHeadRCNN does not support given boxes!"
+
+        images, features_RGB, features_thermal = self._extract_features(batched_inputs)
+        results = {}
+        for name, branch_input in zip(self.branch_names, self.branch_inputs):
+            features = self._branch_features(name, branch_input, features_RGB, features_thermal)
+            proposal_generator = getattr(self, "{}_proposal_generator".format(name))
+            roi_heads = getattr(self, "{}_roi_heads".format(name))
+            proposals, _ = proposal_generator(images, features, None)
+            results[name], _ = roi_heads(images, features, proposals, None)
+        if not do_postprocess:
+            return results
+
+        processed_results = [{"branch_instances": {}} for _ in batched_inputs]
+        for name in self.branch_names:
+            branch_results = GeneralizedRCNN._postprocess(
+                results[name], batched_inputs, images.image_sizes
+            )
+            for processed, r in zip(processed_results, branch_results):
+                processed["branch_instances"][name] = r["instances"]
+        for processed in processed_results:
+            processed["instances"] = processed["branch_instances"][self.branch_names[0]]
+        return processed_results
@@ -8,7 +8,7 @@ from detectron2.structures import ImageList
 from detectron2.utils.events import get_event_storage
 from detectron2.utils.logger import log_first_n
 
-from ..backbone import build_backbone
+from ..backbone import ModalityFallback, build_backbone, build_mid_fusion
 from ..postprocessing import detector_postprocess
 from ..proposal_generator import build_proposal_generator
 from ..roi_heads import build_roi_heads
@@ -33,8 +33,10 @@ class GeneralizedRCNN(nn.Module):
         self.device = torch.device(cfg.MODEL.DEVICE)
         self.backbone_2 = None
 
+        # A two-stream backbone has its own RGB and thermal trunks, and fuses their features
+        two_stream = cfg.MODEL.BACKBONE.NAME == "build_two_stream_backbone"
         if cfg.INPUT.NUM_IN_CHANNELS != 3:
-            if cfg.INPUT.FORMAT == 'BGRTTT':
+            if cfg.INPUT.FORMAT == 'BGRTTT' and not two_stream:
                 input_shape = ShapeSpec(channels=3)
                 self.backbone_2 = build_backbone(cfg, input_shape)
             else:    
@@ -49,12 +51,23 @@ class GeneralizedRCNN(nn.Module):
             self.backbone = build_backbone(cfg)
             num_channels = len(cfg.MODEL.PIXEL_MEAN)
         
+        self.illumination_gate = cfg.MODEL.MID_FUSION.ILLUMINATION_GATE.ENABLED
         if cfg.INPUT.FORMAT == 'BGRTTT':
-            output_shape = {}
-            for key in self.backbone.output_shape().keys():
-                temp_num_channel = self.backbone.output_shape()[key].channels*2
-                temp_stride = self.backbone.output_shape()[key].stride
-                output_shape[key] = ShapeSpec(channels=temp_num_channel, stride=temp_stride)
+            if two_stream:
+                output_shape = self.backbone.output_shape()
+                branch_shape = self.backbone.rgb.output_shape()
+            else:
+                # Fuses the RGB and thermal features of the shared backbone
+                self.mid_fusion = build_mid_fusion(cfg, self.backbone.output_shape())
+                output_shape = self.mid_fusion.output_shape()
+                branch_shape = self.backbone.output_shape()
+            if self.illumination_gate:
+                gate_cfg = cfg.MODEL.MID_FUSION.ILLUMINATION_GATE
+                self.illumination_threshold = gate_cfg.THRESHOLD
+                self.rgb_drop_prob = gate_cfg.DROP_PROB_TRAIN
+                self.rgb_fallback = ModalityFallback(branch_shape)
+                # Luma of the BGR channels
+                self.luma_weights = torch.tensor([0.114, 0.587, 0.299]).to(self.device)
             self.proposal_generator = build_proposal_generator(cfg, output_shape)
             self.roi_heads = build_roi_heads(cfg, output_shape)
             del output_shape
@@ -74,6 +87,9 @@ class GeneralizedRCNN(nn.Module):
         self.vis_period = cfg.VIS_PERIOD
         self.input_format = cfg.INPUT.FORMAT
         assert len(cfg.MODEL.PIXEL_MEAN) == len(cfg.MODEL.PIXEL_STD)
+        assert not self.illumination_gate or self.input_format == 'BGRTTT', (
+            "The illumination gate requires a mid-fusion (BGRTTT) model!"
+        )
         
         self.to(self.device)        
         self.blur_rgb = False
@@ -82,6 +98,11 @@ class GeneralizedRCNN(nn.Module):
         self.max_pool_rgb = False
         if cfg.MODEL.MAX_POOL_RGB:
             self.max_pool_rgb = True
+        self.batched_mid_fusion = cfg.MODEL.MID_FUSION_BATCHED_BACKBONE
+        # Batch statistics would mix the two modalities if they were in one batch
+        self._backbone_has_batch_stats = any(
+            isinstance(m, nn.modules.batchnorm._BatchNorm) for m in self.backbone.modules()
+        )
         """
         self.backbone = build_backbone(cfg)
         self.proposal_generator = build_proposal_generator(cfg, self.backbone.output_shape())
@@ -142,7 +163,74 @@ class GeneralizedRCNN(nn.Module):
         ft_map = input_features['p2']
         gaussian_blur(ft_map,(filter_size,filter_size), (sigma,sigma))
         return None
-        
+
+    def extract_mid_fusion_features(self, images_tensor, rgb_mask=None):
+        """
+        Run the shared backbone (or the trunks of a two-stream backbone) on the RGB and
+        thermal channels of a "BGRTTT" batch.
+
+        Args:
+            images_tensor (Tensor): (N, 6, H, W) normalized images.
+            rgb_mask (Tensor or None): (N,) bool, the images whose RGB features are
+                extracted, see :meth:`get_rgb_mask`. The RGB features of the other
+                images are the learned fallback. None means all the images.
+
+        Returns:
+            dict[str->Tensor], dict[str->Tensor]: the features of the RGB and of the
+            thermal images.
+        """
+        if rgb_mask is not None and bool(rgb_mask.all()):
+            rgb_mask = None
+        if self.backbone_2 is None:
+            features_RGB, features_thermal = self.backbone.extract_features(
+                images_tensor, rgb_mask
+            )
+        else:
+            RGB_tensor = images_tensor[:, :3, :, :]
+            thermal_tensor = images_tensor[:, 3:, :, :]
+            if rgb_mask is not None:
+                RGB_tensor = RGB_tensor[rgb_mask]
+            num_rgb = RGB_tensor.shape[0]
+            if num_rgb == 0:
+                features_RGB = None
+                features_thermal = self.backbone(thermal_tensor)
+            elif self.batched_mid_fusion and not (
+                self.training and self._backbone_has_batch_stats
+            ):
+                # One forward of size 2N instead of two forwards of size N
+                features = self.backbone(torch.cat((RGB_tensor, thermal_tensor), 0))
+                features_RGB = {k: v[:num_rgb] for k, v in features.items()}
+                features_thermal = {k: v[num_rgb:] for k, v in features.items()}
+            else:
+                features_RGB = self.backbone(RGB_tensor)
+                features_thermal = self.backbone(thermal_tensor)
+        if rgb_mask is not None:
+            features_RGB = self.rgb_fallback(features_RGB, features_thermal, rgb_mask)
+        return features_RGB, features_thermal
+
+    def fuse_mid_fusion_features(self, features_RGB, features_thermal):
+        if self.backbone_2 is None:
+            return self.backbone.fusion(features_RGB, features_thermal)
+        return self.mid_fusion(features_RGB, features_thermal)
+
+    def get_rgb_mask(self, images):
+        """
+        The illumination gate: whether the RGB branch runs on each image.
+
+        Args:
+            images (list[Tensor]): the (6, H, W) "BGRTTT" images, before normalization.
+
+        Returns:
+            Tensor: (N,) bool, True for the images that are bright enough. In training,
+            bright images are also dropped with probability
+            `MODEL.MID_FUSION.ILLUMINATION_GATE.DROP_PROB_TRAIN`.
+        """
+        luma = torch.stack([(x[:3].mean(dim=(1, 2)) * self.luma_weights).sum() for x in images])
+        rgb_mask = luma >= self.illumination_threshold
+        if self.training and self.rgb_drop_prob > 0:
+            rgb_mask &= torch.rand(len(images), device=luma.device) >= self.rgb_drop_prob
+        return rgb_mask
+
     def forward(self, batched_inputs):
         """
         Args:
@@ -169,7 +257,7 @@ class GeneralizedRCNN(nn.Module):
         if not self.training:
             return self.inference(batched_inputs)
         
-        images = self.preprocess_image(batched_inputs)
+        images, rgb_mask = self.preprocess_image(batched_inputs, return_rgb_mask=True)
         if "instances" in batched_inputs[0]:
             gt_instances = [x["instances"].to(self.device) for x in batched_inputs]
         elif "targets" in batched_inputs[0]:
@@ -180,20 +268,18 @@ class GeneralizedRCNN(nn.Module):
         else:
             gt_instances = None
         
-        if self.backbone_2:
-            RGB_tensor = images.tensor[:,:3,:,:]
-            thermal_tensor = images.tensor[:,3:,:,:]
-            features_RGB = self.backbone(RGB_tensor)
+        if self.backbone_2 or rgb_mask is not None:
+            features_RGB, features_thermal = self.extract_mid_fusion_features(
+                images.tensor, rgb_mask
+            )
             if self.blur_rgb:
                 features_RGB = self.apply_Gaussian_blur(features_RGB)
-                
-            features_thermal = self.backbone(thermal_tensor)
-            features = {}
-            for key in features_RGB.keys():
-                if self.max_pool_rgb:
-                    max_pooling = nn.MaxPool2d(3, stride=1, padding=1)
+
+            if self.max_pool_rgb:
+                max_pooling = nn.MaxPool2d(3, stride=1, padding=1)
+                for key in features_RGB.keys():
                     features_RGB[key] = max_pooling(features_RGB[key])
-                features[key] = torch.cat((features_RGB[key], features_thermal[key]), 1)
+            features = self.fuse_mid_fusion_features(features_RGB, features_thermal)
             del features_RGB, features_thermal
         else:
             features = self.backbone(images.tensor)
@@ -235,16 +321,13 @@ class GeneralizedRCNN(nn.Module):
         """
         assert not self.training
 
-        images = self.preprocess_image(batched_inputs)
-        
-        if self.backbone_2:
-            RGB_tensor = images.tensor[:,:3,:,:]
-            thermal_tensor = images.tensor[:,3:,:,:]
-            features_RGB = self.backbone(RGB_tensor)
-            features_thermal = self.backbone(thermal_tensor)
-            features = {}
-            for key in features_RGB.keys():                                
-                features[key] = torch.cat((features_RGB[key], features_thermal[key]), 1)
+        images, rgb_mask = self.preprocess_image(batched_inputs, return_rgb_mask=True)
+
+        if self.backbone_2 or rgb_mask is not None:
+            features_RGB, features_thermal = self.extract_mid_fusion_features(
+                images.tensor, rgb_mask
+            )
+            features = self.fuse_mid_fusion_features(features_RGB, features_thermal)
             del features_RGB, features_thermal
         else:
             features = self.backbone(images.tensor)
@@ -266,12 +349,17 @@ class GeneralizedRCNN(nn.Module):
         else:
             return results
 
-    def preprocess_image(self, batched_inputs):
+    def preprocess_image(self, batched_inputs, return_rgb_mask=False):
         """
         Normalize, pad and batch the input images.
+
+        If `return_rgb_mask`, also returns the illumination gate of :meth:`get_rgb_mask`,
+        computed before normalization, or None if the gate is disabled.
         """
         
-        images = [x["image"].to(self.device) for x in batched_inputs]
+        # Images can be uint8, they are converted to float on the device
+        images = [x["image"].to(self.device).float() for x in batched_inputs]
+        rgb_mask = self.get_rgb_mask(images) if self.illumination_gate else None
         if self.input_format == 'BGRTTT':
             imgs = []
             for x in images:
@@ -283,6 +371,8 @@ class GeneralizedRCNN(nn.Module):
         else:
             images = [self.normalizer(x) for x in images]
         images = ImageList.from_tensors(images, self.backbone.size_divisibility)
+        if return_rgb_mask:
+            return images, rgb_mask
         return images
 
     @staticmethod
@@ -329,7 +419,8 @@ class ProposalNetwork(nn.Module):
                 The dict contains one key "proposals" whose value is a
                 :class:`Instances` with keys "proposal_boxes" and "objectness_logits".
         """
-        images = [x["image"].to(self.device) for x in batched_inputs]
+        # Images can be uint8, they are converted to float on the device
+        images = [x["image"].to(self.device).float() for x in batched_inputs]
         images = [self.normalizer(x) for x in images]
         images = ImageList.from_tensors(images, self.backbone.size_divisibility)
         features = self.backbone(images.tensor)
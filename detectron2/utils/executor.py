@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["get_process_executor"]
+
+# name -> (pid, executor)
+_EXECUTORS = {}
+
+
+def get_process_executor(name, max_workers=1):
+    """
+    A thread pool of the current process, shared by all the callers with the same
+    name. Threads do not survive a fork, so a forked process (e.g. a data loader
+    worker) creates its own pool instead of using the threads of its parent.
+
+    Args:
+        name (str): the name of the pool.
+        max_workers (int): the number of threads, when the pool is created.
+
+    Returns:
+        ThreadPoolExecutor:
+    """
+    pid = os.getpid()
+    entry = _EXECUTORS.get(name, None)
+    if entry is None or entry[0] != pid:
+        entry = (pid, ThreadPoolExecutor(max_workers=max_workers))
+        _EXECUTORS[name] = entry
+    return entry[1]
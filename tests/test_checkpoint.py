@@ -5,6 +5,7 @@ import torch
 from torch import nn
 
 from detectron2.checkpoint.c2_model_loading import align_and_update_state_dicts
+from detectron2.checkpoint.mid_fusion_conversion import convert_concat_fusion_weights
 from detectron2.utils.logger import setup_logger
 
 
@@ -43,6 +44,70 @@ class TestCheckpointer(unittest.TestCase):
                 # same content
                 self.assertTrue(loaded.equal(stored))
 
+    def test_convert_concat_fusion_weights(self):
+        weights = {
+            "backbone.fpn_output2.weight": torch.rand(4, 4, 3, 3),
+            "backbone_2.fpn_output2.weight": torch.rand(4, 4, 3, 3),
+            "roi_heads.box_head.fc1.weight": torch.rand(16, 8 * 7 * 7),
+            "roi_heads.box_predictor.cls_score.weight": torch.rand(4, 16),
+            "proposal_generator.rpn_head.conv.weight": torch.rand(8, 8, 3, 3),
+            "proposal_generator.rpn_head.conv.bias": torch.rand(8),
+            "proposal_generator.rpn_head.objectness_logits.weight": torch.rand(3, 8, 1, 1),
+            "proposal_generator.rpn_head.anchor_deltas.weight": torch.rand(12, 8, 1, 1),
+        }
+        # The hidden channels 1, 4, 5, 6 contribute most to the RPN predictions
+        hidden = [1, 4, 5, 6]
+        for k in ["objectness_logits", "anchor_deltas"]:
+            weights["proposal_generator.rpn_head.{}.weight".format(k)][:, hidden] += 10
+        model_state_dict = {
+            "backbone.rgb.fpn_output2.weight": torch.zeros(4, 4, 3, 3),
+            "backbone.thermal.fpn_output2.weight": torch.zeros(4, 4, 3, 3),
+            "backbone.fusion.fuse_p2.weight": torch.zeros(4, 8, 1, 1),
+            "roi_heads.box_head.fc1.weight": torch.zeros(16, 4 * 7 * 7),
+            "roi_heads.box_predictor.cls_score.weight": torch.zeros(4, 16),
+            "proposal_generator.rpn_head.conv.weight": torch.zeros(4, 4, 3, 3),
+            "proposal_generator.rpn_head.conv.bias": torch.zeros(4),
+            "proposal_generator.rpn_head.objectness_logits.weight": torch.zeros(3, 4, 1, 1),
+            "proposal_generator.rpn_head.anchor_deltas.weight": torch.zeros(12, 4, 1, 1),
+        }
+        converted = convert_concat_fusion_weights(weights, model_state_dict)
+        self.assertEqual(converted.keys(), model_state_dict.keys())
+        for trunk in ["rgb", "thermal"]:
+            self.assertTrue(
+                converted["backbone.{}.fpn_output2.weight".format(trunk)].equal(
+                    weights["backbone.fpn_output2.weight"]
+                )
+            )
+        fc1 = weights["roi_heads.box_head.fc1.weight"].view(16, 8, 7 * 7)
+        self.assertTrue(
+            torch.allclose(
+                converted["roi_heads.box_head.fc1.weight"].view(16, 4, 7 * 7),
+                fc1[:, :4] + fc1[:, 4:],
+            )
+        )
+        self.assertTrue(
+            converted["roi_heads.box_predictor.cls_score.weight"].equal(
+                weights["roi_heads.box_predictor.cls_score.weight"]
+            )
+        )
+        # The input channels of the RPN conv are folded, and the same hidden channels
+        # are kept in the conv and in the predictors
+        rpn_conv = weights["proposal_generator.rpn_head.conv.weight"][hidden]
+        self.assertTrue(
+            torch.allclose(
+                converted["proposal_generator.rpn_head.conv.weight"],
+                rpn_conv[:, :4] + rpn_conv[:, 4:],
+            )
+        )
+        key = "proposal_generator.rpn_head.conv.bias"
+        self.assertTrue(converted[key].equal(weights[key][hidden]))
+        for k in ["objectness_logits", "anchor_deltas"]:
+            key = "proposal_generator.rpn_head.{}.weight".format(k)
+            self.assertTrue(converted[key].equal(weights[key][:, hidden]))
+        # Not convertible: keep the initial value
+        key = "backbone.fusion.fuse_p2.weight"
+        self.assertTrue(converted[key].equal(model_state_dict[key]))
+
 
 if __name__ == "__main__":
     unittest.main()
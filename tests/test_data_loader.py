@@ -1,11 +1,15 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
 import copy
+import json
 import numpy as np
+import os
+import tempfile
 import unittest
 import pycocotools.mask as mask_util
 
-from detectron2.data import detection_utils
+from detectron2.data import DatasetFromList, MetadataCatalog, detection_utils
+from detectron2.data.datasets import load_coco_api, load_coco_json
 from detectron2.data import transforms as T
 from detectron2.structures import BitMasks, BoxMode
 
@@ -114,3 +118,63 @@ class TestTransformAnnotations(unittest.TestCase):
         instance = {"bbox": [10, 10, 100, 100], "bbox_mode": BoxMode.XYXY_ABS}
         with self.assertRaises(AssertionError):
             detection_utils.gen_crop_transform_with_instance((10, 10), (15, 15), instance)
+
+
+class TestDatasetFromList(unittest.TestCase):
+    def test_serialize(self):
+        lst = [
+            {"file_name": "{}.jpeg".format(k), "annotations": [{"bbox": [k, 0, 1, 1]}] * k}
+            for k in range(5)
+        ]
+        dataset = DatasetFromList(lst)
+        self.assertEqual(len(dataset), 5)
+        self.assertEqual([dataset[k] for k in range(5)], lst)
+        self.assertEqual(list(dataset), lst)
+
+        # Every element produced is a new object
+        d = dataset[3]
+        d["annotations"][0]["bbox"][0] = -1
+        self.assertEqual(dataset[3], lst[3])
+        self.assertEqual(len(DatasetFromList([])), 0)
+
+
+class TestLoadCocoJson(unittest.TestCase):
+    def _write_json(self, json_file, num_images):
+        images = [
+            {"id": k, "file_name": "thermal_8_bit/{}.jpeg".format(k), "height": 8, "width": 10}
+            for k in range(num_images)
+        ]
+        annotations = [
+            {"id": k, "image_id": k, "bbox": [1, 2, 3, 4], "category_id": 3, "iscrowd": 0}
+            for k in range(num_images)
+        ]
+        categories = [{"id": 1, "name": "person"}, {"id": 3, "name": "car"}]
+        with open(json_file, "w") as f:
+            json.dump({"images": images, "annotations": annotations, "categories": categories}, f)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            json_file = os.path.join(root, "annotations.json")
+            self._write_json(json_file, 3)
+            expected = load_coco_json(json_file, root, "coco_cache_test")
+
+            dicts = load_coco_json(json_file, root, "coco_cache_test", cache=True)
+            self.assertEqual(dicts, expected)
+            self.assertEqual(len([f for f in os.listdir(root) if f.endswith(".pkl")]), 1)
+            # Loaded from the cache, which also sets the metadata
+            dicts = load_coco_json(json_file, root, "coco_cache_test_2", cache=True)
+            self.assertEqual(dicts, expected)
+            self.assertEqual(dicts[0]["annotations"][0]["category_id"], 1)
+            meta = MetadataCatalog.get("coco_cache_test_2")
+            self.assertEqual(meta.thing_classes, ["person", "car"])
+            self.assertEqual(meta.thing_dataset_id_to_contiguous_id, {1: 0, 3: 1})
+
+            # The cache is invalidated when the file changes
+            self._write_json(json_file, 5)
+            self.assertEqual(len(load_coco_json(json_file, root, cache=True)), 5)
+            self.assertEqual(len(load_coco_json(json_file, root, "coco_cache_test", cache=True)), 5)
+
+            coco_api = load_coco_api(json_file, cache=True)
+            coco_api = load_coco_api(json_file, cache=True)
+            self.assertEqual(sorted(coco_api.imgs), list(range(5)))
+            self.assertEqual(len(coco_api.imgToAnns[4]), 1)
@@ -3,11 +3,15 @@
 
 import logging
 import numpy as np
+import torch
 import unittest
+from torch.nn import functional as F
 
 from detectron2.config import get_cfg
 from detectron2.data import detection_utils
+from detectron2.data import BatchAugmentation
 from detectron2.data import transforms as T
+from detectron2.structures import Boxes, Instances
 from detectron2.utils.logger import setup_logger
 
 logger = logging.getLogger(__name__)
@@ -78,3 +82,108 @@ class TestTransforms(unittest.TestCase):
 
         t = T.RandomFlip()
         self.assertTrue(str(t) == "RandomFlip()")
+
+    def test_resize_multichannel_uint8(self):
+        for channels in [4, 6]:
+            image = np.random.randint(0, 256, size=(20, 30, channels), dtype=np.uint8)
+            t = T.ResizeTransform(20, 30, 40, 60, None)
+            resized = t.apply_image(image)
+            self.assertEqual(resized.shape, (40, 60, channels))
+            self.assertEqual(resized.dtype, np.uint8)
+
+
+class TestChannelGroupTransforms(unittest.TestCase):
+    def setUp(self):
+        self.image = np.random.randint(0, 256, size=(10, 12, 6), dtype=np.uint8)
+        self.groups = detection_utils.get_channel_groups("BGRTTT")
+
+    def test_brightness(self):
+        # Only the thermal channels are changed
+        gen = T.RandomGroupBrightness([1.0, 0.5], [1.0, 0.5], self.groups)
+        out = gen.get_transform(self.image).apply_image(self.image)
+        self.assertEqual(out.dtype, np.uint8)
+        self.assertTrue(np.array_equal(out[:, :, :3], self.image[:, :, :3]))
+        expected = np.clip(self.image[:, :, 3:].astype(np.float32) * 0.5, 0, 255).astype(np.uint8)
+        self.assertTrue(np.array_equal(out[:, :, 3:], expected))
+
+    def test_contrast(self):
+        gen = T.RandomGroupContrast(0.0, 0.0, self.groups)
+        out = gen.get_transform(self.image).apply_image(self.image.astype(np.float32))
+        for group in self.groups:
+            self.assertTrue(np.allclose(out[:, :, group], self.image[:, :, group].mean()))
+
+    def test_saturation(self):
+        gen = T.RandomGroupSaturation(0.0, 0.0, self.groups)
+        out = gen.get_transform(self.image).apply_image(self.image.astype(np.float32))
+        # The RGB channels become grayscale, the thermal channels are not changed
+        self.assertTrue(np.allclose(out[:, :, 0], out[:, :, 2]))
+        self.assertTrue(np.allclose(out[:, :, 3:], self.image[:, :, 3:]))
+
+        # An intensity per group, only the one of the color group is used
+        gen = T.RandomGroupSaturation([1.0, 0.0], [1.0, 0.0], self.groups)
+        out = gen.get_transform(self.image).apply_image(self.image.astype(np.float32))
+        self.assertTrue(np.allclose(out, self.image))
+
+    def test_build_transform_gen(self):
+        cfg = get_cfg()
+        cfg.INPUT.FORMAT = "BGRTTT"
+        cfg.INPUT.MODALITY_JITTER.BRIGHTNESS = 0.2
+        tfm_gens = detection_utils.build_transform_gen(cfg, True)
+        self.assertIsInstance(tfm_gens[-1], T.RandomGroupBrightness)
+        self.assertEqual(tfm_gens[-1].channel_groups, self.groups)
+        image, _ = T.apply_transform_gens(tfm_gens, self.image)
+        self.assertEqual(image.shape[2], 6)
+
+
+class TestBatchAugmentation(unittest.TestCase):
+    def _batch(self):
+        batch = []
+        for h, w in [(20, 30), (24, 18)]:
+            image = torch.randint(0, 256, (6, h, w), dtype=torch.uint8)
+            instances = Instances((h, w), gt_classes=torch.tensor([1]))
+            instances.gt_boxes = Boxes(torch.tensor([[2.0, 4.0, 10.0, 12.0]]))
+            batch.append({"image": image, "instances": instances})
+        return batch
+
+    def test_resize_flip(self):
+        batch = self._batch()
+        for flip in [False, True]:
+            aug = BatchAugmentation(40, 70, "choice", flip_prob=float(flip), device="cpu")
+            outputs = aug(batch)
+            for x, out, size in zip(batch, outputs, [(40, 60), (53, 40)]):
+                self.assertEqual(tuple(out["image"].shape), (6,) + size)
+                expected = F.interpolate(
+                    x["image"][None].float(), size=size, mode="bilinear", align_corners=False
+                )[0]
+                if flip:
+                    expected = expected.flip(-1)
+                self.assertTrue(torch.allclose(out["image"], expected, atol=1e-3))
+
+                instances = out["instances"]
+                self.assertEqual(instances.image_size, size)
+                scale = torch.tensor([size[1], size[0]] * 2) / torch.tensor(
+                    [x["image"].shape[2], x["image"].shape[1]] * 2
+                ).float()
+                boxes = x["instances"].gt_boxes.tensor * scale
+                if flip:
+                    boxes = torch.stack(
+                        [size[1] - boxes[:, 2], boxes[:, 1], size[1] - boxes[:, 0], boxes[:, 3]], 1
+                    )
+                self.assertTrue(torch.allclose(instances.gt_boxes.tensor, boxes))
+                self.assertEqual(instances.gt_classes.tolist(), [1])
+
+    def test_jitter(self):
+        aug = BatchAugmentation(40, 70, "choice", brightness=0.5, contrast=0.5, device="cpu")
+        for out in aug(self._batch()):
+            self.assertGreaterEqual(out["image"].min().item(), 0)
+            self.assertLessEqual(out["image"].max().item(), 255)
+
+    def test_jitter_channel_groups(self):
+        aug = BatchAugmentation(
+            40, 70, "choice", brightness=0.5, channel_groups=[[0, 1, 2], [3, 4, 5]], device="cpu"
+        )
+        batch = [{"image": torch.full((6, 20, 30), 100, dtype=torch.uint8)} for _ in range(4)]
+        for out in aug(batch):
+            image = out["image"]
+            self.assertTrue(torch.allclose(image[:3], image[0].expand(3, -1, -1)))
+            self.assertTrue(torch.allclose(image[3:], image[3].expand(3, -1, -1)))
@@ -0,0 +1,554 @@
+import json
+import numpy as np
+import os
+import tempfile
+import unittest
+import torch
+
+from detectron2.fusion import (
+    FUSION_METHODS,
+    FusionClusterCache,
+    PairedFrame,
+    PredictionStore,
+    PredictionStoreWriter,
+    batched_proben_fusion,
+    cluster_detections,
+    evaluate_stream,
+    format_sweep_table,
+    fuse_detections,
+    load_image_sizes,
+    multi_head_predictor_streams,
+    multi_predictor_stream,
+    pad_detections,
+    proben_fusion,
+    read_prediction_lines,
+    sharded_late_fusion,
+    stream_late_fusion,
+    sweep_late_fusion,
+    write_prediction_line,
+)
+from detectron2.structures import Boxes, Instances
+
+
+def get_detections():
+    # Detections 0, 1, 2 overlap and are of class 0; detection 3 overlaps them
+    # but is of class 1; detection 4 is alone.
+    boxes = torch.tensor(
+        [
+            [10.0, 10.0, 50.0, 50.0],
+            [12.0, 10.0, 52.0, 50.0],
+            [10.0, 12.0, 50.0, 52.0],
+            [10.0, 10.0, 50.0, 50.0],
+            [200.0, 200.0, 250.0, 260.0],
+        ],
+        dtype=torch.float64,
+    )
+    probs = torch.tensor(
+        [
+            [0.9, 0.05, 0.03],
+            [0.6, 0.2, 0.1],
+            [0.7, 0.1, 0.1],
+            [0.1, 0.8, 0.05],
+            [0.05, 0.05, 0.85],
+        ],
+        dtype=torch.float64,
+    )
+    classes = probs.argmax(dim=1)
+    scores = probs.max(dim=1)[0]
+    return boxes, scores, classes, probs
+
+
+def get_records(image_id, idx, with_size=True):
+    boxes, scores, classes, probs = get_detections()
+    record = {
+        "image": "{}.jpeg".format(image_id),
+        "image_id": image_id,
+        "boxes": boxes[idx].tolist(),
+        "scores": scores[idx].tolist(),
+        "classes": classes[idx].tolist(),
+        "probs": probs[idx].tolist(),
+    }
+    if with_size:
+        record["height"], record["width"] = 300, 400
+    return record
+
+
+class TestProbEnFusion(unittest.TestCase):
+    def test_cluster_detections(self):
+        boxes, scores, classes, _ = get_detections()
+        keep, cluster_ids = cluster_detections(boxes, scores, classes, 0.5)
+        self.assertEqual(keep.tolist(), [0, 4, 3])
+        self.assertEqual(cluster_ids.tolist(), [0, 0, 0, 2, 1])
+
+    def test_cluster_detections_chain(self):
+        # 0 absorbs 1, but not 2. 2 overlaps 1 only, so it leads its own cluster.
+        boxes = torch.tensor([[0.0, 0, 99, 99], [30, 0, 129, 99], [60, 0, 159, 99]])
+        scores = torch.tensor([0.9, 0.8, 0.7])
+        classes = torch.zeros(3, dtype=torch.int64)
+        keep, cluster_ids = cluster_detections(boxes, scores, classes, 0.4)
+        self.assertEqual(keep.tolist(), [0, 2])
+        self.assertEqual(cluster_ids.tolist(), [0, 0, 1])
+
+    def test_cluster_large_image(self):
+        # With the class offsets of the original loop (x + 640 * class, y + 512 * class),
+        # the class 1 box would be moved onto the class 0 box beyond x=640 and y=512.
+        boxes = torch.tensor([[700.0, 522, 750, 562], [60, 10, 110, 50]])
+        scores = torch.tensor([0.9, 0.8])
+        classes = torch.tensor([0, 1])
+        keep, cluster_ids = cluster_detections(boxes, scores, classes, 0.5)
+        self.assertEqual(keep.tolist(), [0, 1])
+        self.assertEqual(cluster_ids.tolist(), [0, 1])
+
+    def test_cluster_empty(self):
+        keep, cluster_ids = cluster_detections(
+            torch.zeros(0, 4), torch.zeros(0), torch.zeros(0, dtype=torch.int64), 0.5
+        )
+        self.assertEqual(len(keep), 0)
+        self.assertEqual(len(cluster_ids), 0)
+
+    def test_bayesian(self):
+        boxes, scores, classes, probs = get_detections()
+        out_boxes, out_scores, out_classes, keep = proben_fusion(
+            boxes, scores, classes, probs=probs, method="baysian_avg_bbox"
+        )
+        full_probs = np.concatenate([probs[:3].numpy(), 1 - probs[:3].sum(1, keepdim=True)], 1)
+        fused = np.prod(full_probs, axis=0)
+        self.assertTrue(np.allclose(out_scores[0].item(), fused[0] / fused.sum()))
+        self.assertTrue(np.allclose(out_boxes[0].numpy(), boxes[:3].mean(0).numpy()))
+        # Singletons are left untouched
+        self.assertTrue(torch.equal(out_scores[1:], scores[[4, 3]]))
+        self.assertTrue(torch.equal(out_boxes[1:], boxes[[4, 3]]))
+        self.assertEqual(out_classes.tolist(), [0, 2, 1])
+
+    def test_box_fusion(self):
+        boxes, scores, classes, probs = get_detections()
+        out_boxes = proben_fusion(boxes, scores, classes, probs=probs, method="bayesian")[0]
+        self.assertTrue(np.allclose(out_boxes[0].numpy(), boxes[1:3].mean(0).numpy()))
+
+        out_boxes = proben_fusion(
+            boxes, scores, classes, probs=probs, method="bayesian_wt_score_box"
+        )[0]
+        weights = scores[:3] / scores[:3].sum()
+        self.assertTrue(np.allclose(out_boxes[0].numpy(), (weights[:, None] * boxes[:3]).sum(0)))
+
+    def test_class_prior(self):
+        boxes, scores, classes, probs = get_detections()
+        prior = np.array([4.0, 1, 1, 1]) / 7
+        out_scores = proben_fusion(
+            boxes,
+            scores,
+            classes,
+            probs=probs,
+            method="bayesian_prior_wt_score_box",
+            class_prior=prior,
+        )[1]
+        full_probs = np.concatenate([probs[:3].numpy(), 1 - probs[:3].sum(1, keepdim=True)], 1)
+        fused = np.prod(full_probs, axis=0) / prior
+        self.assertTrue(np.allclose(out_scores[0].item(), fused[0] / fused.sum()))
+
+    def test_logits(self):
+        boxes, scores, classes, probs = get_detections()
+        logits = torch.randn(5, 4, dtype=torch.float64)
+        out_scores = proben_fusion(
+            boxes, scores, classes, logits=logits, method="sumLogits_softmax"
+        )[1]
+        expected = torch.softmax(logits[:3].sum(0), dim=0)[0]
+        self.assertTrue(np.allclose(out_scores[0].item(), expected.item()))
+        expected = torch.softmax(logits[4], dim=0)[2]
+        self.assertTrue(np.allclose(out_scores[1].item(), expected.item()))
+
+    def test_pad_detections(self):
+        boxes, scores, classes, probs = get_detections()
+        padded = pad_detections(
+            [boxes[:3].tolist(), [], boxes[3:].tolist()],
+            [scores[:3].tolist(), [], scores[3:].tolist()],
+            [classes[:3].tolist(), [], classes[3:].tolist()],
+            probs=[probs[:3].tolist(), [], probs[3:].tolist()],
+        )
+        self.assertEqual(padded["boxes"].shape, (3, 3, 4))
+        self.assertEqual(padded["probs"].shape, (3, 3, 3))
+        self.assertEqual(padded["valid"].sum(dim=1).tolist(), [3, 0, 2])
+        self.assertTrue(torch.equal(padded["scores"][2, :2], scores[3:]))
+
+    def test_batched_fusion(self):
+        boxes, scores, classes, probs = get_detections()
+        # Image 0: detector 1 fires on 0, 3 and detector 2 on 1, 2, 4.
+        # Image 1: only detector 1 fires, its detections are passed through.
+        det_1 = pad_detections(
+            [boxes[[0, 3]], boxes[:3]],
+            [scores[[0, 3]], scores[:3]],
+            [classes[[0, 3]], classes[:3]],
+            probs=[probs[[0, 3]], probs[:3]],
+        )
+        det_2 = pad_detections(
+            [boxes[[1, 2, 4]], []],
+            [scores[[1, 2, 4]], []],
+            [classes[[1, 2, 4]], []],
+            probs=[probs[[1, 2, 4]], torch.zeros(0, 3)],
+        )
+        instances = batched_proben_fusion(
+            [det_1, det_2], [(300, 300), (100, 100)], method="bayesian_wt_score_box"
+        )
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(instances[1].image_size, (100, 100))
+
+        expected = proben_fusion(
+            boxes, scores, classes, probs=probs, method="bayesian_wt_score_box"
+        )
+        self.assertTrue(np.allclose(instances[0].pred_boxes.tensor, expected[0]))
+        self.assertTrue(np.allclose(instances[0].scores, expected[1]))
+        self.assertEqual(instances[0].pred_classes.tolist(), expected[2].tolist())
+
+        self.assertEqual(len(instances[1]), 3)
+        self.assertTrue(torch.equal(instances[1].scores, scores[[0, 2, 1]]))
+
+    def test_fuse_detections(self):
+        boxes, scores, classes, probs = get_detections()
+
+        def dets(idx):
+            fields = {"boxes": boxes, "scores": scores, "classes": classes, "probs": probs}
+            return {k: v[idx] for k, v in fields.items()}
+
+        # Detector 3 did not fire and detector 4 did not run
+        empty = dets([])
+        out_boxes, out_scores, out_classes = fuse_detections(
+            [dets([0, 3]), dets([1, 2, 4]), empty, None], method="baysian_avg_bbox"
+        )
+        expected = proben_fusion(boxes, scores, classes, probs=probs, method="baysian_avg_bbox")
+        self.assertTrue(torch.equal(out_boxes, expected[0]))
+        self.assertTrue(torch.equal(out_scores, expected[1]))
+        self.assertTrue(torch.equal(out_classes, expected[2]))
+
+        # A single detector fired: its detections are returned unchanged
+        out_boxes, out_scores, out_classes = fuse_detections([dets([0, 1]), empty])
+        self.assertTrue(torch.equal(out_boxes, boxes[:2]))
+        self.assertTrue(torch.equal(out_scores, scores[:2]))
+
+        out_scores = fuse_detections([dets([0, 3]), dets([1, 2, 4])], method="pooling")[1]
+        self.assertTrue(torch.equal(out_scores, scores[[0, 3, 1, 2, 4]]))
+        out_scores = fuse_detections([dets([0, 3]), dets([1, 2, 4])], method="nms")[1]
+        self.assertTrue(torch.equal(out_scores, scores[[0, 4, 3]]))
+
+    def test_weights(self):
+        boxes, scores, classes, probs = get_detections()
+        out_boxes, out_scores, _, _ = proben_fusion(
+            boxes[:2],
+            scores[:2],
+            classes[:2],
+            probs=probs[:2],
+            weights=[2.0, 1.0],
+            method="baysian_avg_bbox",
+        )
+        full_probs = np.concatenate([probs[:2].numpy(), 1 - probs[:2].sum(1, keepdim=True)], 1)
+        fused = full_probs[0] ** 2 * full_probs[1]
+        self.assertTrue(np.allclose(out_scores[0].item(), fused[0] / fused.sum()))
+        self.assertTrue(np.allclose(out_boxes[0], (2 * boxes[0] + boxes[1]) / 3))
+
+
+class _CollectEvaluator:
+    def reset(self):
+        self.outputs = []
+
+    def process(self, inputs, outputs):
+        self.outputs.extend(zip(inputs, outputs))
+
+    def evaluate(self, **kwargs):
+        return dict(num_images=len(self.outputs), **kwargs)
+
+
+class TestStreamingFusion(unittest.TestCase):
+    def test_stream_files(self):
+        records = [
+            [get_records(0, [0, 3]), get_records(1, [0, 1])],
+            [get_records(0, [1, 2, 4]), get_records(1, [])],
+        ]
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            files = [os.path.join(d, "{}.jsonl".format(k)) for k in range(2)]
+            for file_name, recs in zip(files, records):
+                with open(file_name, "w") as f:
+                    for r in recs:
+                        write_prediction_line(f, r)
+            streams = [read_prediction_lines(f) for f in files]
+            outputs = list(stream_late_fusion(streams, method="bayesian"))
+
+        self.assertEqual([x["image_id"] for x, _ in outputs], [0, 1])
+        self.assertEqual(outputs[0][0]["file_name"], "0.jpeg")
+        instances = outputs[0][1]["instances"]
+        self.assertEqual(instances.image_size, (300, 400))
+        boxes, scores, classes, probs = get_detections()
+        expected = proben_fusion(boxes, scores, classes, probs=probs, method="bayesian")
+        self.assertTrue(np.allclose(instances.pred_boxes.tensor, expected[0]))
+        self.assertTrue(np.allclose(instances.scores, expected[1]))
+        self.assertEqual(len(outputs[1][1]["instances"]), 2)
+
+    def test_stream_image_sizes(self):
+        streams = [[get_records(7, [0], with_size=False)], [get_records(7, [1], False)]]
+        outputs = list(stream_late_fusion(streams, image_sizes={7: (10, 20)}))
+        self.assertEqual(outputs[0][1]["instances"].image_size, (10, 20))
+
+    def test_stream_misaligned(self):
+        streams = [[get_records(0, [0])], [get_records(1, [1])]]
+        with self.assertRaises(AssertionError):
+            list(stream_late_fusion(streams))
+
+    def test_stream_truncated(self):
+        # The images of the longer stream are not silently left out
+        streams = [[get_records(0, [0]), get_records(1, [0])], [get_records(0, [1])]]
+        with self.assertRaises(ValueError):
+            list(stream_late_fusion(streams))
+
+    def test_evaluate_stream(self):
+        def predictions():
+            # A lazy stream: the records are produced while being evaluated
+            for image_id in range(3):
+                yield get_records(image_id, [0, 3])
+
+        evaluator = _CollectEvaluator()
+        stream = stream_late_fusion([predictions(), predictions()], method="avg_score")
+        self.assertEqual(evaluate_stream(evaluator, stream), {"num_images": 3})
+        self.assertIsInstance(evaluator.outputs[0][1]["instances"], Instances)
+
+        stream = stream_late_fusion([predictions(), predictions()], method="avg_score")
+        results = evaluate_stream(evaluator, stream, evaluate_kwargs={"out_eval_path": "a.out"})
+        self.assertEqual(results, {"num_images": 3, "out_eval_path": "a.out"})
+
+    def test_multi_head_streams(self):
+        boxes, scores, classes, probs = get_detections()
+        calls = []
+
+        def predictor(image):
+            calls.append(image)
+            branch_instances = {}
+            for name, idx in [("mid_fusion", [0, 3]), ("thermal_only", [1, 2, 4])]:
+                instances = Instances((300, 400))
+                instances.pred_boxes = Boxes(boxes[idx])
+                instances.scores = scores[idx]
+                instances.pred_classes = classes[idx]
+                instances.prob_score = probs[idx]
+                branch_instances[name] = instances
+            return {"branch_instances": branch_instances}
+
+        images = [("image{}".format(k), k, "{}.jpeg".format(k)) for k in range(2)]
+        streams = multi_head_predictor_streams(
+            predictor, iter(images), ["mid_fusion", "thermal_only"]
+        )
+        outputs = list(stream_late_fusion(streams, method="bayesian"))
+        # One forward per image for both branches
+        self.assertEqual(calls, ["image0", "image1"])
+        self.assertEqual([x["image_id"] for x, _ in outputs], [0, 1])
+        expected = proben_fusion(boxes, scores, classes, probs=probs, method="bayesian")
+        self.assertTrue(np.allclose(outputs[0][1]["instances"].scores, expected[1]))
+
+
+class TestPredictionStore(unittest.TestCase):
+    def test_roundtrip(self):
+        records = [
+            get_records(3, [0, 3]),
+            get_records(5, []),
+            get_records(9, [1, 2, 4]),
+        ]
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            with PredictionStoreWriter(d) as writer:
+                for r in records:
+                    writer.add(r)
+            store = PredictionStore(d)
+
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.image_ids.tolist(), [3, 5, 9])
+            for record, ref in zip(store, records):
+                self.assertEqual(record["image"], ref["image"])
+                self.assertEqual((record["height"], record["width"]), (300, 400))
+                for name in ["boxes", "scores", "classes", "probs"]:
+                    ref_value = np.asarray(ref[name]).reshape(record[name].shape)
+                    self.assertTrue(np.allclose(ref_value, record[name]))
+            self.assertEqual(store.get(9)["classes"].tolist(), records[2]["classes"])
+
+            padded = store.pad([2, 1, 0])
+            expected = pad_detections(
+                *[[r[k] for r in records[::-1]] for k in ["boxes", "scores", "classes"]],
+                probs=[r["probs"] for r in records[::-1]],
+            )
+            self.assertEqual(set(padded.keys()), set(expected.keys()))
+            for k, v in expected.items():
+                self.assertTrue(torch.allclose(padded[k], v, atol=1e-6), k)
+
+            # A store is a stream of records
+            outputs = list(stream_late_fusion([store, store], method="bayesian"))
+            self.assertEqual([x["image_id"] for x, _ in outputs], [3, 5, 9])
+
+
+class TestFusionSweep(unittest.TestCase):
+    def _padded(self):
+        boxes, scores, classes, probs = get_detections()
+        # Image 0: both detectors fire. Image 1: only detector 1 fires.
+        det_1 = pad_detections(
+            [boxes[[0, 3]], boxes[:3]],
+            [scores[[0, 3]], scores[:3]],
+            [classes[[0, 3]], classes[:3]],
+            probs=[probs[[0, 3]], probs[:3]],
+        )
+        det_2 = pad_detections(
+            [boxes[[1, 2, 4]], []],
+            [scores[[1, 2, 4]], []],
+            [classes[[1, 2, 4]], []],
+            probs=[probs[[1, 2, 4]], torch.zeros(0, 3)],
+        )
+        return [det_1, det_2]
+
+    def test_cache_same_as_batched_fusion(self):
+        detections = self._padded()
+        cache = FusionClusterCache(detections, 0.5, chunk_size=1)
+        prior = np.array([4, 1, 1, 1]) / 7.0
+        for method in FUSION_METHODS:
+            if method in ("avgLogits_softmax", "sumLogits_softmax"):
+                continue
+            for weights in [None, [2.0, 1.0]]:
+                fused = cache.fuse(method, weights=weights, class_prior=prior)
+                expected = batched_proben_fusion(
+                    detections,
+                    [(300, 300), (100, 100)],
+                    weights=weights,
+                    method=method,
+                    class_prior=prior,
+                )
+                for (boxes, scores, classes), instances in zip(fused, expected):
+                    self.assertTrue(torch.allclose(boxes, instances.pred_boxes.tensor))
+                    self.assertTrue(torch.allclose(scores, instances.scores))
+                    self.assertTrue(torch.equal(classes, instances.pred_classes))
+
+        # Same NMS as fuse_detections
+        boxes, scores, classes, _ = get_detections()
+
+        def dets(idx):
+            return {"boxes": boxes[idx], "scores": scores[idx], "classes": classes[idx]}
+
+        nms = cache.fuse("nms")
+        for (out_boxes, out_scores, out_classes), image_dets in zip(
+            nms, [[dets([0, 3]), dets([1, 2, 4])], [dets([0, 1, 2]), None]]
+        ):
+            expected = fuse_detections(image_dets, method="nms")
+            self.assertTrue(torch.allclose(out_boxes.double(), expected[0]))
+            self.assertTrue(torch.allclose(out_scores.double(), expected[1]))
+            self.assertTrue(torch.equal(out_classes, expected[2]))
+        self.assertEqual(len(cache.fuse("pooling")[0][1]), 5)
+
+    def test_sweep(self):
+        inputs = [
+            {"image_id": 0, "height": 300, "width": 300},
+            {"image_id": 1, "height": 100, "width": 100},
+        ]
+        methods = ["nms", "bayesian", "bayesian_prior_wt_score_box"]
+        priors = {"uniform": np.ones(4) / 4, "person": np.array([4, 1, 1, 1]) / 7.0}
+        for num_workers in [0, 2]:
+            results = sweep_late_fusion(
+                self._padded(),
+                inputs,
+                _CollectEvaluator(),
+                methods=methods,
+                iou_thresholds=[0.5, 0.7],
+                class_priors=priors,
+                num_workers=num_workers,
+            )
+            self.assertEqual(len(results), 2 * 4)
+            self.assertIn(("bayesian_prior_wt_score_box", 0.7, "person", None), results)
+            self.assertEqual(results[("nms", 0.5, None, None)], {"num_images": 2})
+        table = format_sweep_table(results)
+        self.assertEqual(len(table.splitlines()), 2 + len(results))
+
+
+class _ShardEvaluator:
+    def reset(self):
+        self._predictions = []
+
+    def process(self, inputs, outputs):
+        for x, y in zip(inputs, outputs):
+            self._predictions.append((x["image_id"], x["height"], len(y["instances"])))
+
+    def evaluate(self):
+        return {"predictions": sorted(self._predictions)}
+
+
+class TestShardedFusion(unittest.TestCase):
+    def test_sharded(self):
+        records = [
+            [get_records(k, [0, 3]) for k in range(5)],
+            [get_records(k, [1, 2, 4] if k != 3 else []) for k in range(5)],
+        ]
+        records[0][3] = get_records(3, [])
+        keys = ["image", "image_id", "boxes", "scores", "classes", "probs"]
+        predictions = [{k: [r[k] for r in recs] for k in keys} for recs in records]
+        image_sizes = {k: (10 * k + 1, 20) for k in range(5)}
+        expected = [(k, 10 * k + 1, 3) for k in range(5) if k != 3]
+        for num_workers in [0, 2]:
+            results = sharded_late_fusion(
+                predictions,
+                _ShardEvaluator(),
+                image_sizes,
+                method="bayesian",
+                num_workers=num_workers,
+                num_shards=3,
+            )
+            self.assertEqual(results, {"predictions": expected})
+
+    def test_load_image_sizes(self):
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            json_file = os.path.join(d, "annotations.json")
+            with open(json_file, "w") as f:
+                json.dump({"images": [{"id": 3, "height": 512, "width": 640}]}, f)
+            self.assertEqual(load_image_sizes(json_file), {3: (512, 640)})
+
+
+class TestPairedInputs(unittest.TestCase):
+    def _frame(self):
+        rgb = np.random.randint(0, 256, size=(16, 20, 3), dtype=np.uint8)
+        thermal = np.random.randint(0, 256, size=(8, 10, 3), dtype=np.uint8)
+        return PairedFrame(rgb, thermal)
+
+    def test_views(self):
+        frame = self._frame()
+        self.assertIs(frame.view("RGB"), frame.rgb)
+        self.assertIs(frame.view("thermal_only"), frame.thermal)
+        bgrt, bgrttt = frame.view("early_fusion"), frame.view("mid_fusion")
+        self.assertEqual(bgrt.shape, (8, 10, 4))
+        self.assertEqual(bgrttt.shape, (8, 10, 6))
+        # Both fused inputs share one buffer
+        self.assertTrue(np.shares_memory(bgrt, bgrttt))
+        self.assertTrue(np.array_equal(bgrttt[:, :, 3:6], frame.thermal))
+        self.assertTrue(np.array_equal(bgrt[:, :, 3], frame.thermal[:, :, 0]))
+
+    def test_multi_predictor_stream(self):
+        seen = []
+
+        def predictor(image):
+            seen.append(image.shape[2])
+            instances = Instances(image.shape[:2])
+            instances.pred_boxes = Boxes(torch.tensor([[1.0, 1.0, 5.0, 5.0]]))
+            instances.scores = torch.tensor([0.9])
+            instances.pred_classes = torch.tensor([image.shape[2] % 3])
+            return {"instances": instances}
+
+        predictors = {
+            "a": ("thermal_only", predictor),
+            "b": ("early_fusion", predictor),
+            "c": ("mid_fusion", predictor),
+        }
+        frames = [(self._frame(), k, "{}.jpg".format(k)) for k in range(2)]
+        outputs = list(multi_predictor_stream(predictors, frames))
+        self.assertEqual(seen, [3, 4, 6, 3, 4, 6])
+        self.assertEqual(len(outputs), 2)
+        self.assertEqual(outputs[1]["b"]["image_id"], 1)
+        self.assertEqual(outputs[1]["b"]["image"], "1.jpg")
+        self.assertEqual(outputs[0]["c"]["classes"], [0])
+        self.assertEqual((outputs[0]["a"]["height"], outputs[0]["a"]["width"]), (8, 10))
+
+        # Batched predictors give the same records
+        def batch_predictor(images):
+            return [predictor(x) for x in images]
+
+        batch_predictors = {k: (v, batch_predictor) for k, (v, _) in predictors.items()}
+        batched = list(multi_predictor_stream(batch_predictors, iter(frames), batch_size=3))
+        self.assertEqual(batched, outputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -148,3 +148,161 @@ class RetinaNetE2ETest(ModelE2ETest):
             # all predictions (if any) are infinite or nan
             if len(det[0]):
                 self.assertTrue(torch.isfinite(det[0].pred_boxes.tensor).sum() == 0)
+
+
+def get_mid_fusion_cfg():
+    cfg = get_cfg()
+    cfg_file = model_zoo.get_config_file("COCO-Detection/faster_rcnn_R_50_FPN_1x.yaml")
+    cfg.merge_from_file(cfg_file)
+    cfg.INPUT.FORMAT = "BGRTTT"
+    cfg.INPUT.NUM_IN_CHANNELS = 6
+    cfg.MODEL.PIXEL_MEAN = [103.530, 116.280, 123.675, 135.438, 135.438, 135.438]
+    cfg.MODEL.PIXEL_STD = [1.0] * 6
+    if not torch.cuda.is_available():
+        cfg.MODEL.DEVICE = "cpu"
+    return cfg
+
+
+def get_mid_fusion_inputs():
+    return [
+        create_model_input(torch.rand(6, 200, 250) * 255, get_empty_instance(200, 250)),
+        create_model_input(torch.rand(6, 200, 249) * 255, get_empty_instance(200, 249)),
+    ]
+
+
+class MidFusionE2ETest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(43)
+        self.model = build_model(get_mid_fusion_cfg())
+
+    def test_batched_backbone(self):
+        self.model.eval()
+        images = torch.rand(2, 6, 64, 96, device=self.model.device)
+        with torch.no_grad():
+            self.model.batched_mid_fusion = True
+            batched = self.model.extract_mid_fusion_features(images)
+            self.model.batched_mid_fusion = False
+            sequential = self.model.extract_mid_fusion_features(images)
+        for features, expected in zip(batched, sequential):
+            self.assertEqual(features.keys(), expected.keys())
+            for k in features:
+                self.assertTrue(torch.allclose(features[k], expected[k], atol=1e-4))
+
+    def test_train(self):
+        self.model.train()
+        with EventStorage():
+            losses = self.model(get_mid_fusion_inputs())
+            sum(losses.values()).backward()
+
+    def test_fusion_neck(self):
+        for fusion in ["SumFusion", "ConvFusion", "GatedSumFusion", "AttentionFusion"]:
+            cfg = get_mid_fusion_cfg()
+            cfg.MODEL.MID_FUSION.NAME = fusion
+            model = build_model(cfg)
+            # The heads are as wide as the features of one modality
+            self.assertEqual(model.proposal_generator.rpn_head.conv.in_channels, 256)
+            model.train()
+            with EventStorage():
+                losses = model(get_mid_fusion_inputs())
+                sum(losses.values()).backward()
+
+    def test_illumination_gate(self):
+        for backbone in ["build_resnet_fpn_backbone", "build_two_stream_backbone"]:
+            torch.manual_seed(43)
+            cfg = get_mid_fusion_cfg()
+            cfg.MODEL.BACKBONE.NAME = backbone
+            cfg.MODEL.MID_FUSION.ILLUMINATION_GATE.ENABLED = True
+            model = build_model(cfg)
+            model.eval()
+            day = torch.full((6, 64, 96), 200.0, device=model.device)
+            night = torch.full((6, 64, 96), 10.0, device=model.device)
+            rgb_mask = model.get_rgb_mask([day, night])
+            self.assertEqual(rgb_mask.tolist(), [True, False])
+
+            images = torch.rand(2, 6, 64, 96, device=model.device)
+            with torch.no_grad():
+                expected, _ = model.extract_mid_fusion_features(images)
+                features_RGB, features_thermal = model.extract_mid_fusion_features(
+                    images, rgb_mask
+                )
+            for k, v in features_RGB.items():
+                self.assertTrue(torch.allclose(v[0], expected[k][0], atol=1e-4))
+                self.assertTrue((v[1] == 0).all())
+
+            model.train()
+            inputs = get_mid_fusion_inputs()
+            inputs[0]["image"] = inputs[0]["image"] * 0.1
+            with EventStorage():
+                losses = model(inputs)
+                sum(losses.values()).backward()
+            self.assertIsNotNone(model.rgb_fallback.fallback_p2.grad)
+
+
+class MultiHeadRCNNE2ETest(unittest.TestCase):
+    def test_branches(self):
+        for backbone in ["build_resnet_fpn_backbone", "build_two_stream_backbone"]:
+            torch.manual_seed(43)
+            cfg = get_mid_fusion_cfg()
+            cfg.MODEL.META_ARCHITECTURE = "MultiHeadRCNN"
+            cfg.MODEL.BACKBONE.NAME = backbone
+            cfg.MODEL.MULTI_HEAD.BRANCHES = ["mid_fusion", "thermal_only", "sum"]
+            cfg.MODEL.MULTI_HEAD.BRANCH_INPUTS = ["ConcatFusion", "thermal", "SumFusion"]
+            model = build_model(cfg)
+            self.assertEqual(model.mid_fusion_proposal_generator.rpn_head.conv.in_channels, 512)
+            self.assertEqual(model.thermal_only_proposal_generator.rpn_head.conv.in_channels, 256)
+
+            model.train()
+            with EventStorage():
+                losses = model(get_mid_fusion_inputs())
+                sum(losses.values()).backward()
+            self.assertIn("thermal_only/loss_cls", losses)
+            self.assertIn("sum/loss_rpn_cls", losses)
+
+            model.eval()
+            inputs = [{"image": torch.rand(6, 200, 250) * 255}]
+            with torch.no_grad():
+                outputs = model(inputs)
+            self.assertEqual(
+                set(outputs[0]["branch_instances"].keys()), {"mid_fusion", "thermal_only", "sum"}
+            )
+            self.assertIs(outputs[0]["instances"], outputs[0]["branch_instances"]["mid_fusion"])
+
+    def test_unused_fusion(self):
+        cfg = get_mid_fusion_cfg()
+        cfg.MODEL.META_ARCHITECTURE = "MultiHeadRCNN"
+        cfg.MODEL.MID_FUSION.NAME = "ConvFusion"
+        with self.assertRaises(AssertionError):
+            build_model(cfg)
+
+
+class TwoStreamE2ETest(unittest.TestCase):
+    def _build_model(self, fusion):
+        torch.manual_seed(43)
+        cfg = get_mid_fusion_cfg()
+        cfg.MODEL.BACKBONE.NAME = "build_two_stream_backbone"
+        cfg.MODEL.MID_FUSION.NAME = fusion
+        return build_model(cfg)
+
+    def test_concurrent_branches(self):
+        model = self._build_model("ConcatFusion")
+        model.eval()
+        images = torch.rand(2, 6, 64, 96, device=model.device)
+        with torch.no_grad():
+            model.backbone.concurrent = True
+            concurrent = model.backbone(images)
+            model.backbone.concurrent = False
+            sequential = model.backbone(images)
+        for k, v in sequential.items():
+            self.assertEqual(v.shape[1], 512)
+            self.assertTrue(torch.allclose(concurrent[k], v))
+
+    def test_train(self):
+        for fusion in ["ConcatFusion", "SumFusion", "ConvFusion"]:
+            model = self._build_model(fusion)
+            model.train()
+            with EventStorage():
+                losses = model(get_mid_fusion_inputs())
+                sum(losses.values()).backward()
+            # Both trunks are trained
+            for trunk in [model.backbone.rgb, model.backbone.thermal]:
+                self.assertIsNotNone(trunk.fpn_output2.weight.grad)
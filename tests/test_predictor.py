@@ -0,0 +1,81 @@
+import numpy as np
+import unittest
+
+from detectron2.config import get_cfg
+from detectron2.engine import BatchPredictor
+
+
+class _RecordingModel:
+    """
+    Returns the size of its inputs instead of detections.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batched_inputs):
+        self.batch_sizes.append(len(batched_inputs))
+        return [
+            {"image_size": tuple(x["image"].shape), "height": x["height"], "width": x["width"]}
+            for x in batched_inputs
+        ]
+
+
+class TestBatchPredictor(unittest.TestCase):
+    def _cfg(self):
+        cfg = get_cfg()
+        cfg.MODEL.DEVICE = "cpu"
+        cfg.DATASETS.TEST = ("predictor_test",)
+        cfg.INPUT.MIN_SIZE_TEST = 32
+        cfg.INPUT.MAX_SIZE_TEST = 64
+        return cfg
+
+    def test_batches(self):
+        predictor = BatchPredictor(self._cfg(), batch_size=2)
+        predictor.model = _RecordingModel()
+        images = [np.zeros((16 + k, 20, 3), dtype=np.uint8) for k in range(5)]
+        outputs = predictor(images)
+
+        self.assertEqual(predictor.model.batch_sizes, [2, 2, 1])
+        self.assertEqual([x["height"] for x in outputs], [16, 17, 18, 19, 20])
+        self.assertEqual(outputs[0]["image_size"], (3, 32, 40))
+
+    def test_none_image(self):
+        # A failed read does not silently end the images
+        predictor = BatchPredictor(self._cfg(), batch_size=2)
+        predictor.model = _RecordingModel()
+        image = np.zeros((16, 20, 3), dtype=np.uint8)
+        images = [image, None, image]
+        with self.assertRaises(Exception):
+            predictor(images)
+        predictor.close()
+
+    def test_bounded_preprocessing(self):
+        preprocessed = []
+        num_preprocessed = []
+        model = _RecordingModel()
+
+        def recording_model(batched_inputs):
+            num_preprocessed.append(len(preprocessed))
+            return model(batched_inputs)
+
+        with BatchPredictor(self._cfg(), batch_size=2) as predictor:
+            preprocess = predictor._preprocess
+
+            def recording_preprocess(image):
+                preprocessed.append(image.shape)
+                return preprocess(image)
+
+            predictor._preprocess = recording_preprocess
+            predictor.model = recording_model
+            outputs = predictor([np.zeros((16, 20, 3), dtype=np.uint8) for _ in range(10)])
+        self.assertEqual(len(outputs), 10)
+        # The batch of the model, and at most two batches waiting
+        self.assertLessEqual(num_preprocessed[0], 6)
+        # The threads are shut down
+        with self.assertRaises(RuntimeError):
+            predictor._executor.submit(print)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import cv2
+import itertools
+import numpy as np
+import os
+import pickle
+import tempfile
+import unittest
+
+from detectron2.data import (
+    RGBT_PAIRING_REGISTRY,
+    RGBTPairCache,
+    RGBTShardDataset,
+    add_rgbt_file_names,
+    build_rgbt_pair_cache,
+    write_rgbt_shards,
+)
+from detectron2.data import detection_utils
+
+
+def write_rgbt_pairs(root, num_images):
+    """
+    Write random FLIR-like pairs: a large RGB .jpg and a small thermal .jpeg.
+
+    Returns:
+        list[str]: the file names of the thermal images.
+    """
+    os.makedirs(os.path.join(root, "RGB"))
+    os.makedirs(os.path.join(root, "thermal_8_bit"))
+    file_names = []
+    for k in range(num_images):
+        rgb = np.random.randint(0, 256, size=(50, 60, 3), dtype=np.uint8)
+        thermal = np.random.randint(0, 256, size=(20, 24), dtype=np.uint8)
+        cv2.imwrite(os.path.join(root, "RGB", "FLIR_{:05d}.jpg".format(k)), rgb)
+        file_name = os.path.join(root, "thermal_8_bit", "FLIR_{:05d}.jpeg".format(k))
+        cv2.imwrite(file_name, thermal)
+        file_names.append(file_name)
+    return file_names
+
+
+class TestRGBTPairCache(unittest.TestCase):
+    def test_same_as_decoded(self):
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            file_names = write_rgbt_pairs(os.path.join(d, "images"), 3)
+            cache_dir = os.path.join(d, "cache")
+            build_rgbt_pair_cache(file_names[:2], cache_dir, num_workers=0)
+            cache = RGBTPairCache(cache_dir)
+            self.assertEqual(len(cache), 2)
+            self.assertNotIn(file_names[2], cache)
+
+            for file_name in file_names:
+                for format in ["BGRT", "BGRTTT"]:
+                    image = detection_utils.read_image(file_name, format, pair_cache=cache)
+                    expected = detection_utils.read_image(file_name, format)
+                    self.assertEqual(image.dtype, np.uint8)
+                    self.assertEqual(expected.dtype, np.uint8)
+                    self.assertTrue(np.array_equal(image, expected))
+
+            # The memory map is not pickled into the data loader workers
+            cache.read(file_names[0])
+            cache = pickle.loads(pickle.dumps(cache))
+            expected = detection_utils.read_image(file_names[1], "BGRTTT")
+            self.assertTrue(np.array_equal(cache.read(file_names[1]), expected))
+
+
+class TestRGBTShards(unittest.TestCase):
+    def test_stream(self):
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            file_names = write_rgbt_pairs(os.path.join(d, "images"), 5)
+            dataset_dicts = add_rgbt_file_names(
+                [
+                    {
+                        "file_name": f,
+                        "image_id": k,
+                        "annotations": [{"bbox": [1, 2, 3, 4], "bbox_mode": 1, "category_id": 0}],
+                    }
+                    for k, f in enumerate(file_names)
+                ],
+                "FLIR",
+            )
+            shard_dir = os.path.join(d, "shards")
+            write_rgbt_shards(dataset_dicts, shard_dir, samples_per_shard=2)
+            self.assertEqual(len([f for f in os.listdir(shard_dir) if f.endswith(".tar")]), 3)
+
+            dataset = RGBTShardDataset(shard_dir, shuffle=False, seed=0)
+            self.assertEqual(len(dataset), 5)
+            # Infinite stream of epochs
+            samples = list(itertools.islice(dataset, 10))
+            image_ids = [x["image_id"] for x in samples]
+            self.assertEqual(image_ids[:5], image_ids[5:])
+            self.assertEqual(sorted(image_ids[:5]), list(range(5)))
+            for x in samples[:5]:
+                expected = dataset_dicts[x["image_id"]]
+                self.assertEqual(x["rgb_file_name"], expected["rgb_file_name"])
+                self.assertEqual(x["annotations"][0]["bbox"], [1, 2, 3, 4])
+                image = detection_utils.read_image(
+                    x["file_name"], "BGRTTT", pair_bytes=x["rgbt_bytes"]
+                )
+                self.assertTrue(
+                    np.array_equal(image, detection_utils.read_image(x["file_name"], "BGRTTT"))
+                )
+
+            dataset = RGBTShardDataset(shard_dir, shuffle_buffer=2, seed=0)
+            self.assertEqual(len(list(itertools.islice(dataset, 12))), 12)
+
+
+class TestRGBTPairing(unittest.TestCase):
+    def test_resolvers(self):
+        flir = RGBT_PAIRING_REGISTRY.get("FLIR")
+        self.assertEqual(
+            flir("FLIR/val/thermal_8_bit/FLIR_00001.jpeg"), "FLIR/val/RGB/FLIR_00001.jpg"
+        )
+        kaist = RGBT_PAIRING_REGISTRY.get("KAIST")
+        self.assertEqual(
+            kaist("images/set00/V000/lwir/I00000.jpg"), "images/set00/V000/visible/I00000.jpg"
+        )
+
+    def test_read_paired_image(self):
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            file_names = write_rgbt_pairs(os.path.join(d, "images"), 2)
+            dataset_dicts = add_rgbt_file_names([{"file_name": f} for f in file_names], "FLIR")
+            self.assertEqual(dataset_dicts[1]["thermal_file_name"], file_names[1])
+
+            # Another layout: the explicit RGB file name is used
+            rgb_file_name = os.path.join(d, "other_rgb.jpg")
+            os.rename(dataset_dicts[1]["rgb_file_name"], rgb_file_name)
+            image = detection_utils.read_image(
+                file_names[1], "BGRT", rgb_file_name=rgb_file_name
+            )
+            os.rename(rgb_file_name, dataset_dicts[1]["rgb_file_name"])
+            expected = detection_utils.read_image(file_names[1], "BGRT")
+            self.assertTrue(np.array_equal(image, expected))
+
+    def test_reduced_decode(self):
+        with tempfile.TemporaryDirectory(prefix="detectron2_test") as d:
+            root = os.path.join(d, "images")
+            file_name = write_rgbt_pairs(root, 1)[0]
+            # A smooth RGB image 4.5x larger than the thermal image
+            rgb = np.random.randint(0, 256, size=(9, 12, 3), dtype=np.uint8)
+            rgb = cv2.resize(rgb, (108, 90))
+            cv2.imwrite(os.path.join(root, "RGB", "FLIR_00000.jpg"), rgb)
+
+            rgb_file = os.path.join(root, "RGB", "FLIR_00000.jpg")
+            self.assertEqual(
+                detection_utils._rgb_decode_flag(rgb_file, (20, 24)), cv2.IMREAD_REDUCED_COLOR_4
+            )
+            rgb_img, thermal_img = detection_utils.read_rgbt_pair(file_name, reduced_decode=True)
+            expected_rgb, expected_thermal = detection_utils.read_rgbt_pair(file_name)
+            self.assertTrue(np.array_equal(thermal_img, expected_thermal))
+            self.assertEqual(rgb_img.shape, expected_rgb.shape)
+            diff = np.abs(rgb_img.astype(np.float32) - expected_rgb.astype(np.float32))
+            self.assertLess(diff.mean(), 10)
+            # The size of the thermal image is given instead of read from its header
+            rgb_img_2, _ = detection_utils.read_rgbt_pair(
+                file_name, reduced_decode=True, image_size=thermal_img.shape[:2]
+            )
+            self.assertTrue(np.array_equal(rgb_img_2, rgb_img))
+            with self.assertRaises(detection_utils.SizeMismatchError):
+                detection_utils.read_rgbt_pair(file_name, image_size=(21, 24))
+
+            # Both images are decoded as by cv2
+            self.assertTrue(np.array_equal(expected_thermal, cv2.imread(file_name)))
+
+
+if __name__ == "__main__":
+    unittest.main()
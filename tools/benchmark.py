@@ -6,12 +6,19 @@ A script to benchmark builtin models.
 Note: this script has an extra dependency of psutil.
 """
 
+import copy
+import cv2
 import itertools
+import json
 import logging
+import numpy as np
 import psutil
 import torch
 import tqdm
+from collections import OrderedDict
+from fvcore.common.file_io import PathManager
 from fvcore.common.timer import Timer
+from tabulate import tabulate
 from torch.nn.parallel import DistributedDataParallel
 
 from detectron2.checkpoint import DetectionCheckpointer
@@ -20,10 +27,16 @@ from detectron2.data import (
     DatasetFromList,
     build_detection_test_loader,
     build_detection_train_loader,
+    get_detection_dataset_dicts,
+    rgbt_pairing,
 )
+from detectron2.data import detection_utils as utils
+from detectron2.data import transforms as T
+from detectron2.data.build import trivial_batch_collator
 from detectron2.engine import SimpleTrainer, default_argument_parser, hooks, launch
 from detectron2.modeling import build_model
 from detectron2.solver import build_optimizer
+from detectron2.structures import ImageList
 from detectron2.utils import comm
 from detectron2.utils.events import CommonMetricPrinter
 from detectron2.utils.logger import setup_logger
@@ -84,6 +97,138 @@ def benchmark_data(args):
         )
 
 
+_PIPELINE_STAGES = ["decode", "pairing", "transform", "to_tensor", "collate"]
+
+
+def _time_pipeline_stages(cfg, dataset_dicts):
+    """
+    Time the stages of `DatasetMapper` on the dataset dicts, sequentially in this process.
+    The thermal and RGB images are decoded one after the other, while `read_rgbt_pair`
+    decodes them concurrently.
+
+    Returns:
+        dict: the mean time of every stage per image, in milliseconds.
+    """
+    img_format = cfg.INPUT.FORMAT
+    tfm_gens = utils.build_transform_gen(cfg, True)
+    totals = OrderedDict((stage, 0.0) for stage in _PIPELINE_STAGES)
+    images = []
+    for d in dataset_dicts:
+        timer = Timer()
+        if img_format in ("BGRT", "BGRTTT"):
+            rgb_file_name = d.get("rgb_file_name") or rgbt_pairing.FLIR(d["file_name"])
+            thermal = cv2.imread(d["file_name"])
+            rgb = cv2.imread(rgb_file_name)
+            totals["decode"] += timer.seconds()
+
+            timer.reset()
+            rgb = cv2.resize(rgb, (thermal.shape[1], thermal.shape[0]))
+            if img_format == "BGRT":
+                thermal = thermal[:, :, 0:1]
+            image = np.concatenate((rgb, thermal), axis=2)
+            totals["pairing"] += timer.seconds()
+        else:
+            image = utils.read_image(d["file_name"], img_format)
+            totals["decode"] += timer.seconds()
+
+        timer.reset()
+        image, transforms = T.apply_transform_gens(tfm_gens, image)
+        annos = [
+            utils.transform_instance_annotations(copy.deepcopy(obj), transforms, image.shape[:2])
+            for obj in d.get("annotations", [])
+            if obj.get("iscrowd", 0) == 0
+        ]
+        utils.annotations_to_instances(annos, image.shape[:2])
+        totals["transform"] += timer.seconds()
+
+        timer.reset()
+        if img_format in ("BGRT", "BGRTTT"):
+            image = torch.as_tensor(np.ascontiguousarray(image.transpose(2, 0, 1)))
+        else:
+            image = torch.as_tensor(image.transpose(2, 0, 1).astype("float32")).contiguous()
+        totals["to_tensor"] += timer.seconds()
+        images.append({"image": image})
+
+    # Batching, and padding of the images of a batch as done by the model
+    batch_size = cfg.SOLVER.IMS_PER_BATCH
+    timer = Timer()
+    for start in range(0, len(images), batch_size):
+        batch = trivial_batch_collator(images[start : start + batch_size])
+        ImageList.from_tensors([x["image"].float() for x in batch], 32)
+    totals["collate"] += timer.seconds()
+    return OrderedDict((k, v * 1000 / len(dataset_dicts)) for k, v in totals.items())
+
+
+def _loader_throughput(cfg, num_iters):
+    """
+    Returns:
+        float: images per second produced by the training data loader of this rank.
+    """
+    data_loader = build_detection_train_loader(cfg)
+    itr = iter(data_loader)
+    for _ in range(5):  # warmup, including the start of the workers
+        next(itr)
+    timer = Timer()
+    num_images = sum(len(next(itr)) for _ in range(num_iters))
+    throughput = num_images / timer.seconds()
+    del itr
+    return throughput
+
+
+def benchmark_data_pipeline(args):
+    """
+    Break down the time of the training data pipeline into stages, and measure the
+    throughput of the data loader for every combination of INPUT.FORMAT and
+    DATALOADER.NUM_WORKERS. Writes a json report to `args.report`.
+    """
+    cfg = setup(args)
+    dataset_dicts = get_detection_dataset_dicts(
+        cfg.DATASETS.TRAIN, filter_empty=cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS
+    )
+    dataset_dicts = dataset_dicts[: args.num_samples]
+
+    report = {"num_samples": len(dataset_dicts), "stages_ms": {}, "throughput": []}
+    for img_format in args.formats:
+        cfg_format = cfg.clone()
+        cfg_format.defrost()
+        cfg_format.INPUT.FORMAT = img_format
+        stages = _time_pipeline_stages(cfg_format, dataset_dicts)
+        report["stages_ms"][img_format] = stages
+        logger.info(
+            "Stages of {} per image (ms): {}".format(
+                img_format, ", ".join("{}={:.2f}".format(k, v) for k, v in stages.items())
+            )
+        )
+
+        for num_workers in args.workers:
+            cfg_format.DATALOADER.NUM_WORKERS = num_workers
+            throughput = _loader_throughput(cfg_format, args.num_iters)
+            report["throughput"].append(
+                {"format": img_format, "num_workers": num_workers, "images_per_second": throughput}
+            )
+            logger.info(
+                "{} with {} workers: {:.1f} images/s".format(img_format, num_workers, throughput)
+            )
+
+    table = [
+        [img_format] + ["{:.2f}".format(v) for v in stages.values()] + [sum(stages.values())]
+        for img_format, stages in report["stages_ms"].items()
+    ]
+    logger.info(
+        "Time per image (ms):\n"
+        + tabulate(table, headers=["format"] + _PIPELINE_STAGES + ["total"], tablefmt="pipe")
+    )
+    table = [[x["format"], x["num_workers"], x["images_per_second"]] for x in report["throughput"]]
+    logger.info(
+        "Data loader throughput:\n"
+        + tabulate(table, headers=["format", "workers", "images/s"], tablefmt="pipe")
+    )
+    if args.report:
+        with PathManager.open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Wrote the report to {}".format(args.report))
+
+
 def benchmark_train(args):
     cfg = setup(args)
     model = build_model(cfg)
@@ -102,7 +247,7 @@ def benchmark_train(args):
     dummy_data = list(itertools.islice(data_loader, 100))
 
     def f():
-        data = DatasetFromList(dummy_data, copy=False)
+        data = DatasetFromList(dummy_data, copy=False, serialize=False)
         while True:
             yield from data
 
@@ -129,7 +274,7 @@ def benchmark_eval(args):
 
     def f():
         while True:
-            yield from DatasetFromList(dummy_data, copy=False)
+            yield from DatasetFromList(dummy_data, copy=False, serialize=False)
 
     for _ in range(5):  # warmup
         model(dummy_data[0])
@@ -147,12 +292,24 @@ def benchmark_eval(args):
 
 if __name__ == "__main__":
     parser = default_argument_parser()
-    parser.add_argument("--task", choices=["train", "eval", "data"], required=True)
+    parser.add_argument(
+        "--task", choices=["train", "eval", "data", "data_pipeline"], required=True
+    )
+    # Options of --task data_pipeline
+    parser.add_argument("--formats", nargs="+", default=["BGR", "BGRT", "BGRTTT"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 2, 4, 8])
+    parser.add_argument("--num-samples", type=int, default=200, help="images to break down")
+    parser.add_argument("--num-iters", type=int, default=100, help="batches to load")
+    parser.add_argument("--report", default="", help="path of the json report")
     args = parser.parse_args()
     assert not args.eval_only
 
     if args.task == "data":
         f = benchmark_data
+    elif args.task == "data_pipeline":
+        f = benchmark_data_pipeline
+        # the throughput is measured for a single process
+        assert args.num_gpus == 1 and args.num_machines == 1
     elif args.task == "train":
         """
         Note: training speed may not be representative.
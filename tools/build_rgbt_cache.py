@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Decode the RGB-thermal pairs of a FLIR or KAIST split once, and store them in a cache
+that "BGRT" and "BGRTTT" training reads from with `INPUT.RGBT_PAIR_CACHE`.
+"""
+import argparse
+
+from detectron2.data import add_rgbt_file_names, build_rgbt_pair_cache
+from detectron2.data.datasets import load_coco_json
+from detectron2.utils.logger import setup_logger
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a cache of RGB-thermal pairs")
+    parser.add_argument("--json-file", required=True, help="COCO annotations of the split")
+    parser.add_argument("--image-root", required=True, help="the image root of the annotations")
+    parser.add_argument("--pairing", default="FLIR", help="name of the RGB-thermal pairing")
+    parser.add_argument("--output", required=True, help="directory of the cache")
+    parser.add_argument("--num-workers", type=int, default=4)
+    args = parser.parse_args()
+    setup_logger()
+
+    # Same file names as the dataset dicts of register_rgbt_coco_instances
+    dataset_dicts = add_rgbt_file_names(
+        load_coco_json(args.json_file, args.image_root), args.pairing
+    )
+    build_rgbt_pair_cache(
+        [d["file_name"] for d in dataset_dicts],
+        args.output,
+        num_workers=args.num_workers,
+        rgb_file_names=[d["rgb_file_name"] for d in dataset_dicts],
+    )
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Pack the RGB-thermal pairs and the annotations of a FLIR or KAIST training split into
+sequential shards, that training reads with `DATALOADER.RGBT_SHARDS`.
+"""
+import argparse
+
+from detectron2.data import add_rgbt_file_names, write_rgbt_shards
+from detectron2.data.build import filter_images_with_only_crowd_annotations
+from detectron2.data.datasets import load_coco_json
+from detectron2.utils.logger import setup_logger
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build sequential shards of RGB-thermal pairs")
+    parser.add_argument("--json-file", required=True, help="COCO annotations of the split")
+    parser.add_argument("--image-root", required=True, help="the image root of the annotations")
+    parser.add_argument("--pairing", default="FLIR", help="name of the RGB-thermal pairing")
+    parser.add_argument("--output", required=True, help="directory of the shards")
+    parser.add_argument("--samples-per-shard", type=int, default=256)
+    parser.add_argument(
+        "--keep-empty",
+        action="store_true",
+        help="keep the images without annotations, as DATALOADER.FILTER_EMPTY_ANNOTATIONS=False",
+    )
+    args = parser.parse_args()
+    setup_logger()
+
+    # Same dataset dicts as register_rgbt_coco_instances. Giving a dataset name maps
+    # the category ids to contiguous ids.
+    dataset_dicts = add_rgbt_file_names(
+        load_coco_json(args.json_file, args.image_root, dataset_name=args.json_file),
+        args.pairing,
+    )
+    if not args.keep_empty:
+        dataset_dicts = filter_images_with_only_crowd_annotations(dataset_dicts)
+    write_rgbt_shards(dataset_dicts, args.output, samples_per_shard=args.samples_per_shard)
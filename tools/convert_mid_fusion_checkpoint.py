@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Convert a legacy mid-fusion checkpoint (shared backbone, "ConcatFusion") to initialize
+the model of a config with another `MODEL.MID_FUSION.NAME` and/or a two-stream
+backbone, which are then fine-tuned with `MODEL.WEIGHTS` set to the output.
+"""
+import argparse
+import torch
+from fvcore.common.file_io import PathManager
+
+from detectron2.checkpoint.mid_fusion_conversion import convert_concat_fusion_weights
+from detectron2.config import get_cfg
+from detectron2.modeling import build_model
+from detectron2.utils.logger import setup_logger
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a mid-fusion checkpoint")
+    parser.add_argument("--config-file", required=True, help="config of the new model")
+    parser.add_argument("--input", required=True, help="the legacy mid-fusion checkpoint")
+    parser.add_argument("--output", required=True, help="the converted checkpoint (.pth)")
+    parser.add_argument(
+        "opts",
+        help="Modify config options using the command-line",
+        default=None,
+        nargs=argparse.REMAINDER,
+    )
+    args = parser.parse_args()
+    setup_logger()
+
+    cfg = get_cfg()
+    cfg.merge_from_file(args.config_file)
+    cfg.merge_from_list(args.opts)
+    cfg.MODEL.DEVICE = "cpu"
+    model = build_model(cfg)
+
+    with PathManager.open(args.input, "rb") as f:
+        checkpoint = torch.load(f, map_location="cpu")
+    weights = checkpoint.get("model", checkpoint)
+    converted = convert_concat_fusion_weights(weights, model.state_dict())
+    with PathManager.open(args.output, "wb") as f:
+        torch.save({"model": converted}, f)